@@ -7,21 +7,24 @@ import argparse
 import chardet
 from difflib import SequenceMatcher
 import docx2txt
+import functools
+import glob
+import itertools
 import json
 import logging
 import logging.config
 import math
 import os
 import regex
-import requests
-import shelve
 import shutil
 import statistics
 import subprocess
 import sys
 import textract
+import threading
 import xml.etree.ElementTree as ET
 from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from docx import Document
 from io import StringIO, BytesIO
@@ -29,12 +32,24 @@ from pprint import pprint
 from PyPDF2 import PdfFileReader, utils
 from PIL import Image
 import imagehash
-from tempfile import TemporaryDirectory, mkdtemp
 
+from utils.approximate import ApproximateMatcher, max_errors_for
+from utils.artifacts import ArtifactManager
+from utils.cache import ArtifactStore, ResultCache, file_sha256, files_stamp
+from utils.cermine import CERMINE_POOL_SIZE, configure_cermine_pool, get_cermine_pool
 from utils.common import get_logger
+from utils.doi import get_doi_resolver
 from utils.constants import SMUR, AM, P, VOR
+from utils.pdfimages import extract_page_images, page_has_image
+from utils.pdftext import extract_page_range, iter_pages, split_pages
+from utils.pipeline import Pipeline
 from utils.patterns import DOI_PATTERN, ALL_CC_LICENCES, RIGHTS_RESERVED_PATTERNS, VERSION_PATTERNS
-from utils.logos import PublisherLogo
+from utils.logos import LOGOS_DB_BASENAME, get_logo_index
+from utils.scanner import get_default_scanner
+from utils.text import NormalisedText, normalise
+from utils.TrueViz import GEOMETRY_VERSION, Geometry
+from utils.TrueViz import Document as TrueVizDocument
+from utils.workspace import JobWorkspace
 
 
 # # logging.config.fileConfig('logging.conf', defaults={'logfilename': 'artemis.log'})
@@ -42,12 +57,22 @@ from utils.logos import PublisherLogo
 logger = get_logger()
 
 
-# LOGOS_DB_PATH = os.path.join(os.path.realpath(__file__), "utils", "logos_db.shelve_BKUP") # for some reason, this doesn't
-# work with line: with shelve.open("utils/logos_db.shelve_BKUP") as db:
-LOGOS_DB_PATH = "utils/logos_db.shelve_BKUP"
+LOGOS_DB_PATH = LOGOS_DB_BASENAME
 
 NUMBER_OF_CHARACTERS_IN_ONE_PAGE = 2600
 
+# pages of extracted text searched for the title (a cover sheet may precede the first page of the article)
+TITLE_PAGES = (1, 2)
+# pages of extracted text searched for DOIs, licences, version and rights statements (statements on other pages, e.g.
+# in the middle of a long file, are not looked for)
+STATEMENT_PAGES = [(1, 2), (-2, -1)]
+# number of pages at the start and at the end of PDF files extracted for the tests above, so that the full text of
+# long files (e.g. theses) is only extracted if a test needs it
+FRONT_MATTER_PAGES = 3
+
+# DOI lookups are network-bound, so they run on these threads while slower local stages (e.g. CERMINE) proceed
+DOI_CHECK_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="artemis-doi")
+
 PUBLISHER_PDF_METADATA_TAGS = [
     '/CrossMarkDomains#5B1#5D',
     '/CrossMarkDomains#5B2#5D',
@@ -58,10 +83,123 @@ PUBLISHER_PDF_METADATA_TAGS = [
     '/Keywords',
 ]
 
-DOI_BASE_URL = "https://doi.org/"
+# artifacts generated by CERMINE (name of artifact: CERMINE output producing it and extension of file/folder
+# generated by CERMINE)
+CERMINE_ARTIFACTS = {
+    'cermxml': {'output': 'jats', 'extension': '.cermxml', 'kind': 'file'},
+    'cermtxt': {'output': 'text', 'extension': '.cermtxt', 'kind': 'file'},
+    'cermzones': {'output': 'zones', 'extension': '.cermzones', 'kind': 'file'},
+    'cermstr': {'output': 'trueviz', 'extension': '.cermstr', 'kind': 'file'},
+    'images': {'output': 'images', 'extension': '.images', 'kind': 'folder'},
+}
+# artifact holding the geometry of the pages of the TrueViz output of CERMINE that layout tests sample (see
+# utils.TrueViz.Geometry), so that analysing the same document again needs neither CERMINE nor any XML parsing
+GEOMETRY_ARTIFACT = "geometry_v{}".format(GEOMETRY_VERSION)
+
+PDF_DEFAULT_TESTS = [
+    'test_title_match_in_file_metadata',
+    'extract_publisher_tags_from_file_metadata',
+    'test_length_of_extracted_text',
+    'test_title_match_in_extracted_text',
+    'test_valid_doi_in_extracted_text',
+    'find_cc_statement_in_extracted_text',
+    'find_version_statements_in_extracted_text',
+    'find_rights_reserved_statement_in_extracted_text',
+    'test_valid_doi_in_cermine_xml',
+    'test_title_match_cermxml',
+    'test_file_has_image_on_first_page',
+    'detect_publisher_logos',
+]
+
+# tests that are only run on request, because the CERMINE outputs they depend on are expensive to produce. Their
+# results are informational only: they are reported in test_results, but never used by PdfParser.decide
+PDF_LAYOUT_TESTS = [
+    'detect_layout_features',
+]
+
+
+def versions_not_suggested_by_logos(detected_logos):
+    suggested_versions = []
+    for dl in detected_logos or []:
+        for version in dl.metadata["indicate_ms_versions"]:
+            if version not in suggested_versions:
+                suggested_versions.append(version)
+    logger.debug("Versions suggested by logos: {}".format(suggested_versions))
+    return [v for v in [SMUR, AM, P, VOR] if v not in suggested_versions] if detected_logos else []
+
+
+def versions_ruled_out_by_statements(statements):
+    return [v for s in statements or [] for v in s['not_found_on']]
+
+
+# how PdfParser.parse runs each test:
+#   cost: rough relative running time; tests are run from cheapest to most expensive
+#   result: ArtemisResult attribute holding the outcome of the test
+#   decisive: whether the approve/reject decision and its reason may depend on the outcome (see PdfParser.decide);
+#       unless the full evidence set is requested, tests are skipped once their outcome can no longer change the
+#       decision, and tests that are not decisive are not run (unless reported)
+#   reported: whether the test is run whenever it is requested, so that its outcome is reported, even though it does
+#       not affect the decision; only tests that depend on CERMINE are not, so their outcomes are only reported with
+#       the full evidence set
+#   excludes: function returning the versions (ArtemisResult.possible_versions) ruled out by an outcome
+#   needs: artifacts the test depends on; those of tests that run whatever the outcomes of others are produced
+#       concurrently (see BaseParser.prefetch), and with the full evidence set tests themselves run concurrently once
+#       their artifacts are available
+#   run/args: method (name of test if not given) and arguments used to run the test; methods returning a Future
+#       run in the background and are collected after all other tests, and if they return None instead there is
+#       nothing to test (e.g. no DOI was found), so no outcome is reported
+PDF_TESTS = {
+    'test_title_match_in_file_metadata': {'cost': 1, 'result': 'title_match_file_metadata', 'decisive': True,
+                                          'needs': ['file_metadata'], 'args': ['/Title']},
+    'extract_publisher_tags_from_file_metadata': {'cost': 1, 'result': 'extracted_publisher_tags_in_file_metadata',
+                                                  'decisive': True, 'needs': ['file_metadata'],
+                                                  'excludes': lambda outcome: [SMUR, AM] if outcome else []},
+    'test_length_of_extracted_text': {'cost': 5, 'result': 'long_enough', 'decisive': True,
+                                      'needs': ['front_matter_text']},
+    'test_title_match_in_extracted_text': {'cost': 10, 'result': 'title_match_extracted_text', 'decisive': True,
+                                           'needs': ['front_matter_text']},
+    'find_cc_statement_in_extracted_text': {'cost': 20, 'result': 'cc_match_extracted_text', 'decisive': True,
+                                            'needs': ['pattern_hits']},
+    'find_version_statements_in_extracted_text': {'cost': 20, 'result': 'version_statements_extracted_text',
+                                                  'decisive': False, 'reported': True, 'needs': ['pattern_hits'],
+                                                  'excludes': versions_ruled_out_by_statements},
+    'find_rights_reserved_statement_in_extracted_text': {'cost': 20, 'result': 'rights_reserved_extracted_text',
+                                                         'decisive': False, 'reported': True,
+                                                         'needs': ['pattern_hits']},
+    'test_valid_doi_in_extracted_text': {'cost': 30, 'result': 'valid_doi_in_extracted_text', 'decisive': False,
+                                         'reported': True, 'needs': ['pattern_hits'],
+                                         'run': 'start_doi_check_in_extracted_text'},
+    'test_valid_doi_in_cermine_xml': {'cost': 1000, 'result': 'valid_doi_in_cermine_xml', 'decisive': False,
+                                      'needs': ['cermxml'], 'run': 'start_doi_check_in_cermine_xml'},
+    'test_title_match_cermxml': {'cost': 1000, 'result': 'title_match_cermine_xml', 'decisive': False,
+                                 'needs': ['cermxml']},
+    'test_file_has_image_on_first_page': {'cost': 2, 'result': 'image_on_first_page', 'decisive': False,
+                                          'reported': True},
+    'detect_publisher_logos': {'cost': 50, 'result': 'detected_logos', 'decisive': False, 'reported': True,
+                               'needs': ['page_images'], 'excludes': versions_not_suggested_by_logos},
+    'detect_layout_features': {'cost': 1500, 'result': 'layout_features', 'decisive': False, 'reported': True,
+                               'needs': [GEOMETRY_ARTIFACT]},
+}
 
 NUMBER_PATTERN = regex.compile("\d+")
 
+# modules defining the rules used to reach a verdict (code, patterns and thresholds); cached results are discarded
+# whenever any of them, or the logos database, change
+RULES_FILES = [os.path.realpath(__file__)] + \
+              glob.glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), "utils", "*.py"))
+_code_stamp = None
+
+
+def rules_stamp():
+    """
+    :return: Version stamp of the rules: the modules in RULES_FILES (hashed once per process) and the logos database
+        as it is now (it may be built, or rebuilt, while this process runs; see utils.logos.get_logo_index)
+    """
+    global _code_stamp
+    if _code_stamp is None:
+        _code_stamp = files_stamp(RULES_FILES)
+    return files_stamp([LOGOS_DB_PATH + ".npy", LOGOS_DB_PATH + ".json"]) + _code_stamp
+
 
 class ArtemisResult:
     """
@@ -85,13 +223,19 @@ class ArtemisResult:
     extracted_publisher_tags_in_file_metadata = None
     valid_doi_in_extracted_text = None
     cc_match_extracted_text = None
+    version_statements_extracted_text = None
+    rights_reserved_extracted_text = None
     valid_doi_in_cermine_xml = None
     title_match_cermine_xml = None
     image_on_first_page = None
     detected_logos = None
+    layout_features = None
 
     def __init__(self, input_filename):
         self.input_filename = input_filename
+        # per-instance copies, so that results of different files never share state
+        self.possible_versions = list(ArtemisResult.possible_versions)
+        self.test_results = {}
 
     def append_test_result(self, test_func, result):
         self.test_results.update({test_func.__name__: result})
@@ -133,13 +277,16 @@ class BaseParser:
     """
     Parser with common methods shared by all inheriting classes
     """
-    def __init__(self, file_path, dec_ms_title=None, dec_version=None, dec_authors=None, **kwargs):
+    def __init__(self, file_path, dec_ms_title=None, dec_version=None, dec_authors=None, artifact_store=None,
+                 document_key=None, **kwargs):
         '''
 
         :param file_path: Path to file this class will evaluate
         :param dec_ms_title: Declared title of manuscript
         :param dec_version: Declared manuscript version of file
         :param dec_authors: Declared authors of manuscript (list)
+        :param artifact_store: ArtifactStore in which extracted artifacts are persisted across runs (optional)
+        :param document_key: Hash of the contents of file (calculated if needed and not given)
         :param kwargs: Dictionary of citation details and any other known metadata fields; values may include:
             acceptance_date=None, doi=None, publication_date=None, title=None
         '''
@@ -158,6 +305,15 @@ class BaseParser:
         self.number_of_pages = None
         self.file_metadata = None
 
+        # derived artifacts are produced once, on demand, and shared by all tests
+        if artifact_store and not document_key:
+            document_key = file_sha256(self.file_path)
+        self.artifacts = ArtifactManager(store=artifact_store, document_key=document_key)
+        self.artifacts.register(['file_metadata'], lambda name: {name: self.extract_file_metadata()})
+        self.artifacts.register(['text'], lambda name: {name: self.extract_text()}, kind='text')
+        self.artifacts.register(['normalised_text'], lambda name: {name: self.normalise_text()})
+        self.artifacts.register(['pattern_hits', 'scanned_text'], lambda name: self.scan_extracted_text())
+
     def extract_text(self, method=None):
         '''
         Extracts text from file using textract (https://textract.readthedocs.io/en/stable/python_package.html)
@@ -173,68 +329,185 @@ class BaseParser:
             logger.error("Textract failed with UnicodeDecodeError")
             return None
 
-        if isinstance(self.extracted_text, str):
+        if isinstance(self.extracted_text, bytes):
             result = chardet.detect(self.extracted_text)
-            self.extracted_text = self.extracted_text.decode(result['encoding'])
+            self.extracted_text = self.extracted_text.decode(result['encoding'] or 'utf-8')
         else:
             logger.error("extracted_text is a {} instance; only strings are currently "
                          "supported".format(type(self.extracted_text)))
         return self.extracted_text
 
-    def find_match_in_extracted_text(self, query=None, escape_char=True, expected_span=(0, 2600),
-                                     allowed_error_ratio=.1):
+    def normalise_text(self):
+        """
+        :return: utils.text.NormalisedText of extracted text (line breaks removed, otherwise matches will often fail);
+            None if text could not be extracted
+        """
+        extracted_text = self.artifacts.get('text')
+        if not isinstance(extracted_text, str):
+            logger.error("Extracted text is not a string, so it cannot be searched.")
+            return None
+        return NormalisedText(extracted_text, estimated_page_length=NUMBER_OF_CHARACTERS_IN_ONE_PAGE)
+
+    def artifact_dependencies(self, name):
+        """
+        :param name: Name of artifact
+        :return: Names of the artifacts artifact name is derived from
+        """
+        return {
+            'normalised_text': ['text'],
+            'pattern_hits': ['normalised_text'],
+            'scanned_text': ['normalised_text'],
+        }.get(name, [])
+
+    def add_artifact_stage(self, pipeline, name):
+        """
+        Adds a stage producing artifact name to pipeline, after stages producing the artifacts it is derived from
+        """
+        if pipeline.has_stage(name):
+            return
+        dependencies = self.artifact_dependencies(name)
+        for d in dependencies:
+            self.add_artifact_stage(pipeline, d)
+        pipeline.add_stage(name, lambda: self.artifacts.get(name), dependencies)
+
+    def prefetch(self, names):
+        """
+        :param names: Names of artifacts tests will need
+        :return: utils.pipeline.Pipeline (to be used as a context manager) producing artifacts names concurrently,
+            so that they are ready (or being produced) when tests ask for them
+        """
+        pipeline = Pipeline()
+        for name in names:
+            self.add_artifact_stage(pipeline, name)
+        return pipeline
+
+    def searchable_text(self, page_ranges=None):
+        """
+        :param page_ranges: List of (first, last) ranges of pages that will be searched (see
+            utils.text.NormalisedText.page_span); None if all pages will be searched
+        :return: utils.text.NormalisedText including at least the pages in page_ranges; None if text could not be
+            extracted
+        """
+        return self.artifacts.get('normalised_text')
+
+    def scan_extracted_text(self):
+        """
+        Finds all patterns in utils.patterns (DOI, CC licences, version and rights statements) in a single pass over
+        the pages of extracted text in STATEMENT_PAGES
+        :return: Dictionary of artifacts: 'pattern_hits' (list of utils.scanner.PatternHit instances) and
+            'scanned_text' (the utils.text.NormalisedText their positions refer to); both None if text could not
+            be extracted
+        """
+        normalised_text = self.searchable_text(STATEMENT_PAGES)
+        if normalised_text is None:
+            return {'pattern_hits': None, 'scanned_text': None}
+        spans = normalised_text.spans_of_pages(STATEMENT_PAGES) if normalised_text.has_page_breaks else None
+        return {'pattern_hits': get_default_scanner().scan(normalised_text.text, spans),
+                'scanned_text': normalised_text}
+
+    def find_pattern_hits(self, category):
+        """
+        :param category: Category of patterns (e.g. 'cc_licence'; see utils.scanner.default_scan_patterns)
+        :return: Hits of patterns in category in extracted text, in order of position
+        """
+        return [h for h in self.artifacts.get('pattern_hits') or [] if h.scan_pattern.category == category]
+
+    def describe_hit(self, hit, expected_pages=(1, 1)):
+        """
+        :param hit: utils.scanner.PatternHit instance
+        :param expected_pages: See find_match_in_extracted_text
+        :return: Dictionary in the format returned by find_match_in_extracted_text
+        """
+        expected_span = self.artifacts.get('scanned_text').page_span(*expected_pages)
+        match_in_expected_position = (hit.start >= expected_span[0]) and (hit.end <= expected_span[1])
+        return {'match': hit.match, 'match in expected position': match_in_expected_position}
+
+    def find_match_in_extracted_text(self, query=None, escape_char=True, expected_pages=(1, 1),
+                                     allowed_error_ratio=.1, pages=None):
         """
         Fuzzy search extracted text.
         :param query: Search string; manuscript title by default
-        :param escape_char: Escape query characters that have a special regex meaning
-        :param expected_span: Tuple indicating start and end characters of sector we expect to find string. For example,
+        :param escape_char: Search for query as a literal string (with utils.approximate.ApproximateMatcher, whose
+            running time does not depend on the length of query), normalised like the text (see
+            utils.text.normalise); if False, query is a regex pattern
+        :param expected_pages: Tuple indicating first and last pages where we expect to find string. For example,
             if we are searching for an article title, we would expect it to appear in the first page of the document.
-            An uninterrupted page of text contains about 1300 words, so the first page should span less than
-            2600 characters. This is the arbitrarily set default, but we could obtain a median empirically
+            Pages are delimited by the page breaks in extracted text; if there are none (e.g. text extracted from
+            a .docx file), each NUMBER_OF_CHARACTERS_IN_ONE_PAGE characters are assumed to be a page (an
+            uninterrupted page of text contains about 1300 words)
         :param allowed_error_ratio: By default, a number of errors equal to 20% the length of the search string is
             allowed
+        :param pages: Tuple indicating first and last pages to search (negative numbers count from the end); all
+            pages if None
         :return:
         """
         if not query:
             query = self.dec_ms_title
-        if escape_char:
-            query = regex.escape(query)
-        if not allowed_error_ratio:
-            pattern = query
-        else:
-            pattern = "{}{{e<{}}}".format(query, int(allowed_error_ratio*len(query)))
-        if not self.extracted_text:
-            self.extract_text()
-        # remove all line breaks from extracted text; otherwise match will often fail
-        continuous_text = self.extracted_text.replace('\n', ' ').replace('  ', ' ')
+        normalised_text = self.searchable_text([pages] if pages else None)
+        if normalised_text is None:
+            logger.error("Attempt to find match in extracted_text failed because it is not a string.")
+            return None
+        search_span = normalised_text.page_span(*pages) if pages else (0, len(normalised_text))
         try:
-            logger.debug("pattern: {}".format(pattern))
-            m = regex.search(pattern, continuous_text, flags=regex.IGNORECASE)
-            if m:
-                logger.debug("Match object: {}".format(m))
-                match_in_expected_position = False
-                if (m.start() >= expected_span[0]) and (m.end() <= expected_span[1]):
-                    match_in_expected_position = True
-                return {'match': m.group(), 'match in expected position': match_in_expected_position}
+            if escape_char:
+                query = normalise(query)
+                matcher = ApproximateMatcher(query, max_errors_for(len(query), allowed_error_ratio or 0))
+                logger.debug("query: {}; max errors: {}".format(query, matcher.max_errors))
+                m = matcher.find(normalised_text.folded, *search_span)
+                span = m[:2] if m else None
+            else:
+                if allowed_error_ratio:
+                    query = "{}{{e<{}}}".format(query, int(allowed_error_ratio*len(query)))
+                logger.debug("pattern: {}".format(query))
+                m = regex.compile(query, flags=regex.IGNORECASE).search(normalised_text.text, *search_span)
+                span = m.span() if m else None
         except TypeError:
-            logger.error("Attempt to find match in extracted_text failed because it is not a string.")
+            logger.error("Attempt to find match in extracted_text failed because query is not a string.")
+            return None
+        if span:
+            logger.debug("Match: {}".format(normalised_text.text[span[0]:span[1]]))
+            match_in_expected_position = False
+            expected_span = normalised_text.page_span(*expected_pages)
+            if (span[0] >= expected_span[0]) and (span[1] <= expected_span[1]):
+                match_in_expected_position = True
+            return {'match': normalised_text.text[span[0]:span[1]],
+                    'match in expected position': match_in_expected_position}
         return None
 
     def find_doi_in_extracted_text(self):
-        self.doi_in_extracted_text = self.find_match_in_extracted_text(query=DOI_PATTERN, escape_char=False, allowed_error_ratio=0)
+        hits = self.find_pattern_hits('doi')
+        self.doi_in_extracted_text = self.describe_hit(hits[0]) if hits else None
         return self.doi_in_extracted_text
 
     def find_cc_statement_in_extracted_text(self):
-        for l in ALL_CC_LICENCES:
-            for key, error_ratio in [('url', 0), ('long name', 0.1), ('short name', 0)]:
-                m = self.find_match_in_extracted_text(query=l[key], escape_char=False,
-                                                      allowed_error_ratio=error_ratio)
-                if m:
-                    logger.debug("Found Creative Commons statement in extracted text: {}".format(m['match']))
-                    return m
+        hits = self.find_pattern_hits('cc_licence')
+        if hits:
+            # licences and keys are tried in the order of ALL_CC_LICENCES and CC_LICENCE_KEYS
+            m = self.describe_hit(min(hits, key=lambda h: h.scan_pattern.priority))
+            logger.debug("Found Creative Commons statement in extracted text: {}".format(m['match']))
+            return m
         logger.debug("Could not find a Creative Commons statement in extracted text")
         return None
 
+    def find_version_statements_in_extracted_text(self):
+        """
+        Finds statements in VERSION_PATTERNS (e.g. 'UNCORRECTED PROOF') in extracted text
+        :return: List of dictionaries (match, versions match is indicative of and versions it is not found on)
+        """
+        statements = []
+        for h in self.find_pattern_hits('version'):
+            statements.append({'match': h.match, 'indicative_of': h.scan_pattern.info['indicative_of'],
+                               'not_found_on': h.scan_pattern.info['not_found_on']})
+            logger.debug("Found version statement in extracted text: {}".format(h.match))
+        return statements
+
+    def find_rights_reserved_statement_in_extracted_text(self):
+        hits = self.find_pattern_hits('rights_reserved')
+        if hits:
+            logger.debug("Found rights reserved statement in extracted text: {}".format(hits[0].match))
+            return self.describe_hit(hits[0])
+        return None
+
     def convert_to_pdf(self):
         '''
         Converts file to PDF using pandoc (https://pandoc.org/)
@@ -253,9 +526,12 @@ class BaseParser:
         :param min_similarity: Minimum similarity for which a match will be accepted
         :return: True for match found; False for no match; None if test could not be performed
         """
+        file_metadata = self.artifacts.get('file_metadata')
         if self.dec_ms_title:
-            if title_key in self.file_metadata.keys():
-                if SequenceMatcher(None, self.file_metadata[title_key], self.dec_ms_title).ratio() >= min_similarity:
+            if file_metadata is None:
+                logger.error("File metadata unavailable, so cannot test match")
+            elif title_key in file_metadata.keys():
+                if SequenceMatcher(None, file_metadata[title_key], self.dec_ms_title).ratio() >= min_similarity:
                     logger.debug("Found declared title in file metadata with a similarity of {}".format(min_similarity))
                     return True
                 else:
@@ -274,7 +550,7 @@ class BaseParser:
         :return: True for match found; False for no match; None if test could not be performed
         """
         if self.dec_ms_title:
-            if self.find_match_in_extracted_text():
+            if self.find_match_in_extracted_text(pages=TITLE_PAGES):
                 logger.debug("Found declared title (or similar) in extracted text")
                 return True
             else:
@@ -290,8 +566,9 @@ class BaseParser:
         :param min_length: minimum number of characters for test to succeed
         :return:
         """
-        if self.extracted_text:
-            if len(self.extracted_text) >= min_length:
+        length = self.measure_extracted_text(min_length)
+        if length:
+            if length >= min_length:
                 logger.debug("Extracted text is longer than {} characters".format(min_length))
                 return True
             else:
@@ -300,11 +577,21 @@ class BaseParser:
         logger.error("Extracted text unavailable (self.extracted_text), so could not perform test")
         return None
 
+    def measure_extracted_text(self, min_length=None):
+        """
+        :param min_length: Length of interest; parsers may stop counting once it is reached
+        :return: Number of characters of extracted text (or at least min_length); None if text could not be extracted
+        """
+        extracted_text = self.artifacts.get('text')
+        if extracted_text:
+            return len(extracted_text)
+        return None
+
     def test_doi_resolves(self, doi=None):
         """
         Test if DOI resolves; if no DOI given, attempt to use declared DOI in self.metadata
         :param doi: DOI to check
-        :return:
+        :return: True if DOI resolves; False if it does not; None if test could not be performed
         """
         if not doi:
             try:
@@ -312,13 +599,8 @@ class BaseParser:
             except KeyError:
                 logger.debug("DOI not known; KeyError for self.metadata['doi']")
                 return None
-        r = requests.get(DOI_BASE_URL + doi, headers={'User-Agent': 'Mozilla/5.0'})
-        # r = requests.get("https://www.sciencedirect.com/science/article/pii/S1568786419302216?via%3Dihub", headers={'User-Agent': 'Mozilla/5.0'})
-        logger.debug("r.status_code = {}; r.text = {}".format(r.status_code, r.text))
-        if r.ok:
-            return True
-        else:
-            return False
+        return get_doi_resolver().resolves(doi)
+
 
 class DocxParser(BaseParser):
     """
@@ -348,6 +630,7 @@ class DocxParser(BaseParser):
             'keywords': docx.core_properties.keywords,
             'content_status': docx.core_properties.content_status,
         }
+        return self.file_metadata
 
     def extract_text(self, method=None):
         """
@@ -373,22 +656,22 @@ class DocxParser(BaseParser):
         r.vor_oa_prob = 0
         r.vor_pw_prob = 0
 
-        self.extract_file_metadata()
-        r.title_match_file_metadata = r.append_test_result(
-            self.test_title_match_in_file_metadata,
-            self.test_title_match_in_file_metadata('title'),
-        )
+        # file metadata and text are read concurrently
+        with self.prefetch(['file_metadata', 'normalised_text']):
+            r.title_match_file_metadata = r.append_test_result(
+                self.test_title_match_in_file_metadata,
+                self.test_title_match_in_file_metadata('title'),
+            )
 
-        self.extract_text()
-        r.long_enough = r.append_test_result(
-            self.test_length_of_extracted_text,
-            self.test_length_of_extracted_text(),
-        )
+            r.long_enough = r.append_test_result(
+                self.test_length_of_extracted_text,
+                self.test_length_of_extracted_text(),
+            )
 
-        r.title_match_extracted_text = r.append_test_result(
-            self.test_title_match_in_extracted_text,
-            self.test_title_match_in_extracted_text(),
-        )
+            r.title_match_extracted_text = r.append_test_result(
+                self.test_title_match_in_extracted_text,
+                self.test_title_match_in_extracted_text(),
+            )
 
         if r.long_enough and (r.title_match_file_metadata or r.title_match_extracted_text):
             r.sanity_check = True
@@ -413,13 +696,52 @@ class PdfParser(BaseParser):
     """
     Parser for .pdf files
     """
-    def __init__(self, file_path, dec_ms_title=None, dec_version=None, dec_authors=None, **kwargs):
+    # CERMINE artifacts each test depends on
+    cermine_dependencies = {
+        'test_valid_doi_in_cermine_xml': ['cermxml'],
+        'test_title_match_cermxml': ['cermxml'],
+        'detect_layout_features': ['cermstr'],
+    }
+
+    def __init__(self, file_path, dec_ms_title=None, dec_version=None, dec_authors=None, tests=None,
+                 artifact_store=None, document_key=None, front_matter_pages=FRONT_MATTER_PAGES, full_evidence=False,
+                 **kwargs):
+        """
+        :param tests: Names of the tests to run (PDF_DEFAULT_TESTS if None); these also determine which outputs
+            are requested from CERMINE
+        :param full_evidence: If True, all tests are run even after their outcomes can no longer change the
+            decision (e.g. for audits)
+        :param front_matter_pages: Number of pages at the start and at the end of file that are extracted on their
+            own for tests that only search those pages (0 to always extract the full text)
+        """
+        self.tests = list(tests) if tests else list(PDF_DEFAULT_TESTS)
+        self.front_matter_pages = front_matter_pages
+        self.full_evidence = full_evidence
+        self.page_texts = {}  # number of page: text extracted from page
+        self.page_texts_lock = threading.Lock()
+        self.cermine_outputs = self.plan_cermine_outputs(self.tests)
+        self.cermine_attempted_outputs = set()
+        self.doi_checks = {}
+        self.doi_checks_lock = threading.Lock()
+        self.inconclusive_tests = []  # see self.outcome_is_inconclusive
         self.cerm_ran_and_parsed = False
+        self.cermxml_lock = threading.Lock()
         self.cerm_doi = None
         self.cerm_title = None
         self.cerm_journal_title = None
         super(PdfParser, self).__init__(file_path, dec_ms_title=dec_ms_title,
-                                        dec_version=dec_version, dec_authors=dec_authors, **kwargs)
+                                        dec_version=dec_version, dec_authors=dec_authors,
+                                        artifact_store=artifact_store, document_key=document_key, **kwargs)
+        self.artifacts.register(CERMINE_ARTIFACTS.keys(), self.produce_cermine_artifacts,
+                                kind={k: a['kind'] for k, a in CERMINE_ARTIFACTS.items()},
+                                location=self.cermine_artifact_path)
+        # front_matter_text is not persisted itself, but the texts of the pages it is made of are (see
+        # self.extract_pages)
+        self.artifacts.register(['front_matter_text'], lambda name: {name: self.normalise_front_matter()})
+        self.artifacts.register(['page_images'], lambda name: {name: self.extract_front_matter_images()},
+                                kind='folder', location=self.page_images_path)
+        self.artifacts.register([GEOMETRY_ARTIFACT], lambda name: {name: self.extract_geometry()}, kind='file',
+                                location=self.geometry_path)
 
     def extract_file_metadata(self):
         '''
@@ -434,120 +756,395 @@ class PdfParser(BaseParser):
             logger.debug("output of pdf.getDocumentInfo(): {}".format(info))
             self.number_of_pages = pdf.getNumPages()
             self.file_metadata = info
+        return self.file_metadata
 
     def extract_text(self):
+        """
+        Extracts the full text of file page by page (see self.iter_page_texts); pages are separated by form feeds.
+        Falls back to the text extracted by CERMINE
+        """
         try:
-            super(PdfParser, self).extract_text()
-        except TypeError:
-            logger.warning("Text extraction of PDF using textract default method failed; "
-                           "trying again with pdfminer method")
-            super(PdfParser, self).extract_text(method='pdfminer')
+            self.extracted_text = "\f".join(text for number, text in self.iter_page_texts())
+        except Exception as e:  # pdfminer raises a variety of exceptions on malformed files
+            logger.warning("Text extraction of PDF failed ({}); using cermine instead".format(e))
+            self.extracted_text = None
         if not isinstance(self.extracted_text, str):
-            logger.warning("Text extraction of PDF using textract failed; "
-                           "using cermine instead")
-            self.cermine_file()
-            cermtxt_path = self.file_path.replace(self.file_ext, ".cermtxt")
-            if os.path.exists(cermtxt_path):
+            cermtxt_path = self.artifacts.get('cermtxt')
+            if cermtxt_path:
                 with open(cermtxt_path) as f:
                     self.extracted_text = f.read()
             else:
-                logger.error("Cermine failed to extract text; using pdftotext instead")
-                subprocess.run(["pdftotext", self.file_path], check=True)
-                txt_path = self.file_path.replace(self.file_ext, ".txt")
-                with open(txt_path) as f:
-                    self.extracted_text = f.read()
+                logger.error("Cermine failed to extract text")
+        return self.extracted_text
+
+    def iter_page_texts(self):
+        """
+        Streams the text of file page by page (see utils.pdftext.iter_pages), so that tests can stop pulling pages as
+        soon as they have seen enough. Pages extracted before are not extracted again, and only the text of front
+        and back matter pages (see self.front_matter_page_numbers) is kept
+        :return: Generator of (number of page, text) tuples
+        """
+        kept = set(self.front_matter_page_numbers() or [])
+        page = 1
+        while page in self.page_texts:
+            yield page, self.page_texts[page]
+            page += 1
+        if (self.number_of_pages is not None) and (page > self.number_of_pages):
+            return
+        for number, text in iter_pages(self.file_path, page, number_of_pages=self.number_of_pages):
+            if number in kept:
+                with self.page_texts_lock:
+                    self.page_texts.setdefault(number, text)
+            yield number, text
+
+    def extract_pages(self, first, last):
+        """
+        Extracts text from a range of pages; pages extracted before are not extracted again. The texts of each range
+        extracted are an artifact of their own, so that they are restored from the artifact store by later runs
+        :param first: Number of first page (starting at 1)
+        :param last: Number of last page (inclusive)
+        :return: List of the texts of pages first to last; None if text could not be extracted
+        """
+        with self.page_texts_lock:
+            missing = [p for p in range(first, last + 1) if p not in self.page_texts]
+            if missing:
+                name = self.artifacts.register_once(
+                    "page_texts_{}-{}".format(missing[0], missing[-1]),
+                    functools.partial(self.produce_page_texts, missing[0], missing[-1]), kind='text')
+                texts = self.artifacts.get(name)
+                if texts is None:
+                    return None
+                self.page_texts.update(zip(range(missing[0], missing[-1] + 1),
+                                           split_pages(texts, missing[-1] - missing[0] + 1)))
+            return [self.page_texts[p] for p in range(first, last + 1)]
+
+    def produce_page_texts(self, first, last, name):
+        """
+        Producer of the artifacts of self.extract_pages
+        :return: Dictionary of artifact name: texts of pages first to last, separated by form feeds (None if they could
+            not be extracted)
+        """
+        texts = extract_page_range(self.file_path, first, last, number_of_pages=self.number_of_pages)
+        return {name: "\f".join(texts) if texts is not None else None}
+
+    def front_matter_page_numbers(self):
+        """
+        :return: Numbers of the first and last self.front_matter_pages pages of file; None if the number of pages of
+            file is unknown
+        """
+        if self.number_of_pages is None:
+            try:
+                self.artifacts.get('file_metadata')
+            except Exception as e:  # PyPDF2 raises a variety of exceptions on malformed files
+                logger.error("Could not read number of pages of {}: {}".format(self.file_name, e))
+        if not self.number_of_pages:
+            return None
+        n = self.number_of_pages
+        front = list(range(1, min(self.front_matter_pages, n) + 1))
+        back = list(range(max(n - self.front_matter_pages + 1, len(front) + 1), n + 1))
+        return front + back
 
-    def cermine_file(self):
+    def normalise_front_matter(self):
+        """
+        :return: utils.text.NormalisedText of the first and last self.front_matter_pages pages of file (other pages
+            are left empty, so that page numbers are those of the full text); None if they could not be extracted
+        """
+        page_numbers = self.front_matter_page_numbers()
+        if not page_numbers:
+            return None
+        pages = [''] * self.number_of_pages
+        front = [p for p in page_numbers if p <= self.front_matter_pages]
+        back = [p for p in page_numbers if p > self.front_matter_pages]
+        for numbers in [front, back]:
+            if numbers:
+                texts = self.extract_pages(numbers[0], numbers[-1])
+                if texts is None:
+                    return None
+                for p, t in zip(numbers, texts):
+                    pages[p - 1] = t
+        return NormalisedText.from_pages(pages, estimated_page_length=NUMBER_OF_CHARACTERS_IN_ONE_PAGE)
+
+    def artifact_dependencies(self, name):
+        if self.front_matter_pages:
+            if name == 'front_matter_text':
+                return ['file_metadata']
+            if name in ['pattern_hits', 'scanned_text']:
+                return ['front_matter_text']
+        if name == 'page_images':
+            return ['file_metadata']
+        return super(PdfParser, self).artifact_dependencies(name)
+
+    def searchable_text(self, page_ranges=None):
+        """
+        Uses the text of the front and back matter (see self.normalise_front_matter) if page_ranges are all within
+        it and the full text has not been extracted yet
+        """
+        if page_ranges and self.front_matter_pages and not self.artifacts.has('text'):
+            page_numbers = self.front_matter_page_numbers()
+            if page_numbers:
+                n = self.number_of_pages
+                needed = set()
+                for first, last in page_ranges:
+                    first = first + n + 1 if first < 0 else first
+                    last = last + n + 1 if last < 0 else last
+                    needed.update(range(max(first, 1), min(last, n) + 1))
+                if needed.issubset(page_numbers):
+                    front_matter_text = self.artifacts.get('front_matter_text')
+                    if front_matter_text is not None:
+                        return front_matter_text
+        return super(PdfParser, self).searchable_text(page_ranges)
+
+    def measure_extracted_text(self, min_length=None):
+        """
+        Unless the full text has already been extracted, counts the characters of the text of each page, pulling
+        pages from self.iter_page_texts only until min_length is reached. The length counted is an artifact of its
+        own, so that later runs restore it from the artifact store instead of extracting pages again
+        """
+        if self.artifacts.has('text') or not min_length:
+            return super(PdfParser, self).measure_extracted_text(min_length)
+        name = self.artifacts.register_once("text_length_{}".format(min_length),
+                                            functools.partial(self.produce_text_length, min_length), kind='text')
+        length = self.artifacts.get(name)
+        return int(length) if length else None
+
+    def produce_text_length(self, min_length, name):
+        """
+        Producer of the artifacts of self.measure_extracted_text
+        :return: Dictionary of artifact name: number of characters of extracted text, or at least min_length (as a
+            string; None if text could not be extracted)
+        """
+        if self.front_matter_pages:
+            # front matter pages may be being extracted concurrently (see self.prefetch); wait for them
+            self.artifacts.get('front_matter_text')
+        length = 0
+        try:
+            for number, text in self.iter_page_texts():
+                # pages are separated by form feeds in the full text
+                length += len(text) + (1 if number > 1 else 0)
+                if length >= min_length:
+                    break
+        except Exception as e:  # pdfminer raises a variety of exceptions on malformed files
+            logger.warning("Could not stream text of PDF ({})".format(e))
+            length = super(PdfParser, self).measure_extracted_text(min_length)
+        return {name: str(length) if length else None}
+
+    @classmethod
+    def plan_cermine_outputs(cls, tests):
+        """
+        Works out the CERMINE outputs needed by tests
+        :param tests: Names of tests registered for a run
+        :return: Set of CERMINE outputs (e.g. {'jats', 'images'})
+        """
+        outputs = set()
+        for t in tests:
+            for a in cls.cermine_dependencies.get(t, []):
+                outputs.add(CERMINE_ARTIFACTS[a]['output'])
+        return outputs
+
+    def cermine_file(self, outputs=None):
         '''
-        Runs CERMINE (https://github.com/CeON/CERMINE) on pdf file. Useful presentation:
+        Runs CERMINE (https://github.com/CeON/CERMINE) on pdf file, using this process' pool of warm CERMINE
+        workers (see utils/cermine.py). Useful presentation:
         https://www.slideshare.net/dtkaczyk/tkaczyk-grotoap2slides
-        :return:
+        :param outputs: CERMINE outputs to generate; self.cermine_outputs by default
+        :return: True if CERMINE completed; False otherwise
         '''
+        if outputs is None:
+            outputs = self.cermine_outputs
+        outputs = [a['output'] for a in CERMINE_ARTIFACTS.values() if a['output'] in outputs]
+        logger.debug("Running CERMINE with outputs {}".format(outputs))
+        self.cermine_attempted_outputs.update(outputs)
+        return get_cermine_pool().extract(self.file_dirname, ",".join(outputs))
+
+    def produce_cermine_artifacts(self, name):
+        """
+        Producer of CERMINE artifacts for self.artifacts. CERMINE is only run if the requested artifact does not
+        already exist on disk, and all outputs generated by that run are recorded at once. The first run generates
+        all outputs planned for this parser's tests (plus the requested one); CERMINE is only run again for an
+        artifact no test had declared a dependency on
+        :param name: Name of requested artifact (a key of CERMINE_ARTIFACTS)
+        :return: Dictionary of CERMINE artifacts (name: path, or None if CERMINE did not produce it)
+        """
+        def existing_outputs():
+            found = {}
+            for k, a in CERMINE_ARTIFACTS.items():
+                path = self.cermine_artifact_path(k)
+                if os.path.exists(path):
+                    found[k] = path
+                elif a['output'] in self.cermine_attempted_outputs:
+                    found[k] = None
+            return found
+
+        produced = existing_outputs()
+        if name not in produced:
+            outputs = {CERMINE_ARTIFACTS[name]['output']}
+            if not self.cermine_attempted_outputs:
+                # artifacts restored from the artifact store (or left by a previous run) need not be generated again
+                outputs.update(o for o in self.cermine_outputs if o not in
+                               [CERMINE_ARTIFACTS[k]['output'] for k, v in produced.items() if v])
+            self.cermine_file(outputs)
+            produced = existing_outputs()
+        return produced
+
+    def cermine_artifact_path(self, name):
+        """
+        :param name: Name of CERMINE artifact (a key of CERMINE_ARTIFACTS)
+        :return: Path where CERMINE writes artifact name
+        """
+        return self.file_path.replace(self.file_ext, CERMINE_ARTIFACTS[name]['extension'])
+
+    def page_images_path(self, name='page_images'):
+        return self.file_path.replace(self.file_ext, '.pageimages')
+
+    def extract_front_matter_images(self):
+        """
+        Extracts the images of the first and last pages of file (see self.front_matter_page_numbers) straight from
+        the PDF, without running CERMINE
+        :return: Path to folder of images (named like those extracted by CERMINE); None if they could not be
+            extracted
+        """
+        page_numbers = self.front_matter_page_numbers() or [1]
+        folder = self.page_images_path()
         try:
-            subprocess.run(["java", "-cp", "cermine-impl-1.13-jar-with-dependencies.jar",
-                        "pl.edu.icm.cermine.ContentExtractor", "-path", self.file_dirname, "-outputs",
-                        # '"jats,text"'
-                        # '"trueviz"'
-                        '"jats,text,zones,trueviz,images"'
-                        ],
-                       check=True)
-        except subprocess.CalledProcessError as e:
-            logger.error("return code: {}; output: {}".format(e.returncode, e.output))
+            n = extract_page_images(self.file_path, page_numbers, folder)
+        except Exception as e:  # PyPDF2 raises a variety of exceptions on malformed files
+            logger.error("Could not extract images of pages {} of {}: {}".format(page_numbers, self.file_name, e))
+            return None
+        logger.debug("Extracted {} images from pages {}".format(n, page_numbers))
+        return folder
+
+    def geometry_path(self, name=GEOMETRY_ARTIFACT):
+        return self.file_path.replace(self.file_ext, '.geometry.npz')
+
+    def extract_geometry(self):
+        """
+        Saves the geometry of the pages sampled from the middle of the TrueViz output of CERMINE (see
+        utils.TrueViz.Document.sample_page_ids)
+        :return: Path to geometry file (see utils.TrueViz.Geometry.save); None if it could not be extracted
+        """
+        cermstr_path = self.artifacts.get('cermstr')
+        if not cermstr_path:
+            logger.error("TrueViz output of CERMINE unavailable, so could not extract page geometry")
+            return None
+        document = TrueVizDocument(cermstr_path)
+        path = self.geometry_path()
+        try:
+            document.geometry(document.sample_page_ids()).save(path)
+        except (OSError, ET.ParseError) as e:
+            logger.error("Could not extract page geometry from {}: {}".format(cermstr_path, e))
+            return None
+        return path
+
+    def load_geometry(self):
+        """
+        :return: Geometry of the pages sampled from the middle of the document (see self.extract_geometry); None if
+            it is unavailable
+        """
+        path = self.artifacts.get(GEOMETRY_ARTIFACT)
+        if not path:
+            return None
+        try:
+            return Geometry.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Could not read page geometry {}: {}".format(path, e))
+            return None
 
     def parse_cermxml(self):
-        cermxml_path = self.file_path.replace(self.file_ext, ".cermxml")
-        if os.path.exists(cermxml_path):
-            with open(cermxml_path) as f:
-                tree = ET.parse(f)
-            root = tree.getroot()
-            # extract DOI
-            for c_id in root.iter('article-id'):
-                if c_id.get('pub-id-type') == 'doi':
-                    if self.cerm_doi is not None:
-                        logger.warning("Previously detected DOI {} will be overwritten by value {}".format(self.cerm_doi,
-                                                                                                    c_id.text))
-                    self.cerm_doi = c_id.text
-
-            # extract title
-            for c_title in root.find('front').iter('article-title'):
-                if self.cerm_title is not None:
-                    logger.warning("Previously detected title '{}' will be overwritten by value '{}'".format(self.cerm_title,
-                                                                                                       c_title.text))
-                self.cerm_title = c_title.text
-
-            # extract journal title
-            for c_journal in root.iter('journal-title'):
-                if self.cerm_journal_title is not None:
-                    logger.warning("Previously detected journal title '{}' will be overwritten by"
-                                   " value '{}'".format(self.cerm_journal_title, c_journal.text))
-                self.cerm_journal_title = c_journal.text
-
-            self.cerm_ran_and_parsed = True
-            return self.cerm_doi, self.cerm_title, self.cerm_journal_title
-        return None
+        """
+        Parses the JATS output of CERMINE (once, even if several tests running concurrently need it)
+        :return: Tuple of DOI, title and journal title found by CERMINE; None if CERMINE output is unavailable
+        """
+        with self.cermxml_lock:
+            if self.cerm_ran_and_parsed:
+                return self.cerm_doi, self.cerm_title, self.cerm_journal_title
+            cermxml_path = self.artifacts.get('cermxml')
+            if cermxml_path:
+                with open(cermxml_path) as f:
+                    tree = ET.parse(f)
+                root = tree.getroot()
+                # extract DOI
+                for c_id in root.iter('article-id'):
+                    if c_id.get('pub-id-type') == 'doi':
+                        if self.cerm_doi is not None:
+                            logger.warning("Previously detected DOI {} will be overwritten by "
+                                           "value {}".format(self.cerm_doi, c_id.text))
+                        self.cerm_doi = c_id.text
+
+                # extract title
+                for c_title in root.find('front').iter('article-title'):
+                    if self.cerm_title is not None:
+                        logger.warning("Previously detected title '{}' will be overwritten by "
+                                       "value '{}'".format(self.cerm_title, c_title.text))
+                    self.cerm_title = c_title.text
+
+                # extract journal title
+                for c_journal in root.iter('journal-title'):
+                    if self.cerm_journal_title is not None:
+                        logger.warning("Previously detected journal title '{}' will be overwritten by"
+                                       " value '{}'".format(self.cerm_journal_title, c_journal.text))
+                    self.cerm_journal_title = c_journal.text
+
+                self.cerm_ran_and_parsed = True
+                return self.cerm_doi, self.cerm_title, self.cerm_journal_title
+            return None
 
     def detect_publisher_logos(self, max_hash_difference=5, stop_at_first_match=False):
         """
         Detects publisher logos in file
-        :param max_hash_difference: max_hash_difference to be passed to PublisherLogo.test_hash_match
-        :param stop_at_first_match: if True, stop trying additional matches if one is found
+        :param max_hash_difference: max_hash_difference to be passed to LogoIndex.match
+        :param stop_at_first_match: if True, only the first match found is returned
         :return: list of detected logos (as PublisherLogo instances)
         """
+        images_folder = self.artifacts.get('page_images') or self.artifacts.get('images')
+        if not images_folder:
+            logger.error("Images of file unavailable, so could not detect logos")
+            return []
+        image_paths = [os.path.join(images_folder, i) for i in sorted(os.listdir(images_folder))]
         detected_logos = []
-        images_folder = self.file_path.replace(self.file_ext, ".images")
-        if not os.path.exists(images_folder):
-            self.cermine_file()
-        for i in os.listdir(images_folder):
-            i_path = os.path.join(images_folder, i)
-            pl = PublisherLogo(i, path=i_path)
-            with shelve.open(LOGOS_DB_PATH) as db:
-                for key in db:
-                    logo = db[key]
-                    logo.test_hash_match(pl, max_hash_difference=max_hash_difference, method="perception")
-                    if logo.test_hash_match(pl, max_hash_difference=max_hash_difference):
-                        logger.debug("Extracted image {} matched logo {}".format(i_path, logo.name))
-                        detected_logos.append(logo)
-                        if stop_at_first_match:
-                            break
-            if detected_logos and stop_at_first_match:
+        # logos are expected on the first or last pages (see LogoIndex.candidate_images)
+        matches = get_logo_index(LOGOS_DB_PATH).match(image_paths, max_hash_difference=max_hash_difference,
+                                                      pages=self.front_matter_page_numbers())
+        for i_path, logo in matches:
+            logger.debug("Extracted image {} matched logo {}".format(i_path, logo.name))
+            detected_logos.append(logo)
+            if stop_at_first_match:
                 break
         return detected_logos
 
     def test_file_has_image_on_first_page(self):
-        images_folder = self.file_path.replace(self.file_ext, ".images")
-        if not os.path.exists(images_folder):
-            self.cermine_file()
+        has_image = page_has_image(self.file_path, 1)
+        if has_image is not None:
+            return has_image
+        # PyPDF2 could not read the file, but CERMINE may
+        images_folder = self.artifacts.get('images')
+        if not images_folder:
+            logger.error("Images extracted by CERMINE unavailable, so could not perform test")
+            return None
         for i in os.listdir(images_folder):
             if "img_1_" in i:
                 return True
         return False
 
+    def detect_layout_features(self):
+        """
+        Detects the line spacing, column layout and line numbering of body content (numbered lines, in particular,
+        are typical of manuscripts), using the TrueViz output of CERMINE
+        :return: Dictionary of features (see utils.TrueViz.Geometry.layout_features); None if they could not be
+            detected
+        """
+        geometry = self.load_geometry()
+        if geometry is None:
+            logger.error("Page geometry unavailable, so could not detect layout features")
+            return None
+        return geometry.layout_features()
+
     def extract_publisher_tags_from_file_metadata(self):
         detected_publisher_tags = list()
+        file_metadata = self.artifacts.get('file_metadata') or {}
         for tag in PUBLISHER_PDF_METADATA_TAGS:
-            if tag in self.file_metadata.keys():
+            if tag in file_metadata.keys():
                 logger.debug("Found publisher tag {} in file metadata".format(tag))
-                if self.file_metadata[tag]:
+                if file_metadata[tag]:
                     detected_publisher_tags.append(tag)
                 else:
                     logger.debug("However tag {} in file metadata has no value".format(tag))
@@ -581,6 +1178,139 @@ class PdfParser(BaseParser):
         logger.debug("Could not find DOI in extracted text")
         return False
 
+    def check_doi_in_background(self, doi):
+        """
+        Starts checking whether doi resolves on a background thread. Each DOI is only checked once per document,
+        even if it is found both in the extracted text and in the cermxml
+        :param doi: DOI to check
+        :return: concurrent.futures.Future whose result is the output of self.test_doi_resolves
+        """
+        with self.doi_checks_lock:
+            key = doi.lower()
+            if key not in self.doi_checks:
+                logger.debug("Checking DOI {} in the background".format(doi))
+                self.doi_checks[key] = DOI_CHECK_EXECUTOR.submit(self.test_doi_resolves, doi)
+            return self.doi_checks[key]
+
+    def start_doi_check_in_extracted_text(self):
+        """
+        :return: Future of the result of test_valid_doi_in_extracted_text; None if there is no DOI in extracted text
+        """
+        self.find_doi_in_extracted_text()
+        if self.doi_in_extracted_text:
+            return self.check_doi_in_background(self.doi_in_extracted_text['match'])
+        return None
+
+    def start_doi_check_in_cermine_xml(self):
+        """
+        :return: Future of the result of test_valid_doi_in_cermine_xml; None if CERMINE found no DOI
+        """
+        if not self.cerm_ran_and_parsed:
+            self.parse_cermxml()
+        if self.cerm_doi:
+            return self.check_doi_in_background(self.cerm_doi)
+        return None
+
+    def run_test(self, name):
+        """
+        :param name: Name of test (see PDF_TESTS)
+        :return: Outcome of test, or Future of its outcome if it runs in the background
+        """
+        spec = PDF_TESTS[name]
+        return getattr(self, spec.get('run', name))(*spec.get('args', []))
+
+    def record_test_result(self, r, name, outcome):
+        """
+        Records the outcome of test name in ArtemisResult r and excludes the versions it rules out
+        """
+        spec = PDF_TESTS[name]
+        setattr(r, spec['result'], r.append_test_result(getattr(self, name), outcome))
+        if self.outcome_is_inconclusive(name, outcome):
+            logger.debug("{} could not be performed this time".format(name))
+            self.inconclusive_tests.append(name)
+        if 'excludes' in spec:
+            excluded_versions = spec['excludes'](outcome)
+            if excluded_versions:
+                logger.debug("{} excludes versions {}".format(name, excluded_versions))
+                r.exclude_versions(excluded_versions)
+
+    def outcome_is_inconclusive(self, name, outcome):
+        """
+        :param name: Name of test
+        :param outcome: Outcome of test
+        :return: True if test name could not be performed for reasons that may not recur (CERMINE failed or timed
+            out, or the DOI resolver could not be reached), so that results depending on it should not be cached
+        """
+        if outcome is not None:
+            return False
+        if name in self.cermine_dependencies and \
+                any(self.artifacts.get(a) is None for a in PDF_TESTS[name].get('needs', [])):
+            return True
+        if name == 'test_valid_doi_in_extracted_text':
+            return bool(self.doi_in_extracted_text)
+        if name == 'test_valid_doi_in_cermine_xml':
+            return bool(self.cerm_doi)
+        return False
+
+    def decide(self, outcomes):
+        """
+        :param outcomes: Dictionary of the outcomes of tests, keyed by ArtemisResult attribute (see PDF_TESTS)
+        :return: Tuple of sanity check, approve deposit, reason and versions excluded by the decision
+        """
+        sanity_check = None
+        approve_deposit = False
+        excluded_versions = ()
+        dec_version = (self.dec_version or '').lower()
+        if outcomes.get('long_enough') and \
+                (outcomes.get('title_match_file_metadata') or outcomes.get('title_match_extracted_text')):
+            sanity_check = True
+            if outcomes.get('extracted_publisher_tags_in_file_metadata') or outcomes.get('cc_match_extracted_text'):
+                # file is publisher-generated
+                # TODO: Add more tests here
+                excluded_versions = (SMUR, AM)
+                if outcomes.get('cc_match_extracted_text'):
+                    reason = 'Create Commons licence detected in extracted text'
+                    approve_deposit = True  # could be proof, so additional checking is desirable
+                else:
+                    reason = 'Publisher-generated version; no evidence of CC licence'
+            else:
+                if dec_version in ['submitted version', 'accepted version', SMUR, AM]:
+                    approve_deposit = True
+                    reason = 'Could not find any evidence that this PDF is publisher-generated'
+                else:
+                    reason = "This is either a submitted or accepted version, " \
+                             "but declared version is {}".format(self.dec_version)
+        else:
+            if outcomes.get('long_enough'):
+                reason = "Could not find declared title ({}) in file {}".format(self.dec_ms_title, self.file_name)
+            else:
+                reason = "File {} is quite short for a journal article. Please check.".format(self.file_name)
+        return sanity_check, approve_deposit, reason, excluded_versions
+
+    def outcome_can_change_decision(self, r, name, pending):
+        """
+        :param r: ArtemisResult holding the outcomes of the tests run so far
+        :param name: Name of test
+        :param pending: Names of the other tests not run yet
+        :return: True if, for some outcomes of pending tests, self.decide reaches a different decision depending on
+            the outcome of test name
+        """
+        result = PDF_TESTS[name]['result']
+        if not PDF_TESTS[name]['decisive']:
+            return False
+        others = [PDF_TESTS[t]['result'] for t in pending if PDF_TESTS[t]['decisive']]
+        outcomes = dict(vars(r))
+        # the decision only depends on whether outcomes are truthy
+        for values in itertools.product([True, None], repeat=len(others)):
+            outcomes.update(zip(others, values))
+            decisions = set()
+            for value in [True, None]:
+                outcomes[result] = value
+                decisions.add(self.decide(outcomes))
+            if len(decisions) > 1:
+                return True
+        return False
+
     def test_valid_doi_in_extracted_text(self, *args, **kwargs):
         """
         Alias for self.test_doi_resolves. Used only to differentiate from test_valid_doi_in_cermine_xml
@@ -597,21 +1327,11 @@ class PdfParser(BaseParser):
 
     def parse(self):
         '''
-        Workflow for PDF files
+        Workflow for PDF files. Tests are run in order of cost (see PDF_TESTS) and, unless self.full_evidence is
+        True, tests whose outcomes can no longer change the decision are skipped
         :return: Tuple where: first element is string "success" or "fail" to indicate outcome; second element is
             string containing details
         '''
-
-        # plausible_versions = [
-        #     'submitted version', SMUR,
-        #     'accepted version', AM,
-        #     'proof', P,
-        #     'published version', 'version of record', VOR,
-        # ]  # use ArtemisResult.possible_versions instead
-
-        approve_deposit = False
-        reason = ""
-
         r = ArtemisResult(self.file_name)
         r.smur_prob = 2500
         r.am_prob = 2500
@@ -619,123 +1339,48 @@ class PdfParser(BaseParser):
         r.vor_oa_prob = 1250
         r.vor_pw_prob = 1250
 
-        # self.test_doi_resolves()
-
-        # region file metadata tests
-        self.extract_file_metadata()
-
-        r.title_match_file_metadata = r.append_test_result(
-            self.test_title_match_in_file_metadata,
-            self.test_title_match_in_file_metadata('/Title'),
-        )
-
-        r.extracted_publisher_tags_in_file_metadata = r.append_test_result(
-            self.extract_publisher_tags_from_file_metadata,
-            self.extract_publisher_tags_from_file_metadata(),
-        )
+        # region tests
+        pending = sorted([t for t in self.tests if t in PDF_TESTS], key=lambda t: PDF_TESTS[t]['cost'])
+        # artifacts needed by tests that run whatever the outcomes of others are produced concurrently (e.g. CERMINE
+        # runs while text is extracted); those only needed by decisive tests are produced once it is known that the
+        # tests run, as they are skipped if their outcomes can no longer change the decision. With the full evidence
+        # set, all tests are stages of the pipeline too
+        will_run = [t for t in pending if self.full_evidence or PDF_TESTS[t].get('reported')]
+        pipeline = self.prefetch([a for t in will_run for a in PDF_TESTS[t].get('needs', [])])
+        if self.full_evidence:
+            for name in pending:
+                pipeline.add_stage(name, functools.partial(self.run_test, name), PDF_TESTS[name].get('needs', []))
+        # DOI checks run in the background while other tests proceed; their results are collected at the end
+        background_checks = {}
+        with pipeline:
+            while pending:
+                name = pending.pop(0)
+                if pipeline.has_stage(name):
+                    outcome = pipeline.result(name)
+                elif PDF_TESTS[name].get('reported') or self.outcome_can_change_decision(r, name, pending):
+                    outcome = self.run_test(name)
+                else:
+                    logger.debug("Outcome of {} can no longer change the decision; skipping it".format(name))
+                    continue
+                if isinstance(outcome, Future):
+                    background_checks[name] = outcome
+                elif outcome is None and 'run' in PDF_TESTS[name]:
+                    logger.debug("Nothing to test for {}".format(name))
+                    if self.outcome_is_inconclusive(name, outcome):
+                        self.inconclusive_tests.append(name)
+                else:
+                    self.record_test_result(r, name, outcome)
+            for name, check in background_checks.items():
+                self.record_test_result(r, name, check.result())
+        # endregion
 
         if r.extracted_publisher_tags_in_file_metadata:
-            r.exclude_versions(['submitted version', SMUR])
             r.smur_prob = 0
-
-            r.exclude_versions(['accepted version', AM])
             r.am_prob = 0
-        # endregion
-
-        # region extracted text tests
-        self.extract_text()
-        r.long_enough = r.append_test_result(
-            self.test_length_of_extracted_text,
-            self.test_length_of_extracted_text(),
-        )
-
-        r.title_match_extracted_text = r.append_test_result(
-            self.test_title_match_in_extracted_text,
-            self.test_title_match_in_extracted_text(),
-        )
-
-        self.find_doi_in_extracted_text()
-        if self.doi_in_extracted_text:
-            doi_match = self.doi_in_extracted_text['match']
-            r.valid_doi_in_extracted_text = r.append_test_result(
-                self.test_valid_doi_in_extracted_text,
-                self.test_valid_doi_in_extracted_text(doi=doi_match),
-            )
-
-        r.cc_match_extracted_text = r.append_test_result(
-            self.find_cc_statement_in_extracted_text,
-            self.find_cc_statement_in_extracted_text(),
-        )
-        # endregion
-
-        # region cermine tests
-        self.cermine_file()
-        self.parse_cermxml()
-        if self.cerm_doi:
-            r.valid_doi_in_cermine_xml = r.append_test_result(
-                self.test_valid_doi_in_cermine_xml,
-                self.test_valid_doi_in_cermine_xml(doi=self.cerm_doi),
-            )
-
-        r.title_match_cermine_xml = r.append_test_result(
-            self.test_title_match_cermxml,
-            self.test_title_match_cermxml(),
-        )
-        # endregion
-
-        # region logo tests
-        r.image_on_first_page = r.append_test_result(
-            self.test_file_has_image_on_first_page,
-            self.test_file_has_image_on_first_page(),
-        )
-
-        r.detected_logos = r.append_test_result(
-            self.detect_publisher_logos,
-            self.detect_publisher_logos(),
-        )
-
-        # exclude r.possible_versions that are not corroborated by detected logos
-        if r.detected_logos:
-            logger.debug("r.possible_versions before considering logos: {}".format(r.possible_versions))
-            suggested_versions = []
-            for dl in r.detected_logos:
-                for version in dl.metadata["indicate_ms_versions"]:
-                    if version not in suggested_versions:
-                        suggested_versions.append(version)
-            logger.debug("Versions suggested by logos: {}".format(suggested_versions))
-            for v in reversed(r.possible_versions): # https://stackoverflow.com/a/14283447
-                if v not in suggested_versions:
-                    r.exclude_versions([v])
-            logger.debug("r.possible_versions after considering logos: {}".format(r.possible_versions))
-        # endregion
 
         # region decision
-        if r.long_enough and (r.title_match_file_metadata or r.title_match_extracted_text):
-            r.sanity_check = True
-
-            if r.extracted_publisher_tags_in_file_metadata or r.cc_match_extracted_text:
-                # file is publisher-generated
-                # TODO: Add more tests here
-                r.exclude_versions([SMUR, AM])
-                if self.dec_version.lower() in ['submitted version', 'accepted version', SMUR, AM]:
-                    r.reason = 'PDF metadata contains publisher tags, but declared version is author-generated'
-                if r.cc_match_extracted_text:
-                    r.reason = 'Create Commons licence detected in extracted text'
-                    r.approve_deposit = True  # could be proof, so additional checking is desirable
-                else:
-                    r.reason = 'Publisher-generated version; no evidence of CC licence'
-            else:
-                if self.dec_version.lower() in ['submitted version', 'accepted version', SMUR, AM]:
-                    r.approve_deposit = True
-                    r.reason = 'Could not find any evidence that this PDF is publisher-generated'
-                else:
-                    r.reason = "This is either a submitted or accepted version, " \
-                             "but declared version is {}".format(self.dec_version)
-        else:
-            if r.long_enough:
-                r.reason = "Could not find declared title ({}) in file {}".format(self.dec_ms_title, self.file_name)
-            else:
-                r.reason = "File {} is quite short for a journal article. Please check.".format(self.file_name)
+        r.sanity_check, r.approve_deposit, r.reason, excluded_versions = self.decide(vars(r))
+        r.exclude_versions(excluded_versions)
         # endregion
 
         return r.json_response()
@@ -744,7 +1389,8 @@ class PdfParser(BaseParser):
 
 class VersionDetector:
     def __init__(self, file_path, keep_temp_files=False,
-                 dec_ms_title=None, dec_version=None, dec_authors=None, working_folder=None, **kwargs):
+                 dec_ms_title=None, dec_version=None, dec_authors=None, working_folder=None, tests=None,
+                 use_cache=True, refresh_cache=False, full_evidence=False, **kwargs):
         '''
 
         :param file_path: Path to file this class will evaluate
@@ -752,6 +1398,14 @@ class VersionDetector:
         :param dec_ms_title: Declared title of manuscript
         :param dec_version: Declared manuscript version of file
         :param dec_authors: Declared authors of manuscript (list)
+        :param working_folder: Folder to be used instead of the system's temp folder; each file is processed in a
+            workspace of its own inside it, which is not deleted
+        :param tests: Names of tests to run on PDF files (PDF_DEFAULT_TESTS if None)
+        :param use_cache: If False, the result cache and the artifact store are bypassed altogether
+        :param refresh_cache: If True, any cached result is ignored and replaced by a freshly computed one;
+            artifacts extracted by previous runs (see utils.cache.ArtifactStore) are still reused, so that only
+            the decision logic is run again
+        :param full_evidence: If True, all tests are run on PDF files, even after the decision has been settled
         :param **kwargs: Dictionary of citation details and any other known metadata fields; values may include:
             acceptance_date=None, doi=None, publication_date=None, title=None
         '''
@@ -763,6 +1417,12 @@ class VersionDetector:
         self.dec_version = dec_version
         self.dec_authors = dec_authors
         self.working_folder = working_folder
+        self.tests = tests
+        self.use_cache = use_cache
+        self.refresh_cache = refresh_cache
+        self.full_evidence = full_evidence
+        self.file_hash = None
+        self.inconclusive_tests = []  # tests that could not be performed (see PdfParser.outcome_is_inconclusive)
         self.metadata = kwargs
         logger.info("----- Working on file {}".format(file_path))
 
@@ -778,34 +1438,69 @@ class VersionDetector:
             logger.error("Unrecognised file extension {} detected for {}".format(self.file_ext, self.file_path))
             return self.file_ext
 
+    def result_cache_key(self):
+        """
+        :return: Key of this job's result in the result cache; it depends on the contents and name of the file, on
+            declared and known metadata, on the tests requested and on the version of Artemis' rules
+        """
+        if not self.file_hash:
+            self.file_hash = file_sha256(self.file_path)
+        return ResultCache.make_key(
+            self.file_hash,
+            rules_stamp(),
+            file_name=self.file_name,
+            dec_ms_title=self.dec_ms_title,
+            dec_version=self.dec_version,
+            dec_authors=self.dec_authors,
+            tests=self.tests,
+            full_evidence=self.full_evidence,
+            metadata=self.metadata,
+        )
+
     def detect(self):
+        """
+        Detect version of file using appropriate parser, or return the cached result of a previous identical check.
+        Results are not cached if any test could not be performed, so that checking the file again retries them
+        :return:
+        """
+        cache_key = None
+        if self.use_cache:
+            cache = ResultCache()
+            cache_key = self.result_cache_key()
+            if not self.refresh_cache:
+                result = cache.get(cache_key)
+                if result is not None:
+                    logger.info("Returning cached result for {}".format(self.file_path))
+                    return result
+        result = self.detect_uncached()
+        if cache_key and isinstance(result, str):
+            if self.inconclusive_tests:
+                logger.info("Not caching result for {}, as {} could not be performed".format(
+                    self.file_path, ", ".join(self.inconclusive_tests)))
+            else:
+                cache.set(cache_key, result)
+        return result
+
+    def detect_uncached(self):
         """
         Detect version of file using appropriate parser
         :return:
         """
         ext = self.check_extension()
+        artifact_store = ArtifactStore() if self.use_cache else None
         if ext == "docx":
-            p = DocxParser(self.file_path, self.dec_ms_title, self.dec_version, self.dec_authors, **self.metadata)
+            p = DocxParser(self.file_path, self.dec_ms_title, self.dec_version, self.dec_authors,
+                           artifact_store=artifact_store, document_key=self.file_hash, **self.metadata)
             result = p.parse()
         elif ext == "pdf":
-            def pdf_routine(detector_instance, target_file):
-                shutil.copy2(detector_instance.file_path, target_file)
-                pdfparser = PdfParser(target_file, detector_instance.dec_ms_title,
-                                      detector_instance.dec_version, detector_instance.dec_authors,
-                                      **detector_instance.metadata)
-                return pdfparser.parse()
-
-            if self.working_folder:
-                target = os.path.join(self.working_folder, self.file_name)
-                result = pdf_routine(self, target)
-            elif not self.keep_temp_files:
-                with TemporaryDirectory(prefix="artemis-") as tmpdir:
-                    target = os.path.join(tmpdir, self.file_name)
-                    result = pdf_routine(self, target)
-            else:
-                tmpdir = mkdtemp(prefix="artemis-")
-                target = os.path.join(tmpdir, self.file_name)
-                result = pdf_routine(self, target)
+            # each file gets a workspace of its own, so that CERMINE never reprocesses other PDFs in the same folder
+            keep = self.keep_temp_files or bool(self.working_folder)
+            with JobWorkspace(self.file_path, base_folder=self.working_folder, keep=keep) as ws:
+                pdfparser = PdfParser(ws.target_file, self.dec_ms_title, self.dec_version, self.dec_authors,
+                                      tests=self.tests, artifact_store=artifact_store, document_key=self.file_hash,
+                                      full_evidence=self.full_evidence, **self.metadata)
+                result = pdfparser.parse()
+                self.inconclusive_tests = pdfparser.inconclusive_tests
 
         else:
             error_msg = "{} is not a supported file extension".format(ext)
@@ -818,6 +1513,13 @@ class VersionDetector:
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['batch']:
+        from utils.batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    if sys.argv[1:2] == ['serve']:
+        from utils.service import main as serve_main
+        sys.exit(serve_main(sys.argv[2:]))
+
     sign_off = '''-------------
 Artemis {}
 Author: {}
@@ -843,17 +1545,37 @@ https://opensource.org/licenses/MIT
     parser.add_argument('-v', '--version', dest='version', type=str,
                         metavar='"{}", "{}", "{}" or "{}"'.format(SMUR, AM, P, VOR),
                         help='Expected/declared version of journal article')
-    parser.add_argument('-w', '--working-folder', dest='working-folder', type=str,
+    parser.add_argument('-w', '--working-folder', dest='working_folder', type=str,
                         metavar='<path>',
                         help='Path to working folder to be used (instead of temp folder)')
+    parser.add_argument('-l', '--layout', dest='layout', action="store_true",
+                        help='Also analyse page layout of PDF files (slower, as it requires TrueViz output from '
+                             'CERMINE); layout features are reported, but do not affect the decision')
+    parser.add_argument('-f', '--full-evidence', dest='full_evidence', action="store_true",
+                        help='Run all tests, even those that cannot change the decision (slower); the results of '
+                             'tests based on CERMINE (test_valid_doi_in_cermine_xml and test_title_match_cermxml) '
+                             'are only reported with this option')
+    parser.add_argument('--no-cache', dest='no_cache', action="store_true",
+                        help='Do not read or write cached results')
+    parser.add_argument('--refresh-cache', dest='refresh_cache', action="store_true",
+                        help='Ignore cached results, but store the new one')
+    parser.add_argument('--cermine-workers', dest='cermine_workers', type=int, metavar='N',
+                        help='Number of warm CERMINE workers to keep running (default: {})'.format(CERMINE_POOL_SIZE))
     arguments = parser.parse_args()
 
+    if arguments.cermine_workers:
+        configure_cermine_pool(arguments.cermine_workers)
+
     detector = VersionDetector(
         arguments.path,
         keep_temp_files=arguments.keep,
         dec_ms_title=arguments.title,
         dec_version=arguments.version,
-        working_folder=arguments.working-folder,
+        working_folder=arguments.working_folder,
+        tests=PDF_DEFAULT_TESTS + PDF_LAYOUT_TESTS if arguments.layout else None,
+        use_cache=not arguments.no_cache,
+        refresh_cache=arguments.refresh_cache,
+        full_evidence=arguments.full_evidence,
     )
     print(detector.detect())
 
@@ -0,0 +1,119 @@
+import random
+import unittest
+
+from utils.approximate import ApproximateMatcher, fold_case, max_errors_for, myers_scores, pattern_bitmasks
+
+
+def edit_distance(a, b):
+    """
+    :return: Levenshtein distance between a and b
+    """
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def reference_scores(pattern, text):
+    """
+    Dynamic programming reference for myers_scores
+    :return: List of the edit distance between pattern and the best matching substring of text ending at each
+        character of text
+    """
+    column = list(range(len(pattern) + 1))
+    scores = []
+    for c in text:
+        new_column = [0]
+        for i, p in enumerate(pattern, 1):
+            new_column.append(min(column[i] + 1, new_column[i - 1] + 1, column[i - 1] + (p != c)))
+        column = new_column
+        scores.append(column[-1])
+    return scores
+
+
+class TestApproximateMatcher(unittest.TestCase):
+    text = "The manuscript version of this article was accepted for publication on 1 May 2020."
+
+    def test_exact_match(self):
+        m = ApproximateMatcher("accepted for publication", 0).search(self.text)
+        self.assertEqual("accepted for publication", self.text[m[0]:m[1]])
+        self.assertEqual(0, m[2])
+
+    def test_exact_match_ignores_case(self):
+        m = ApproximateMatcher("ACCEPTED for Publication", 0).search(self.text)
+        self.assertEqual((43, 67, 0), m)
+
+    def test_no_match_without_errors_allowed(self):
+        self.assertIsNone(ApproximateMatcher("acepted for publication", 0).search(self.text))
+
+    def test_one_error(self):
+        matcher = ApproximateMatcher("acepted for publication", 1)
+        start, end, errors = matcher.search(self.text)
+        self.assertEqual(1, errors)
+        self.assertEqual(1, edit_distance("acepted for publication", self.text[start:end]))
+        self.assertTrue(self.text[start:end].endswith("cepted for publication"))
+        self.assertIsNone(ApproximateMatcher("acepted fr publication", 1).search(self.text))
+
+    def test_maximum_errors(self):
+        query = "acepted fr publicaton"
+        max_errors = max_errors_for(len(query), 0.2)
+        self.assertEqual(3, max_errors)
+        start, end, errors = ApproximateMatcher(query, max_errors).search(self.text)
+        self.assertEqual(3, errors)
+        self.assertTrue(self.text[start:end].endswith("cepted for publication"))
+        self.assertIsNone(ApproximateMatcher("acepted fr publicaton on", 2).search(self.text))
+
+    def test_search_is_restricted_to_span(self):
+        matcher = ApproximateMatcher("version", 0)
+        self.assertIsNotNone(matcher.search(self.text, 0, 30))
+        self.assertIsNone(matcher.search(self.text, 30))
+
+    def test_max_errors_for(self):
+        # as in regex's {e<n} constraint, with n = int(error_ratio * length)
+        self.assertEqual(0, max_errors_for(5, 0.1))
+        self.assertEqual(1, max_errors_for(20, 0.1))
+        self.assertEqual(0, max_errors_for(20, 0))
+
+    def test_fold_case_preserves_offsets(self):
+        text = "İstanbul STRASSE ǅ"
+        self.assertEqual(len(text), len(fold_case(text)))
+
+    def test_myers_scores_match_dynamic_programming(self):
+        r = random.Random(0)
+        for _ in range(200):
+            pattern = "".join(r.choice("abc") for _ in range(r.randint(1, 70)))
+            text = "".join(r.choice("abc") for _ in range(r.randint(0, 100)))
+            scores = list(myers_scores(pattern_bitmasks(pattern), len(pattern), text))
+            self.assertEqual(reference_scores(pattern, text), scores, (pattern, text))
+
+    def test_matches_agree_with_brute_force(self):
+        r = random.Random(1)
+        for _ in range(300):
+            pattern = "".join(r.choice("ab c") for _ in range(r.randint(4, 30)))
+            text = "".join(r.choice("ab c") for _ in range(r.randint(0, 120)))
+            if r.random() < 0.5:
+                # plant a copy of pattern with a few edits
+                planted = list(pattern)
+                for _ in range(r.randint(0, 3)):
+                    planted[r.randrange(len(planted))] = r.choice("ab c")
+                i = r.randint(0, len(text))
+                text = text[:i] + "".join(planted) + text[i:]
+            max_errors = r.randint(0, len(pattern) // 4)
+            m = ApproximateMatcher(pattern, max_errors).search(text)
+            ends = [j + 1 for j, score in enumerate(reference_scores(pattern, text)) if score <= max_errors]
+            if not ends:
+                self.assertIsNone(m, (pattern, text, max_errors))
+                continue
+            self.assertIsNotNone(m, (pattern, text, max_errors))
+            start, end, errors = m
+            self.assertLessEqual(errors, max_errors)
+            self.assertEqual(errors, edit_distance(pattern, text[start:end]), (pattern, text, max_errors))
+            # the leftmost match is found (or, if it is followed by a better one, the match overlapping it)
+            self.assertLess(start, ends[0], (pattern, text, max_errors))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import unittest
+from tempfile import TemporaryDirectory
+
+from utils.artifacts import ArtifactManager
+from utils.cache import ArtifactStore
+
+
+class CountingProducer:
+    """
+    Producer of artifacts that records how many times it was called
+    """
+    def __init__(self, artifacts, delay=0):
+        self.artifacts = artifacts
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, name):
+        self.calls += 1
+        time.sleep(self.delay)
+        return dict(self.artifacts)
+
+
+class TestArtifactManager(unittest.TestCase):
+    def test_artifact_is_produced_once_for_concurrent_requests(self):
+        producer = CountingProducer({'text': "Some text"}, delay=0.2)
+        manager = ArtifactManager()
+        manager.register(['text'], producer)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(manager.get('text'))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(["Some text"] * 5, results)
+        self.assertEqual(1, producer.calls)
+
+    def test_producer_of_several_artifacts_runs_once(self):
+        producer = CountingProducer({'cermxml': "a.cermxml", 'cermtxt': "a.cermtxt"})
+        manager = ArtifactManager()
+        manager.register(['cermxml', 'cermtxt'], producer)
+        self.assertEqual("a.cermtxt", manager.get('cermtxt'))
+        self.assertTrue(manager.has('cermxml'))
+        self.assertEqual("a.cermxml", manager.get('cermxml'))
+        self.assertEqual(1, producer.calls)
+
+    def test_failed_artifact_is_not_produced_again(self):
+        producer = CountingProducer({})
+        manager = ArtifactManager()
+        manager.register(['text'], producer)
+        self.assertIsNone(manager.get('text'))
+        self.assertIsNone(manager.get('text'))
+        self.assertEqual(1, producer.calls)
+
+    def test_unregistered_artifact(self):
+        self.assertIsNone(ArtifactManager().get('text'))
+
+
+class TestArtifactManagerWithStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.store = ArtifactStore(os.path.join(self.folder.name, "artifacts"), max_size=1024 * 1024)
+
+    def test_text_artifacts_are_restored(self):
+        first = CountingProducer({'text': "Some text", 'info': "not persisted"})
+        manager = ArtifactManager(store=self.store, document_key="abc")
+        manager.register(['text', 'info'], first, kind={'text': 'text'})
+        manager.get('text')
+        second = CountingProducer({'text': "Other text", 'info': "not persisted"})
+        manager = ArtifactManager(store=self.store, document_key="abc")
+        manager.register(['text', 'info'], second, kind={'text': 'text'})
+        self.assertEqual("Some text", manager.get('text'))
+        self.assertEqual(0, second.calls)
+        self.assertEqual("not persisted", manager.get('info'))
+        self.assertEqual(1, second.calls)
+
+    def test_file_artifacts_are_restored_to_their_location(self):
+        source = os.path.join(self.folder.name, "first.cermxml")
+        with open(source, 'w') as f:
+            f.write("<article/>")
+        manager = ArtifactManager(store=self.store, document_key="abc")
+        manager.register(['cermxml'], CountingProducer({'cermxml': source}), kind='file',
+                         location=lambda name: source)
+        manager.get('cermxml')
+        restored_path = os.path.join(self.folder.name, "second.cermxml")
+        producer = CountingProducer({})
+        manager = ArtifactManager(store=self.store, document_key="abc")
+        manager.register(['cermxml'], producer, kind='file', location=lambda name: restored_path)
+        self.assertEqual(restored_path, manager.get('cermxml'))
+        self.assertEqual(0, producer.calls)
+        with open(restored_path) as f:
+            self.assertEqual("<article/>", f.read())
+
+    def test_artifacts_of_other_documents_are_not_restored(self):
+        manager = ArtifactManager(store=self.store, document_key="abc")
+        manager.register(['text'], CountingProducer({'text': "Some text"}), kind='text')
+        manager.get('text')
+        producer = CountingProducer({'text': "Other text"})
+        manager = ArtifactManager(store=self.store, document_key="def")
+        manager.register(['text'], producer, kind='text')
+        self.assertEqual("Other text", manager.get('text'))
+        self.assertEqual(1, producer.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import io
+import json
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from utils.batch import BatchRunner, iter_jobs, make_job
+
+
+def stand_in_run_job(job, options):
+    """
+    Stand-in for utils.batch.run_job (run in worker processes): the name of the file says how to answer
+    """
+    name = os.path.basename(job['path'])
+    if name == 'crash.pdf':
+        os._exit(1)
+    if name == 'error.pdf':
+        raise ValueError("malformed PDF")
+    return json.dumps({'input_path': job['path'], 'approve_deposit': True})
+
+
+class FlushCheckingOutput(io.StringIO):
+    """
+    Output that records whether each line was flushed before the next one was written
+    """
+    def __init__(self):
+        super(FlushCheckingOutput, self).__init__()
+        self.unflushed_lines = 0
+        self.lines_written_unflushed = 0
+
+    def write(self, s):
+        if self.unflushed_lines:
+            self.lines_written_unflushed += 1
+        self.unflushed_lines += 1
+        return super(FlushCheckingOutput, self).write(s)
+
+    def flush(self):
+        self.unflushed_lines = 0
+        return super(FlushCheckingOutput, self).flush()
+
+    def records(self):
+        return [json.loads(line) for line in self.getvalue().splitlines()]
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('utils.batch.run_job', stand_in_run_job)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.output = FlushCheckingOutput()
+
+    def run_jobs(self, jobs, **kwargs):
+        return BatchRunner(jobs=1, max_in_flight=1, **kwargs).run(jobs, self.output)
+
+    def test_results_are_streamed(self):
+        checked, errors = self.run_jobs([make_job({'path': p}) for p in ['/tmp/a.pdf', '/tmp/error.pdf']])
+        self.assertEqual((2, 1), (checked, errors))
+        records = self.output.records()
+        self.assertEqual('/tmp/a.pdf', records[0]['input_path'])
+        self.assertEqual('ValueError', records[1]['error_type'])
+        self.assertEqual(0, self.output.lines_written_unflushed)
+
+    def test_jobs_after_an_unreadable_one_are_checked(self):
+        with TemporaryDirectory() as folder:
+            manifest = os.path.join(folder, "manifest.jsonl")
+            with open(manifest, 'w') as f:
+                f.write('{"path": "a.pdf"}\n{"title": "No path"}\n{"path": "b.pdf"\n{"path": "c.pdf"}\n')
+            checked, errors = self.run_jobs(iter_jobs(manifest))
+        self.assertEqual((2, 2), (checked, errors))
+        records = self.output.records()
+        self.assertEqual([os.path.join(folder, "a.pdf"), None, None, os.path.join(folder, "c.pdf")],
+                         [r.get('input_path') for r in records])
+        self.assertTrue(records[1]['error'].startswith("Line 2: No path"))
+        self.assertTrue(records[2]['error'].startswith("Line 3: "))
+        self.assertEqual(0, self.output.lines_written_unflushed)
+
+    def test_unreadable_manifest(self):
+        checked, errors = self.run_jobs(iter_jobs("/nonexistent/manifest.jsonl"))
+        self.assertEqual((0, 1), (checked, errors))
+        self.assertEqual('FileNotFoundError', self.output.records()[0]['error_type'])
+
+    def test_runner_recovers_from_crashed_worker(self):
+        jobs = [make_job({'path': p}) for p in ['/tmp/a.pdf', '/tmp/crash.pdf', '/tmp/b.pdf']]
+        checked, errors = self.run_jobs(jobs)
+        self.assertEqual((3, 1), (checked, errors))
+        records = self.output.records()
+        self.assertEqual(['/tmp/a.pdf', '/tmp/crash.pdf', '/tmp/b.pdf'], [r['input_path'] for r in records])
+        self.assertEqual('BrokenProcessPool', records[1]['error_type'])
+        self.assertTrue(records[2]['approve_deposit'])
+
+
+class TestIterJobs(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_csv_manifest(self):
+        path = os.path.join(self.folder.name, "manifest.csv")
+        with open(path, 'w') as f:
+            f.write("path,title,version,authors,doi\narticle.pdf,A title,accepted manuscript,A. Author; B. Author,"
+                    "10.1234/abc\n")
+        self.assertEqual([{'path': os.path.join(self.folder.name, "article.pdf"), 'title': "A title",
+                           'version': "accepted manuscript", 'authors': ["A. Author", "B. Author"],
+                           'metadata': {'doi': "10.1234/abc"}}], list(iter_jobs(path)))
+
+    def test_csv_manifest_with_unreadable_row(self):
+        path = os.path.join(self.folder.name, "manifest.csv")
+        with open(path, 'w') as f:
+            f.write("path,title\na.pdf,A\n,No path\nc.pdf,C\n")
+        jobs = list(iter_jobs(path))
+        self.assertEqual(["a.pdf", None, "c.pdf"], [os.path.basename(j['path']) if 'path' in j else None
+                                                    for j in jobs])
+        self.assertEqual('ValueError', jobs[1]['error_type'])
+        self.assertTrue(jobs[1]['error'].startswith("Line 3: "))
+
+    def test_folder(self):
+        for name in ["b.pdf", "a.docx", "notes.txt"]:
+            open(os.path.join(self.folder.name, name), 'w').close()
+        self.assertEqual(["a.docx", "b.pdf"], [os.path.basename(j['path']) for j in iter_jobs(self.folder.name)])
+
+
+if __name__ == '__main__':
+    unittest.main()
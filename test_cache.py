@@ -0,0 +1,158 @@
+import os
+import time
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import artemis
+from utils.cache import ArtifactStore, DiskCache, ResultCache
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.cache = DiskCache(self.folder.name, max_size=250)
+
+    def age(self, key, seconds):
+        """
+        Makes entry key look like it was last used seconds ago
+        """
+        t = time.time() - seconds
+        os.utime(self.cache.path(key), (t, t))
+
+    def test_entries_are_stored(self):
+        self.cache.set_bytes("abc", b"data")
+        self.assertEqual(b"data", self.cache.get_bytes("abc"))
+        self.assertIsNone(self.cache.get_bytes("def"))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.set_bytes("k1", b"1" * 100)
+        self.cache.set_bytes("k2", b"2" * 100)
+        self.age("k1", 20)
+        self.age("k2", 10)
+        self.cache.get_bytes("k1")  # now more recently used than k2
+        self.cache.set_bytes("k3", b"3" * 100)
+        self.assertIsNotNone(self.cache.get_bytes("k1"))
+        self.assertIsNone(self.cache.get_bytes("k2"))
+        self.assertIsNotNone(self.cache.get_bytes("k3"))
+        self.assertEqual(200, self.cache.read_size())
+
+    def test_size_is_shared_by_instances(self):
+        self.cache.set_bytes("k1", b"1" * 100)
+        other = DiskCache(self.folder.name, max_size=250)
+        with mock.patch.object(other, 'entries', wraps=other.entries) as entries:
+            other.set_bytes("k2", b"2" * 100)
+            other.set_bytes("k2", b"2" * 50)
+            entries.assert_not_called()
+        self.assertEqual(150, other.read_size())
+        other.set_bytes("k3", b"3" * 150)
+        self.assertIsNone(other.get_bytes("k1"))
+        self.assertEqual(200, other.read_size())
+
+    def test_folder_is_walked_periodically(self):
+        self.cache.full_check_interval = 2
+        self.cache.set_bytes("k1", b"1")
+        with mock.patch.object(self.cache, 'entries', wraps=self.cache.entries) as entries:
+            self.cache.set_bytes("k2", b"2")
+            self.cache.set_bytes("k3", b"3")
+            self.cache.set_bytes("k4", b"4")
+            self.assertEqual(1, entries.call_count)
+
+
+class TestResultCacheKey(unittest.TestCase):
+    def test_key_depends_on_all_fields(self):
+        key = ResultCache.make_key("hash", "rules", title="A title")
+        self.assertEqual(key, ResultCache.make_key("hash", "rules", title="A title"))
+        self.assertNotEqual(key, ResultCache.make_key("hash", "other rules", title="A title"))
+        self.assertNotEqual(key, ResultCache.make_key("hash", "rules", title="Another title"))
+
+    def test_rules_stamp_follows_logos_database(self):
+        with TemporaryDirectory() as folder:
+            basename = os.path.join(folder, "logos_db")
+            with mock.patch('artemis.LOGOS_DB_PATH', basename):
+                before = artemis.rules_stamp()
+                with open(basename + ".json", 'w') as f:
+                    f.write('{"version": 1, "logos": []}')
+                built = artemis.rules_stamp()
+                self.assertNotEqual(before, built)
+                self.assertEqual(built, artemis.rules_stamp())
+
+
+class TestResultCaching(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.file_path = os.path.join(self.folder.name, "article.pdf")
+        open(self.file_path, 'wb').close()
+        self.cache = ResultCache(os.path.join(self.folder.name, "results"))
+        patcher = mock.patch('artemis.ResultCache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def detect(self, inconclusive_tests=()):
+        detector = artemis.VersionDetector(self.file_path)
+
+        def detect_uncached():
+            detector.inconclusive_tests = list(inconclusive_tests)
+            return '{"approve_deposit": true}'
+
+        with mock.patch.object(detector, 'detect_uncached', side_effect=detect_uncached) as uncached:
+            detector.detect()
+        return uncached.called
+
+    def test_result_is_cached(self):
+        with mock.patch('artemis.rules_stamp', side_effect=["rules", "new rules"]):
+            self.assertTrue(self.detect())  # the key is calculated once, before detection
+        with mock.patch('artemis.rules_stamp', return_value="rules"):
+            self.assertFalse(self.detect())
+
+    def test_inconclusive_result_is_not_cached(self):
+        with mock.patch('artemis.rules_stamp', return_value="rules"):
+            self.assertTrue(self.detect(['test_valid_doi_in_extracted_text']))
+            self.assertTrue(self.detect())
+            self.assertFalse(self.detect())
+
+
+class TestArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.store = ArtifactStore(os.path.join(self.folder.name, "artifacts"), max_size=1024 * 1024)
+
+    def test_text(self):
+        self.store.save("abc", 'text', 'text', "Extracted text ﬁ")
+        self.assertEqual("Extracted text ﬁ", self.store.load("abc", 'text', 'text'))
+        self.assertIsNone(self.store.load("def", 'text', 'text'))
+
+    def test_file(self):
+        source = os.path.join(self.folder.name, "article.cermxml")
+        with open(source, 'w') as f:
+            f.write("<article/>")
+        self.store.save("abc", 'cermxml', 'file', source)
+        location = os.path.join(self.folder.name, "restored.cermxml")
+        self.assertEqual(location, self.store.load("abc", 'cermxml', 'file', location=location))
+        with open(location) as f:
+            self.assertEqual("<article/>", f.read())
+
+    def test_folder(self):
+        source = os.path.join(self.folder.name, "article.images")
+        os.makedirs(source)
+        for name in ["img_1_1.png", "img_1_2.png"]:
+            with open(os.path.join(source, name), 'wb') as f:
+                f.write(name.encode())
+        self.store.save("abc", 'images', 'folder', source)
+        location = os.path.join(self.folder.name, "restored.images")
+        os.makedirs(location)
+        open(os.path.join(location, "stale.png"), 'w').close()
+        self.assertEqual(location, self.store.load("abc", 'images', 'folder', location=location))
+        self.assertEqual(["img_1_1.png", "img_1_2.png"], sorted(os.listdir(location)))
+
+    def test_corrupt_artifact_is_discarded(self):
+        self.store.set_bytes(ArtifactStore.make_key("abc", 'text'), b"not gzip")
+        self.assertIsNone(self.store.load("abc", 'text', 'text'))
+        self.assertIsNone(self.store.get_bytes(ArtifactStore.make_key("abc", 'text')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import subprocess
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from utils.cermine import CermineTimeout, CermineWorker, CermineWorkerError, CerminePool, run_cermine_once
+
+# stand-in for CermineWorker.java, speaking the same protocol; the directory of each job says how to answer it
+STAND_IN_WORKER = """
+import sys, time
+print("READY", flush=True)
+for line in sys.stdin:
+    directory = line.split("\\t")[0]
+    if directory == "hang":
+        time.sleep(60)
+    elif directory == "die":
+        time.sleep(0.5)
+        sys.exit(1)
+    elif directory == "fail":
+        print("ERROR failed", flush=True)
+    else:
+        print("OK", flush=True)
+"""
+
+
+def stand_in_worker():
+    return CermineWorker(command=[sys.executable, "-c", STAND_IN_WORKER])
+
+
+class StandInPool(CerminePool):
+    def __init__(self, **kwargs):
+        super(StandInPool, self).__init__(**kwargs)
+        self.started_workers = []
+
+    def start_worker(self):
+        worker = stand_in_worker()
+        self.started_workers.append(worker)
+        return worker
+
+
+class TestCermineWorker(unittest.TestCase):
+    def setUp(self):
+        self.worker = stand_in_worker()
+        self.addCleanup(self.worker.close)
+
+    def test_job_outcomes(self):
+        self.assertTrue(self.worker.run("ok", "jats"))
+        self.assertFalse(self.worker.run("fail", "jats"))
+        self.assertTrue(self.worker.run("ok", "jats"))
+
+    def test_hung_worker_is_killed(self):
+        with self.assertRaises(CermineTimeout):
+            self.worker.run("hang", "jats", timeout=0.5)
+        self.assertIsNotNone(self.worker.process.poll())
+
+    def test_dead_worker_raises(self):
+        with self.assertRaises(CermineWorkerError):
+            self.worker.run("die", "jats")
+
+
+class TestCerminePool(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('utils.cermine.run_cermine_once', return_value="fallback")
+        self.run_cermine_once = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_workers_are_reused(self):
+        pool = StandInPool(size=2)
+        self.addCleanup(pool.close)
+        for _ in range(3):
+            self.assertTrue(pool.extract("ok", "jats"))
+        self.assertEqual(1, len(pool.started_workers))
+        self.run_cermine_once.assert_not_called()
+
+    def test_falls_back_when_workers_cannot_start(self):
+        pool = CerminePool(size=1)
+        with mock.patch.object(pool, 'start_worker', side_effect=CermineWorkerError("no Java 11")):
+            self.assertEqual("fallback", pool.extract("ok", "jats"))
+            self.assertEqual("fallback", pool.extract("ok", "jats"))
+        self.assertFalse(pool.available)
+
+    def test_waiting_caller_starts_new_worker_when_busy_worker_dies(self):
+        pool = StandInPool(size=1)
+        self.addCleanup(pool.close)
+        results = {}
+        dying = threading.Thread(target=lambda: results.update(dying=pool.extract("die", "jats")))
+        dying.start()
+        while not pool.started_workers:
+            pass
+        waiting = threading.Thread(target=lambda: results.update(waiting=pool.extract("ok", "jats")))
+        waiting.start()
+        dying.join(10)
+        waiting.join(10)
+        self.assertFalse(waiting.is_alive())
+        self.assertEqual({'dying': "fallback", 'waiting': True}, results)
+        self.assertEqual(2, len(pool.started_workers))
+
+    def test_hung_worker_is_replaced(self):
+        pool = StandInPool(size=1, timeout=0.5)
+        self.addCleanup(pool.close)
+        self.assertFalse(pool.extract("hang", "jats"))
+        self.run_cermine_once.assert_not_called()  # the document is not given another full timeout
+        self.assertTrue(pool.extract("ok", "jats"))
+        self.assertEqual(2, len(pool.started_workers))
+
+
+class TestRunCermineOnce(unittest.TestCase):
+    def test_console_output_of_cermine_is_discarded(self):
+        with mock.patch('utils.cermine.subprocess.run') as run:
+            self.assertTrue(run_cermine_once("/tmp/job", "jats"))
+        self.assertEqual(subprocess.DEVNULL, run.call_args[1]['stdout'])
+
+    def test_timeout(self):
+        with mock.patch('utils.cermine.subprocess.run', side_effect=subprocess.TimeoutExpired("java", 1)):
+            self.assertFalse(run_cermine_once("/tmp/job", "jats", timeout=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+
+from utils.doi import DoiResolver
+
+
+class StandInDoiHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for doi.org: redirects registered DOIs, returns 404 for unknown ones
+    """
+    registered = ['10.1234/registered', '10.1234/no-head']
+    requests = []
+
+    def answer(self):
+        doi = self.path.lstrip('/')
+        self.requests.append((self.command, doi))
+        if doi == '10.1234/slow':
+            time.sleep(1)
+        if (doi == '10.1234/no-head') and (self.command == 'HEAD'):
+            self.send_response(405)
+        elif doi in self.registered:
+            self.send_response(302)
+            self.send_header('Location', 'https://publisher.example/{}'.format(doi))
+        elif doi == '10.1234/server-error':
+            self.send_response(503)
+        else:
+            self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_HEAD = answer
+    do_GET = answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDoiResolver(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInDoiHandler)
+        cls.base_url = 'http://127.0.0.1:{}/'.format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StandInDoiHandler.requests.clear()
+        self.tmpdir = TemporaryDirectory()
+        self.resolver = self.make_resolver()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_resolver(self, **kwargs):
+        kwargs.setdefault('min_request_interval', 0)
+        return DoiResolver(base_url=self.base_url, cache_folder=self.tmpdir.name, timeout=(0.5, 0.5), **kwargs)
+
+    def test_registered_doi_resolves_without_following_redirect(self):
+        self.assertTrue(self.resolver.resolves('10.1234/registered'))
+        self.assertEqual([('HEAD', '10.1234/registered')], StandInDoiHandler.requests)
+
+    def test_unknown_doi_does_not_resolve(self):
+        self.assertFalse(self.resolver.resolves('10.1234/unknown'))
+
+    def test_get_fallback_when_head_not_allowed(self):
+        self.assertTrue(self.resolver.resolves('10.1234/no-head'))
+        self.assertEqual(['HEAD', 'GET'], [r[0] for r in StandInDoiHandler.requests])
+
+    def test_timeout_and_server_errors_are_inconclusive_and_not_cached(self):
+        self.assertIsNone(self.resolver.resolves('10.1234/slow'))
+        self.assertIsNone(self.resolver.resolves('10.1234/server-error'))
+        self.assertIsNone(self.resolver.resolves('10.1234/server-error'))
+        self.assertEqual(2, StandInDoiHandler.requests.count(('HEAD', '10.1234/server-error')))
+
+    def test_answers_are_cached_across_instances(self):
+        self.resolver.resolves('10.1234/registered')
+        self.resolver.resolves('10.1234/unknown')
+        other_resolver = self.make_resolver()
+        self.assertTrue(other_resolver.resolves('10.1234/REGISTERED'))
+        self.assertFalse(other_resolver.resolves('10.1234/unknown'))
+        self.assertEqual(2, len(StandInDoiHandler.requests))
+
+    def test_negative_answers_expire(self):
+        resolver = self.make_resolver(negative_ttl=0)
+        resolver.resolves('10.1234/unknown')
+        time.sleep(0.01)
+        resolver.resolves('10.1234/unknown')
+        self.assertEqual(2, len(StandInDoiHandler.requests))
+
+    def test_requests_are_rate_limited(self):
+        resolver = self.make_resolver(min_request_interval=0.2)
+        start = time.time()
+        for i in range(3):
+            resolver.resolves('10.1234/unknown-{}'.format(i))
+        self.assertGreaterEqual(time.time() - start, 0.4)
+
+
+if __name__ == '__main__':
+    unittest.main()
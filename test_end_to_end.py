@@ -28,6 +28,8 @@ def run_test(index, test_case_instance):
         dec_ms_title=TEST_FILES[index]['title'],
         dec_version=TEST_FILES[index]['version'],
         working_folder=WORKING_FOLDER,
+        use_cache=False,
+        full_evidence=True,
     )
     result = json.loads(vd.detect())
     logger.info(result)
@@ -0,0 +1,229 @@
+import json
+import os
+import threading
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import imagehash
+import numpy
+from PIL import Image, ImageDraw
+
+from utils.logos import (MAX_PERCEPTION_HASH_DIFFERENCE, REDUCED_HASH_TOLERANCE, LogoIndex, PublisherLogo, average_hashes,
+                         build_missing_logos_db, get_logo_index, hamming_distances, is_image, load_reduced_image,
+                         logos_db_exists, logos_db_lock, pack_hash, read_logos_db_sidecar, update_logos_db,
+                         write_logos_db)
+
+
+def make_logo(path, seed, size=(160, 64)):
+    """
+    Saves a greyscale image of random blocks (the same for the same seed) at path
+    """
+    blocks = numpy.random.RandomState(seed).randint(0, 2, (4, 10)).astype(numpy.uint8) * 255
+    Image.fromarray(blocks).resize(size, Image.NEAREST).save(path)
+    return path
+
+
+def make_wordmark(path, size=(600, 200)):
+    """
+    Saves a logo made of a disc and lines of text (drawn as bars) at path, drawn at 600 x 200 pixels and scaled to size
+    """
+    im = Image.new('RGB', (600, 200), (255, 255, 255))
+    draw = ImageDraw.Draw(im)
+    draw.ellipse((20, 20, 180, 180), fill=(230, 110, 20))
+    draw.polygon([(100, 40), (150, 160), (50, 160)], fill=(255, 255, 255))
+    for i, width in enumerate([360, 300, 340]):
+        draw.rectangle((210, 40 + 45 * i, 210 + width, 65 + 45 * i), fill=(40, 40, 40))
+    im.resize(size, Image.LANCZOS).save(path)
+    return path
+
+
+class TestHashes(unittest.TestCase):
+    def test_pack_hash(self):
+        image_hash = imagehash.hex_to_hash("8000000000000001")
+        self.assertEqual(0x8000000000000001, pack_hash(image_hash))
+        with self.assertRaises(ValueError):
+            pack_hash(imagehash.ImageHash(numpy.zeros((16, 16), dtype=bool)))
+
+    def test_hamming_distances_match_imagehash(self):
+        hashes = [imagehash.hex_to_hash(h) for h in ["0000000000000000", "00000000000000ff", "ffffffffffffffff"]]
+        packed = [pack_hash(h) for h in hashes]
+        distances = hamming_distances(packed[:2], packed)
+        self.assertEqual((2, 3), distances.shape)
+        for i in range(2):
+            for j in range(3):
+                self.assertEqual(hashes[i] - hashes[j], distances[i, j])
+
+
+class TestReducedHashes(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.paths = [make_logo(os.path.join(self.folder.name, "logo_{}_{}.png".format(seed, size[0])), seed, size)
+                      for seed in range(10) for size in [(160, 64), (600, 240), (1000, 1000)]]
+
+    def test_average_hashes_are_those_of_imagehash(self):
+        images = [Image.open(path).convert('L') for path in self.paths]
+        self.assertEqual([pack_hash(imagehash.average_hash(im)) for im in images], list(average_hashes(images)))
+        self.assertEqual(0, len(average_hashes([])))
+
+    def test_reduced_images_hash_close_to_full_size_images(self):
+        reduced = [load_reduced_image(path) for path in self.paths]
+        self.assertTrue(all(max(im.size) <= 64 for im in reduced))
+        full_size = [pack_hash(imagehash.average_hash(Image.open(path))) for path in self.paths]
+        distances = numpy.diag(hamming_distances(full_size, average_hashes(reduced)))
+        self.assertLessEqual(distances.max(), REDUCED_HASH_TOLERANCE)
+
+
+class TestLogoIndex(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.logos = [PublisherLogo("logo_{}.png".format(seed), width=160, height=64, publisher="P{}".format(seed),
+                                    path=make_logo(os.path.join(self.folder.name, "logo_{}.png".format(seed)), seed))
+                      for seed in [1, 2]]
+        self.index = LogoIndex.from_logos(self.logos)
+
+    def image(self, name, seed, size=(160, 64)):
+        return make_logo(os.path.join(self.folder.name, name), seed, size)
+
+    def test_logos_without_images_are_left_out(self):
+        index = LogoIndex.from_logos(self.logos + [PublisherLogo("missing.png",
+                                                                 path=os.path.join(self.folder.name, "missing.png"))])
+        self.assertEqual(2, len(index))
+        self.assertEqual(pack_hash(imagehash.average_hash(Image.open(self.logos[0].path))), index.average_hashes[0])
+
+    def test_match(self):
+        images = [self.image("img_1_1.png", 2), self.image("img_1_2.png", 3), self.image("img_1_3.png", 1, (320, 128))]
+        matches = self.index.match(images)
+        self.assertEqual([(images[0], "logo_2.png"), (images[2], "logo_1.png")],
+                         [(path, logo.name) for path, logo in matches])
+
+    def test_logo_scaled_to_embedded_size(self):
+        logo = PublisherLogo("wordmark.png", width=600, height=200, publisher="P",
+                             path=make_wordmark(os.path.join(self.folder.name, "wordmark.png")))
+        index = LogoIndex.from_logos(self.logos + [logo])
+        images = [make_wordmark(os.path.join(self.folder.name, "img_1_{}.{}".format(i, extension)), size)
+                  for i, (size, extension) in enumerate([((150, 50), "png"), ((150, 50), "jpg"), ((90, 30), "jpg")])]
+        self.assertEqual([(path, "wordmark.png") for path in images],
+                         [(path, logo.name) for path, logo in index.match(images)])
+
+    def index_at_distances(self, path, average_hash_difference, perception_hash_difference):
+        """
+        :return: LogoIndex of one logo whose hashes differ from those of the full-size image at path by the given
+            numbers of bits
+        """
+        im = Image.open(path)
+        average_hash = pack_hash(imagehash.average_hash(im)) ^ ((1 << average_hash_difference) - 1)
+        perception_hash = pack_hash(imagehash.phash(im)) ^ ((1 << perception_hash_difference) - 1)
+        return LogoIndex(self.logos[:1], numpy.array([average_hash], dtype=numpy.uint64),
+                         numpy.array([perception_hash], dtype=numpy.uint64))
+
+    def test_average_hash_threshold(self):
+        image = self.image("img_1_1.png", 1)
+        self.assertEqual(1, len(self.index_at_distances(image, 5, 0).match([image])))
+        self.assertEqual(1, len(self.index_at_distances(image, 6, 0).match([image], max_hash_difference=6)))
+        self.assertEqual([], self.index_at_distances(image, 6, 0).match([image]))
+        index = self.index_at_distances(image, 5 + REDUCED_HASH_TOLERANCE + 1, 0)
+        with mock.patch('utils.logos.imagehash.phash') as phash:
+            self.assertEqual([], index.match([image]))
+            phash.assert_not_called()  # images are only hashed at full resolution if they are candidates
+
+    def test_perception_hash_threshold(self):
+        image = self.image("img_1_1.png", 1)
+        self.assertEqual(1, len(self.index_at_distances(image, 0, MAX_PERCEPTION_HASH_DIFFERENCE).match([image])))
+        self.assertEqual([], self.index_at_distances(image, 0, MAX_PERCEPTION_HASH_DIFFERENCE + 1).match([image]))
+        self.assertEqual([], self.index_at_distances(image, 0, 4).match([image], max_perception_hash_difference=3))
+
+    def test_empty_index(self):
+        self.assertEqual([], LogoIndex.from_logos([]).match([self.image("img_1_1.png", 1)]))
+
+    def test_candidate_images(self):
+        images = [self.image("img_1_1.png", 1), self.image("img_1_2.png", 1),  # same image twice
+                  self.image("img_1_3.png", 1, (2000, 800)),  # too large
+                  self.image("img_1_4.png", 1, (160, 16)),  # too wide for its height
+                  self.image("img_5_1.png", 1, (161, 64))]  # not on an allowed page
+        self.assertEqual(images[:1], self.index.candidate_images(images, pages=[1, 2]))
+        self.assertEqual([images[0], images[4]], self.index.candidate_images(images))
+
+
+class TestGetLogoIndex(unittest.TestCase):
+    def test_index_is_loaded_once(self):
+        with TemporaryDirectory() as folder:
+            basename = os.path.join(folder, "logos_db")
+            write_logos_db([{'name': "logo.png", 'width': 160, 'height': 64, 'text': None,
+                             'metadata': {'publisher': "P"}}], [(1, 2)], basename)
+            with mock.patch('utils.logos.LogoIndex.from_db', wraps=LogoIndex.from_db) as from_db:
+                index = get_logo_index(basename)
+                self.assertIs(index, get_logo_index(basename))
+                self.assertEqual(1, from_db.call_count)
+            self.assertEqual(["logo.png"], [logo.name for logo in index.logos])
+            self.assertEqual("P", index.logos[0].publisher)
+            self.assertEqual([1], list(index.average_hashes))
+            self.assertEqual([2], list(index.perception_hashes))
+
+
+class TestLogosDb(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.library = os.path.join(self.folder.name, "publisher_logos")
+        os.makedirs(self.library)
+        for seed in [1, 2]:
+            self.add_logo("publisher_{}".format(seed), seed)
+        self.basename = os.path.join(self.folder.name, "db", "logos_db")
+        patcher = mock.patch('utils.logos.pytesseract.image_to_string', return_value="Publisher")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_logo(self, name, seed):
+        make_logo(os.path.join(self.library, name + ".png"), seed)
+        with open(os.path.join(self.library, name + ".json"), 'w') as f:
+            json.dump({'publisher': name}, f)
+
+    def test_is_image(self):
+        self.assertTrue(is_image(os.path.join(self.library, "publisher_1.png")))
+        self.assertFalse(is_image(os.path.join(self.library, "publisher_1.json")))
+
+    def test_update_is_incremental(self):
+        self.assertEqual((2, 0, 0), update_logos_db(self.library, self.basename, processes=1))
+        self.add_logo("publisher_3", 3)
+        os.remove(os.path.join(self.library, "publisher_1.png"))
+        self.assertEqual((1, 1, 1), update_logos_db(self.library, self.basename, processes=1))
+        self.assertEqual(["publisher_2.png", "publisher_3.png"],
+                         [e['name'] for e in read_logos_db_sidecar(self.basename)])
+        index = LogoIndex.from_db(self.basename)
+        self.assertEqual(pack_hash(imagehash.average_hash(Image.open(os.path.join(self.library, "publisher_3.png")))),
+                         index.average_hashes[1])
+        self.assertEqual("publisher_3", index.logos[1].publisher)
+
+    def test_missing_database_is_built_once(self):
+        results = []
+        with mock.patch('utils.logos._update_logos_db') as update:
+            with logos_db_lock(self.basename):
+                # another process building the database holds the lock
+                waiting = threading.Thread(target=lambda: results.append(build_missing_logos_db(self.library,
+                                                                                                self.basename)))
+                waiting.start()
+                waiting.join(0.2)
+                self.assertTrue(waiting.is_alive())
+                write_logos_db([], [], self.basename)
+            waiting.join(5)
+            update.assert_not_called()
+        self.assertEqual([True], results)
+        self.assertEqual([], read_logos_db_sidecar(self.basename))
+
+    def test_missing_database_is_built_on_first_use(self):
+        self.assertFalse(logos_db_exists(self.basename))
+        index = get_logo_index(self.basename, self.library)
+        self.assertTrue(logos_db_exists(self.basename))
+        self.assertEqual(["publisher_1.png", "publisher_2.png"], [logo.name for logo in index.logos])
+
+    def test_unwritable_database(self):
+        with mock.patch('utils.logos.os.makedirs', side_effect=PermissionError("read-only")):
+            self.assertFalse(build_missing_logos_db(self.library, self.basename))
+        self.assertFalse(logos_db_exists(self.basename))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import io
+import os
+import unittest
+import zlib
+from tempfile import TemporaryDirectory
+
+from PIL import Image
+
+from utils.pdfimages import extract_page_images, page_has_image
+
+GREY_PIXELS = bytes(range(0, 240, 30))  # 4 x 2 pixels
+
+
+def stream(dictionary, data):
+    return b"<< " + dictionary + b" /Length " + str(len(data)).encode() + b" >>\nstream\n" + data + b"\nendstream"
+
+
+def jpeg_bytes():
+    output = io.BytesIO()
+    Image.new('RGB', (8, 8), (200, 30, 30)).save(output, 'JPEG')
+    return output.getvalue()
+
+
+def make_pdf(path):
+    """
+    Writes a PDF file of two pages: the first uses a greyscale image, a JPEG image and a form XObject holding an
+    indexed image and the greyscale image again; the second has no images
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /XObject << /Im1 5 0 R /Im2 6 0 R "
+        b"/Fm1 7 0 R >> >> /Contents 9 0 R >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << >> /Contents 9 0 R >>",
+        stream(b"/Type /XObject /Subtype /Image /Width 4 /Height 2 /ColorSpace /DeviceGray /BitsPerComponent 8",
+               GREY_PIXELS),
+        stream(b"/Type /XObject /Subtype /Image /Width 8 /Height 8 /ColorSpace /DeviceRGB /BitsPerComponent 8 "
+               b"/Filter /DCTDecode", jpeg_bytes()),
+        stream(b"/Type /XObject /Subtype /Form /BBox [0 0 10 10] /Resources << /XObject << /Im1 5 0 R "
+               b"/Im3 8 0 R >> >>", b""),
+        stream(b"/Type /XObject /Subtype /Image /Width 2 /Height 1 /ColorSpace [/Indexed /DeviceRGB 1 "
+               b"<ff000000ff00>] /BitsPerComponent 8", bytes([0, 1])),
+        stream(b"", b"q Q"),
+    ]
+    write_pdf(path, objects)
+
+
+def make_pdf_with_compressed_jpeg_and_inline_image(path):
+    """
+    Writes a PDF file of two pages: the first uses a JPEG image compressed with /FlateDecode, the second draws an
+    inline image
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /XObject << /Im1 5 0 R >> >> "
+        b"/Contents 6 0 R >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << >> /Contents 7 0 R >>",
+        stream(b"/Type /XObject /Subtype /Image /Width 8 /Height 8 /ColorSpace /DeviceRGB /BitsPerComponent 8 "
+               b"/Filter [/FlateDecode /DCTDecode]", zlib.compress(jpeg_bytes())),
+        stream(b"", b"q Q"),
+        stream(b"", b"q 4 0 0 2 72 72 cm BI /W 4 /H 2 /CS /G /BPC 8 ID " + b"\x80" * 8 + b" EI Q"),
+    ]
+    write_pdf(path, objects)
+
+
+def write_pdf(path, objects):
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, o in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += "{} 0 obj\n".format(i).encode() + o + b"\nendobj\n"
+    xref = len(data)
+    data += "xref\n0 {}\n0000000000 65535 f \n".format(len(objects) + 1).encode()
+    data += "".join("{:010d} 00000 n \n".format(o) for o in offsets).encode()
+    data += "trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(len(objects) + 1, xref).encode()
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class TestPdfImages(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.file_path = os.path.join(self.folder.name, "article.pdf")
+        make_pdf(self.file_path)
+
+    def test_page_has_image(self):
+        self.assertTrue(page_has_image(self.file_path, 1))
+        self.assertFalse(page_has_image(self.file_path, 2))
+        self.assertFalse(page_has_image(self.file_path, 3))
+        not_a_pdf = os.path.join(self.folder.name, "not_a.pdf")
+        with open(not_a_pdf, 'w') as f:
+            f.write("Not a PDF")
+        self.assertIsNone(page_has_image(not_a_pdf))
+
+    def test_extract_page_images(self):
+        folder = os.path.join(self.folder.name, "article.images")
+        self.assertEqual(3, extract_page_images(self.file_path, [1, 2, 5], folder))
+        # images inside the form come first (Fm1 sorts before Im1), and the greyscale image is only written once
+        self.assertEqual(["img_1_0.png", "img_1_1.png", "img_1_2.jpg"], sorted(os.listdir(folder)))
+        with Image.open(os.path.join(folder, "img_1_0.png")) as im:
+            self.assertEqual('L', im.mode)
+            self.assertEqual(GREY_PIXELS, im.tobytes())
+        with open(os.path.join(folder, "img_1_2.jpg"), 'rb') as f:
+            self.assertEqual(jpeg_bytes(), f.read())
+        with Image.open(os.path.join(folder, "img_1_1.png")) as im:
+            self.assertEqual([(255, 0, 0), (0, 255, 0)], list(im.convert('RGB').getdata()))
+
+
+class TestOtherImages(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.file_path = os.path.join(self.folder.name, "article.pdf")
+        make_pdf_with_compressed_jpeg_and_inline_image(self.file_path)
+
+    def test_page_has_inline_image(self):
+        self.assertTrue(page_has_image(self.file_path, 2))
+
+    def test_compressed_jpeg_is_extracted(self):
+        folder = os.path.join(self.folder.name, "article.images")
+        with self.assertLogs('artemis', level='DEBUG') as logs:
+            self.assertEqual(1, extract_page_images(self.file_path, [1, 2], folder))
+        self.assertEqual(["img_1_0.jpg"], os.listdir(folder))
+        with open(os.path.join(folder, "img_1_0.jpg"), 'rb') as f:
+            self.assertEqual(jpeg_bytes(), f.read())
+        self.assertTrue(any("inline images of page 2" in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,390 @@
+import json
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import artemis
+from artemis import CERMINE_ARTIFACTS, PDF_DEFAULT_TESTS, PDF_LAYOUT_TESTS, PDF_TESTS, PdfParser
+from utils import pdftext
+from utils.cache import ArtifactStore, file_sha256
+from utils.logos import LogoIndex
+from test_trueviz import body_zone, make_cermstr
+
+
+def make_pdf(path, pages):
+    """
+    Writes a PDF file with a page of text for each item of pages (a list of lists of lines)
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        text = " ".join("({}) Tj 0 -14 Td".format(line) for line in lines)
+        stream = "BT /F1 12 Tf 72 720 Td {} ET".format(text)
+        objects.append("<< /Length {} >>\nstream\n{}\nendstream".format(len(stream), stream))
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                       "/Contents {} 0 R >>".format(len(objects)))
+        kids.append("{} 0 R".format(len(objects)))
+    objects[1] = "<< /Type /Pages /Kids [{}] /Count {} >>".format(" ".join(kids), len(kids))
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for i, o in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += "{} 0 obj\n{}\nendobj\n".format(i, o).encode('latin-1')
+    xref = len(data)
+    data += "xref\n0 {}\n0000000000 65535 f \n".format(len(objects) + 1).encode()
+    data += "".join("{:010d} 00000 n \n".format(o) for o in offsets).encode()
+    data += "trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(len(objects) + 1, xref).encode()
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class StandInCerminePool:
+    """
+    Stand-in for utils.cermine.CerminePool: records the outputs requested and writes empty files in their place
+    """
+    contents = {'.cermxml': "<article><front><article-meta><title-group><article-title>Radiation and decline of "
+                            "endodontid land snails</article-title></title-group></article-meta></front></article>"}
+
+    def __init__(self):
+        self.runs = []
+
+    def extract(self, directory, outputs):
+        self.runs.append(set(outputs.split(",")))
+        for f in os.listdir(directory):
+            if f.endswith(".pdf"):
+                for a in CERMINE_ARTIFACTS.values():
+                    if a['output'] in self.runs[-1]:
+                        path = os.path.join(directory, f.replace(".pdf", a['extension']))
+                        if a['kind'] == 'folder':
+                            os.makedirs(path)
+                        else:
+                            with open(path, 'w') as output:
+                                output.write(self.contents.get(a['extension'], ""))
+        return True
+
+
+class TestCermineOutputs(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.file_path = os.path.join(self.folder.name, "article.pdf")
+        open(self.file_path, 'wb').close()
+        self.pool = StandInCerminePool()
+        patcher = mock.patch('artemis.get_cermine_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def parser(self, tests=None):
+        p = PdfParser(self.file_path, tests=tests)
+        self.addCleanup(p.file.close)
+        return p
+
+    def test_outputs_are_planned_from_tests(self):
+        self.assertEqual({'jats'}, PdfParser.plan_cermine_outputs(PDF_DEFAULT_TESTS))
+        self.assertEqual({'jats', 'trueviz'}, PdfParser.plan_cermine_outputs(PDF_DEFAULT_TESTS + PDF_LAYOUT_TESTS))
+        self.assertEqual(set(), PdfParser.plan_cermine_outputs(['test_length_of_extracted_text']))
+
+    def test_only_planned_outputs_are_requested(self):
+        p = self.parser()
+        self.assertTrue(p.artifacts.get('cermxml').endswith(".cermxml"))
+        self.assertEqual([{'jats'}], self.pool.runs)
+        self.assertFalse(os.path.exists(p.cermine_artifact_path('cermstr')))
+
+    def test_all_planned_outputs_are_generated_in_one_run(self):
+        p = self.parser(PDF_DEFAULT_TESTS + PDF_LAYOUT_TESTS)
+        p.artifacts.get('cermxml')
+        p.artifacts.get('cermstr')
+        self.assertEqual([{'jats', 'trueviz'}], self.pool.runs)
+
+    def test_unplanned_output_is_generated_on_request(self):
+        p = self.parser()
+        p.artifacts.get('cermxml')
+        self.assertTrue(p.artifacts.get('images'))
+        self.assertEqual([{'jats'}, {'images'}], self.pool.runs)
+
+
+class TestBackgroundDoiChecks(unittest.TestCase):
+    def setUp(self):
+        folder = TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        file_path = os.path.join(folder.name, "article.pdf")
+        open(file_path, 'wb').close()
+        self.parser = PdfParser(file_path)
+        self.addCleanup(self.parser.file.close)
+
+    def test_each_doi_is_checked_once(self):
+        with mock.patch.object(self.parser, 'test_doi_resolves', return_value=True) as resolves:
+            self.parser.doi_in_extracted_text = {'match': "10.1234/ABC"}
+            self.parser.find_doi_in_extracted_text = lambda: self.parser.doi_in_extracted_text
+            in_text = self.parser.start_doi_check_in_extracted_text()
+            self.parser.cerm_ran_and_parsed = True
+            self.parser.cerm_doi = "10.1234/abc"
+            in_cermxml = self.parser.start_doi_check_in_cermine_xml()
+            self.assertIs(in_text, in_cermxml)
+            self.assertTrue(in_cermxml.result(5))
+        resolves.assert_called_once_with("10.1234/ABC")
+
+    def test_no_check_without_doi(self):
+        self.parser.cerm_ran_and_parsed = True
+        self.assertIsNone(self.parser.start_doi_check_in_cermine_xml())
+
+    def test_unanswered_doi_check_is_inconclusive(self):
+        name = 'test_valid_doi_in_extracted_text'
+        self.assertFalse(self.parser.outcome_is_inconclusive(name, None))  # no DOI to check
+        self.parser.doi_in_extracted_text = {'match': "10.1234/abc"}
+        self.assertFalse(self.parser.outcome_is_inconclusive(name, False))
+        self.assertTrue(self.parser.outcome_is_inconclusive(name, None))
+
+
+class TestStatementsInExtractedText(unittest.TestCase):
+    def setUp(self):
+        folder = TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        file_path = os.path.join(folder.name, "article.pdf")
+        open(file_path, 'wb').close()
+        self.parser = PdfParser(file_path, front_matter_pages=0)
+        self.addCleanup(self.parser.file.close)
+
+    def test_statements_are_only_looked_for_on_first_and_last_pages(self):
+        pages = ["Title", "Body", "Body. This article is under a CC BY-NC licence", "Body", "Body",
+                 "All rights reserved."]
+        self.parser.artifacts.put('text', "\f".join(pages))
+        self.assertIsNone(self.parser.find_cc_statement_in_extracted_text())
+        rights_reserved = self.parser.find_rights_reserved_statement_in_extracted_text()
+        self.assertEqual("All rights reserved.", rights_reserved['match'])
+
+
+class TestTitleMatch(unittest.TestCase):
+    def setUp(self):
+        folder = TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        file_path = os.path.join(folder.name, "article.pdf")
+        open(file_path, 'wb').close()
+        self.parser = PdfParser(file_path, front_matter_pages=0)
+        self.addCleanup(self.parser.file.close)
+        self.parser.artifacts.put('text', "Journal of Snails\nRadiation and decline of endodontid land snails in\n"
+                                          "Makatea, French Polynesia\f Body")
+
+    def test_multi_line_title_costs_no_errors(self):
+        title = "Radiation and decline of endodontid\nland snails  in Makatea, French Polynesia "
+        m = self.parser.find_match_in_extracted_text(title, allowed_error_ratio=0)
+        self.assertEqual("Radiation and decline of endodontid land snails in Makatea, French Polynesia", m['match'])
+        self.assertTrue(m['match in expected position'])
+
+
+class TestPersistedText(unittest.TestCase):
+    tests = ['test_length_of_extracted_text', 'test_title_match_in_extracted_text',
+             'find_cc_statement_in_extracted_text', 'find_rights_reserved_statement_in_extracted_text']
+
+    def setUp(self):
+        folder = TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.file_path = os.path.join(folder.name, "article.pdf")
+        pages = [["Radiation and decline of endodontid land snails"]] + \
+                [["Page {} line {} of the body of the article".format(p, i) for i in range(45)] for p in range(2, 11)]
+        make_pdf(self.file_path, pages)
+        self.store = ArtifactStore(os.path.join(folder.name, "artifacts"), max_size=10 * 1024 * 1024)
+
+    def parse(self):
+        p = PdfParser(self.file_path, dec_ms_title="Radiation and decline of endodontid land snails",
+                      dec_version="accepted manuscript", tests=self.tests, artifact_store=self.store,
+                      document_key=file_sha256(self.file_path))
+        self.addCleanup(p.file.close)
+        return json.loads(p.parse())
+
+    def test_second_run_does_not_extract_text(self):
+        with mock.patch('artemis.extract_page_range', wraps=artemis.extract_page_range) as extract_page_range, \
+                mock.patch('artemis.iter_pages', wraps=artemis.iter_pages) as iter_pages:
+            first = self.parse()
+            self.assertTrue(extract_page_range.called)
+            self.assertTrue(first['test_results']['test_length_of_extracted_text'])
+            self.assertTrue(first['test_results']['test_title_match_in_extracted_text'])
+            extract_page_range.reset_mock()
+            iter_pages.reset_mock()
+            self.assertEqual(first, self.parse())
+            extract_page_range.assert_not_called()
+            iter_pages.assert_not_called()
+
+
+class TestPersistedGeometry(unittest.TestCase):
+    def setUp(self):
+        folder = TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.file_path = os.path.join(folder.name, "article.pdf")
+        make_pdf(self.file_path, [["Page {}".format(p)] for p in range(1, 8)])
+        cermstr_path = os.path.join(folder.name, "source.cermstr")
+        lines = [[str(n + 1)] + ["manuscripts"] * 6 for n in range(20)]  # 360 pt wide
+        make_cermstr(cermstr_path, [[body_zone(lines, spacing=20)] for _ in range(7)])
+        self.pool = StandInCerminePool()
+        with open(cermstr_path) as f:
+            self.pool.contents = dict(self.pool.contents, **{'.cermstr': f.read()})
+        patcher = mock.patch('artemis.get_cermine_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = ArtifactStore(os.path.join(folder.name, "artifacts"), max_size=10 * 1024 * 1024)
+
+    def parser(self):
+        p = PdfParser(self.file_path, tests=PDF_LAYOUT_TESTS, artifact_store=self.store,
+                      document_key=file_sha256(self.file_path))
+        self.addCleanup(p.file.close)
+        return p
+
+    def test_second_run_does_not_need_cermine(self):
+        p = self.parser()
+        features = p.detect_layout_features()
+        self.assertEqual({'line_spacing': 2.0, 'two_columns': False, 'numbered_lines': True}, features)
+        self.assertEqual(1, len(self.pool.runs))
+        # the workspace of the next run is a new one, without the outputs of this run
+        for path in [p.cermine_artifact_path('cermstr'), p.geometry_path()]:
+            os.remove(path)
+        with mock.patch('artemis.TrueVizDocument') as document:
+            self.assertEqual(features, self.parser().detect_layout_features())
+            document.assert_not_called()
+        self.assertEqual(1, len(self.pool.runs))
+
+    def test_layout_tests_do_not_wait_for_cermine_once_geometry_is_stored(self):
+        p = self.parser()
+        first = json.loads(p.parse())
+        self.assertTrue(first['test_results']['detect_layout_features']['numbered_lines'])
+        self.assertEqual(1, len(self.pool.runs))
+        for path in [p.cermine_artifact_path('cermstr'), p.geometry_path()]:
+            os.remove(path)
+        self.assertEqual(first, json.loads(self.parser().parse()))
+        self.assertEqual(1, len(self.pool.runs))
+        # nor is the TrueViz output restored from the artifact store
+        self.assertFalse(os.path.exists(p.cermine_artifact_path('cermstr')))
+
+
+class TestPageStreaming(unittest.TestCase):
+    def setUp(self):
+        folder = TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.file_path = os.path.join(folder.name, "article.pdf")
+        make_pdf(self.file_path, [["Page {} line {} of the body".format(p, i) for i in range(40)]
+                                  for p in range(1, 11)])
+        self.streamed = []
+        patcher = mock.patch('artemis.iter_pages', self.counting_iter_pages)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counting_iter_pages(self, *args, **kwargs):
+        for number, text in pdftext.iter_pages(*args, **kwargs):
+            self.streamed.append(number)
+            yield number, text
+
+    def parser(self, **kwargs):
+        p = PdfParser(self.file_path, **kwargs)
+        self.addCleanup(p.file.close)
+        return p
+
+    def test_streaming_stops_once_min_length_is_reached(self):
+        p = self.parser(front_matter_pages=0)
+        page_length = len(p.extract_pages(1, 1)[0])
+        self.assertGreaterEqual(p.measure_extracted_text(2 * page_length), 2 * page_length)
+        self.assertEqual([2], self.streamed)
+
+    def test_front_matter_pages_are_not_extracted_again(self):
+        p = self.parser(front_matter_pages=3)
+        self.assertIsNotNone(p.artifacts.get('front_matter_text'))
+        self.assertEqual({1, 2, 3, 8, 9, 10}, set(p.page_texts))
+        p.measure_extracted_text(10 ** 6)
+        self.assertEqual([4, 5, 6, 7, 8, 9, 10], self.streamed)
+
+    def test_full_text_is_joined_by_form_feeds(self):
+        p = self.parser()
+        pages = p.extract_text().split("\f")
+        self.assertEqual(10, len(pages))
+        self.assertIn("Page 10 line 39", pages[-1])
+
+    def test_pdfminer_is_used_without_pdftotext(self):
+        with mock.patch('utils.pdftext.extract_page_range_with_pdftotext', side_effect=OSError("not found")):
+            texts = pdftext.extract_page_range(self.file_path, 9, 10)
+        self.assertEqual(2, len(texts))
+        self.assertIn("Page 9 line 0", texts[0])
+
+    def test_split_pages(self):
+        self.assertEqual(["a", "b", ""], pdftext.split_pages("a\fb\f", 3))
+        self.assertEqual(["a", "b"], pdftext.split_pages("a\fb\fc", 2))
+
+
+class TestParse(unittest.TestCase):
+    title = "Radiation and decline of endodontid land snails"
+    cermine_tests = ['test_valid_doi_in_cermine_xml', 'test_title_match_cermxml']
+
+    def setUp(self):
+        folder = TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.file_path = os.path.join(folder.name, "article.pdf")
+        make_pdf(self.file_path, [[self.title]] + [["Page {} line {} of the body of the article".format(p, i)
+                                                    for i in range(45)] for p in range(2, 11)])
+        self.short_file_path = os.path.join(folder.name, "short.pdf")
+        make_pdf(self.short_file_path, [[self.title]])
+        self.pool = StandInCerminePool()
+        for target, value in [('artemis.get_cermine_pool', self.pool),
+                              ('artemis.get_logo_index', LogoIndex.from_logos([]))]:
+            patcher = mock.patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def parser(self, file_path=None, **kwargs):
+        p = PdfParser(file_path or self.file_path, dec_ms_title=self.title, dec_version="accepted manuscript",
+                      **kwargs)
+        self.addCleanup(p.file.close)
+        return p
+
+    def test_reported_tests_run_by_default(self):
+        result = json.loads(self.parser().parse())
+        self.assertEqual(set(PDF_DEFAULT_TESTS) - set(self.cermine_tests) - {'test_valid_doi_in_extracted_text'},
+                         set(result['test_results']))
+        self.assertEqual([], self.pool.runs)
+        self.assertTrue(result['approve_deposit'])
+
+    def test_all_tests_run_with_full_evidence(self):
+        result = json.loads(self.parser(full_evidence=True).parse())
+        # no DOI is found in the file
+        self.assertEqual(set(PDF_DEFAULT_TESTS) - {'test_valid_doi_in_extracted_text', 'test_valid_doi_in_cermine_xml'},
+                         set(result['test_results']))
+        self.assertEqual([{'jats'}], self.pool.runs)
+        self.assertTrue(result['test_results']['test_title_match_cermxml'])
+        self.assertTrue(result['approve_deposit'])
+
+    def test_tests_run_cheapest_first(self):
+        p = self.parser()
+        with mock.patch.object(p, 'run_test', wraps=p.run_test) as run_test:
+            p.parse()
+        costs = [PDF_TESTS[c[0][0]]['cost'] for c in run_test.call_args_list]
+        self.assertEqual(sorted(costs), costs)
+
+    def test_tests_that_cannot_change_decision_are_skipped(self):
+        result = json.loads(self.parser(self.short_file_path).parse())
+        self.assertFalse(result['test_results']['test_length_of_extracted_text'])
+        self.assertNotIn('test_title_match_in_extracted_text', result['test_results'])
+        self.assertNotIn('find_cc_statement_in_extracted_text', result['test_results'])
+        self.assertIn('find_version_statements_in_extracted_text', result['test_results'])
+        self.assertFalse(result['approve_deposit'])
+
+    def test_artifacts_of_skipped_tests_are_not_produced(self):
+        p = self.parser(self.short_file_path, tests=['test_length_of_extracted_text',
+                                                     'find_cc_statement_in_extracted_text'])
+        result = json.loads(p.parse())
+        self.assertEqual(['test_length_of_extracted_text'], list(result['test_results']))
+        self.assertFalse(p.artifacts.has('pattern_hits'))
+
+    def test_doi_tests_are_not_reported_without_doi(self):
+        result = json.loads(self.parser(full_evidence=True).parse())
+        self.assertNotIn('test_valid_doi_in_extracted_text', result['test_results'])
+        self.assertNotIn('test_valid_doi_in_cermine_xml', result['test_results'])
+
+    def test_tests_are_inconclusive_when_cermine_fails(self):
+        p = self.parser()
+        p.parse()
+        self.assertEqual([], p.inconclusive_tests)
+        p = self.parser(full_evidence=True)
+        with mock.patch.object(self.pool, 'extract', return_value=False):
+            p.parse()
+        self.assertEqual(set(self.cermine_tests), set(p.inconclusive_tests))
+
+
+if __name__ == '__main__':
+    unittest.main()
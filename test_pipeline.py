@@ -0,0 +1,73 @@
+import threading
+import unittest
+from concurrent.futures import CancelledError
+
+from utils.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def test_stages_run_after_their_dependencies(self):
+        finished = []
+        pipeline = Pipeline()
+        pipeline.add_stage('text', lambda: finished.append('text') or "text")
+        pipeline.add_stage('hits', lambda: finished.append('hits') or "hits of " + pipeline.result('text'),
+                           ['text'])
+        results = pipeline.run()
+        self.assertEqual({'text': "text", 'hits': "hits of text"}, results)
+        self.assertEqual(['text', 'hits'], finished)
+
+    def test_independent_stages_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+        pipeline = Pipeline(max_workers=2)
+        pipeline.add_stage('metadata', lambda: barrier.wait() is not None)
+        pipeline.add_stage('cermine', lambda: barrier.wait() is not None)
+        self.assertEqual({'metadata': True, 'cermine': True}, pipeline.run())
+
+    def test_failed_stage(self):
+        def fail():
+            raise ValueError("malformed PDF")
+
+        pipeline = Pipeline()
+        pipeline.add_stage('text', fail)
+        pipeline.add_stage('hits', lambda: "ran anyway", ['text'])
+        with pipeline:
+            with self.assertRaises(ValueError):
+                pipeline.result('text')
+            # dependents of a failed stage still run
+            self.assertEqual("ran anyway", pipeline.result('hits', timeout=5))
+        pipeline = Pipeline()
+        pipeline.add_stage('text', fail)
+        pipeline.add_stage('hits', lambda: "ran anyway", ['text'])
+        self.assertEqual({'hits': "ran anyway"}, pipeline.run())
+
+    def test_stages_not_started_are_cancelled_on_close(self):
+        release = threading.Event()
+        pipeline = Pipeline()
+        pipeline.add_stage('cermine', lambda: release.wait(5))
+        pipeline.add_stage('cermxml', lambda: "parsed", ['cermine'])
+        pipeline.start()
+        threading.Timer(0.2, release.set).start()
+        pipeline.close()
+        self.assertTrue(pipeline.result('cermine'))
+        with self.assertRaises(CancelledError):
+            pipeline.result('cermxml')
+
+    def test_invalid_graphs(self):
+        pipeline = Pipeline()
+        pipeline.add_stage('a', lambda: None, ['b'])
+        pipeline.add_stage('b', lambda: None, ['a'])
+        with self.assertRaises(ValueError):
+            pipeline.start()
+        pipeline = Pipeline()
+        pipeline.add_stage('a', lambda: None, ['unknown'])
+        with self.assertRaises(ValueError):
+            pipeline.start()
+
+    def test_stages_cannot_be_added_once_started(self):
+        with Pipeline() as pipeline:
+            with self.assertRaises(RuntimeError):
+                pipeline.add_stage('late', lambda: None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import random
+import unittest
+
+from utils.approximate import ApproximateMatcher
+from utils.scanner import PatternHit, PatternScanner, ScanPattern, default_scan_patterns
+from utils.text import NormalisedText
+
+
+class TestPatternScanner(unittest.TestCase):
+    def setUp(self):
+        self.scanner = PatternScanner([
+            ScanPattern('cc by', 'cc_licence', "CC BY", priority=1),
+            ScanPattern('cc by-nc', 'cc_licence', "CC BY-NC", priority=0),
+            ScanPattern('accepted', 'version', "accepted for publication", error_ratio=0.1),
+            ScanPattern('long name', 'cc_licence', "Creative Commons Attribution-NonCommercial", error_ratio=0.1),
+            ScanPattern('doi', 'doi', r"10\.\d{4,9}/\S+", literal=False),
+        ])
+
+    def names(self, text, spans=None):
+        return [h.scan_pattern.name for h in self.scanner.scan(text, spans)]
+
+    def test_exact_hits(self):
+        hits = self.scanner.scan("Licensed under CC BY. See doi 10.1234/abc.5")
+        self.assertEqual(['cc by', 'doi'], [h.scan_pattern.name for h in hits])
+        self.assertEqual("CC BY", hits[0].match)
+        self.assertEqual(0, hits[0].errors)
+        self.assertEqual("10.1234/abc.5", hits[1].match)
+
+    def test_exact_patterns_ignore_case_but_allow_no_errors(self):
+        self.assertEqual(['cc by'], self.names("licence: cc by"))
+        self.assertEqual([], self.names("licence: CC B Y"))
+
+    def test_one_error(self):
+        hits = self.scanner.scan("This version was acepted for publication in May")
+        self.assertEqual(['accepted'], [h.scan_pattern.name for h in hits])
+        self.assertEqual(1, hits[0].errors)
+
+    def test_maximum_errors(self):
+        pattern = "Creative Commons Attribution-NonCommercial"
+        self.assertEqual(3, self.scanner.matchers['long name'].max_errors)
+        hits = self.scanner.scan("under a Creatve Comons Atribution-NonCommercial licence")
+        self.assertEqual(['long name'], [h.scan_pattern.name for h in hits])
+        self.assertEqual(3, hits[0].errors)
+        self.assertNotIn('long name', self.names("under a Creatve Comons Atribution-NonComercial licence"))
+        self.assertEqual(['long name'], self.names(pattern))
+
+    def test_longest_overlapping_hit_of_a_category_is_kept(self):
+        self.assertEqual(['cc by-nc'], self.names("Licence: CC BY-NC 4.0"))
+
+    def test_hits_overlapping_an_earlier_long_hit_are_removed(self):
+        long_hit = ScanPattern('long', 'c', "x" * 100)
+        short = ScanPattern('short', 'c', "y")
+        other = ScanPattern('other', 'd', "y")
+        hits = [PatternHit(long_hit, 0, 100, "", 0)] + \
+               [PatternHit(short, i, i + 1, "", 0) for i in range(10, 200, 5)] + [PatternHit(other, 50, 51, "", 0)]
+        kept = PatternScanner.remove_overlapping_hits(hits)
+        self.assertEqual([(0, 100), (50, 51)] + [(i, i + 1) for i in range(100, 200, 5)],
+                         [(h.start, h.end) for h in kept])
+
+    def test_hits_across_page_boundary(self):
+        t = NormalisedText.from_pages(["The article was accepted", "for publication on 1 May", "body", "body"])
+        self.assertEqual(['accepted'], self.names(t.text, t.spans_of_pages([(1, 2)])))
+        self.assertEqual([], self.names(t.text, t.spans_of_pages([(2, 2)])))
+
+    def test_scan_is_restricted_to_spans(self):
+        t = NormalisedText.from_pages(["CC BY", "body", "body", "CC BY-NC"])
+        self.assertEqual(['cc by', 'cc by-nc'], self.names(t.text))
+        self.assertEqual(['cc by-nc'], self.names(t.text, t.spans_of_pages([(-1, -1)])))
+
+    def test_hits_agree_with_approximate_matcher(self):
+        r = random.Random(0)
+        alphabet = "abcd "
+        for _ in range(100):
+            patterns = []
+            for i in range(4):
+                pattern = "".join(r.choice(alphabet) for _ in range(r.randint(5, 25)))
+                patterns.append(ScanPattern("p{}".format(i), "c{}".format(i), pattern,
+                                            error_ratio=r.choice([0, 0.1, 0.2])))
+            text = "".join(r.choice(alphabet) for _ in range(r.randint(0, 200)))
+            for p in patterns:
+                if r.random() < 0.5:
+                    planted = list(p.pattern)
+                    planted[r.randrange(len(planted))] = r.choice(alphabet)
+                    i = r.randint(0, len(text))
+                    text = text[:i] + "".join(planted) + text[i:]
+            found = {h.scan_pattern.name for h in PatternScanner(patterns).scan(text)}
+            for p in patterns:
+                expected = ApproximateMatcher(p.pattern, p.max_errors).search(text) is not None
+                self.assertEqual(expected, p.name in found, (p.pattern, p.max_errors, text))
+
+
+class TestDefaultScanPatterns(unittest.TestCase):
+    def test_names_are_unique(self):
+        names = [p.name for p in default_scan_patterns()]
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_additional_cc_patterns_are_not_decisive(self):
+        patterns = [p for p in default_scan_patterns() if p.name.startswith("additional cc pattern")]
+        self.assertTrue(patterns)
+        self.assertEqual({'additional_cc_licence'}, {p.category for p in patterns})
+
+
+if __name__ == '__main__':
+    unittest.main()
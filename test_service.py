@@ -0,0 +1,179 @@
+import http.client
+import json
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from utils.service import ArtemisHTTPServer, ArtemisService, ServiceUnavailable
+
+
+class StandInJobs:
+    """
+    Stand-in for utils.batch.run_job: answers with the job it was given, once released
+    """
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, job, options):
+        self.release.wait(5)
+        return json.dumps({'input_path': job['path'], 'title': job['title'], 'approve_deposit': True})
+
+
+def crashing_run_job(job, options):
+    """
+    Stand-in for utils.batch.run_job (run in worker processes): the worker dies on crash.pdf
+    """
+    if os.path.basename(job['path']) == 'crash.pdf':
+        os._exit(1)
+    return json.dumps({'input_path': job['path'], 'approve_deposit': True})
+
+
+class LightService(ArtemisService):
+    """
+    ArtemisService whose worker processes do not import Artemis
+    """
+    def make_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers)
+
+
+class TestArtemisService(unittest.TestCase):
+    def setUp(self):
+        self.jobs = StandInJobs()
+        patcher = mock.patch('utils.service.run_job', self.jobs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = ArtemisService(workers=1, queue_size=1, executor=ThreadPoolExecutor(max_workers=1))
+        self.server = ArtemisHTTPServer(self.service, port=0)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.jobs.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        :return: Tuple of status and decoded JSON body of response
+        """
+        connection = http.client.HTTPConnection(*self.server.server_address, timeout=5)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read().decode('utf-8'))
+        finally:
+            connection.close()
+
+    def post_json(self, record, query=''):
+        return self.request('POST', '/jobs' + query, json.dumps(record), {'Content-Type': 'application/json'})
+
+    def test_json_body_that_is_not_an_object_is_rejected(self):
+        for body in ['[1]', '"x"', 'null']:
+            status, response = self.request('POST', '/jobs', body, {'Content-Type': 'application/json'})
+            self.assertEqual(400, status)
+            self.assertIn('error', response)
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(400, self.post_json({'title': 'No path'})[0])
+        self.assertEqual(400, self.request('POST', '/jobs', b'data', {'Content-Type': 'text/plain'})[0])
+        self.assertEqual(400, self.request('POST', '/jobs', '{', {'Content-Type': 'application/json'})[0])
+        self.assertEqual(404, self.request('GET', '/jobs/unknown')[0])
+
+    def test_wait_returns_result(self):
+        status, response = self.post_json({'path': '/tmp/article.pdf', 'title': 'A title'}, '?wait=1')
+        self.assertEqual(200, status)
+        self.assertEqual({'input_path': '/tmp/article.pdf', 'title': 'A title', 'approve_deposit': True}, response)
+
+    def test_uploaded_file_is_checked(self):
+        status, response = self.request('POST', '/jobs?wait=1&title=Uploaded', b'%PDF-1.4',
+                                        {'Content-Type': 'application/pdf'})
+        self.assertEqual(200, status)
+        self.assertTrue(response['input_path'].endswith('upload.pdf'))
+        self.assertEqual('Uploaded', response['title'])
+
+    def test_job_can_be_polled(self):
+        self.jobs.release.clear()
+        status, response = self.post_json({'path': '/tmp/article.pdf'})
+        self.assertEqual(202, status)
+        self.assertIn(response['status'], ['queued', 'running'])
+        job_path = '/jobs/{}'.format(response['job_id'])
+        self.assertIn(self.request('GET', job_path)[1]['status'], ['queued', 'running'])
+        self.jobs.release.set()
+        for _ in range(50):
+            status, response = self.request('GET', job_path)
+            if response['status'] == 'done':
+                break
+            time.sleep(0.1)
+        self.assertEqual(200, status)
+        self.assertEqual('done', response['status'])
+        self.assertEqual('/tmp/article.pdf', response['result']['input_path'])
+
+    def test_full_queue_is_refused(self):
+        self.jobs.release.clear()
+        self.assertEqual(202, self.post_json({'path': '/tmp/a.pdf'})[0])
+        self.assertEqual(202, self.post_json({'path': '/tmp/b.pdf'})[0])
+        status, response = self.post_json({'path': '/tmp/c.pdf'})
+        self.assertEqual(429, status)
+        self.assertIn('error', response)
+        self.assertEqual(2, self.request('GET', '/health')[1]['pending'])
+
+
+class TestWorkerCrash(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('utils.service.run_job', crashing_run_job)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = LightService(workers=1, queue_size=1)
+        self.addCleanup(self.service.close)
+
+    def test_service_recovers_from_crashed_worker(self):
+        crashed = self.service.submit({'path': '/tmp/crash.pdf'})
+        result = crashed.result(timeout=10)
+        self.assertEqual('BrokenProcessPool', result['error_type'])
+        self.assertEqual('failed', crashed.describe()['status'])
+        for _ in range(50):  # finish runs in a callback once the future fails
+            if self.service.stats()['pending'] == 0:
+                break
+            time.sleep(0.1)
+        self.assertEqual(0, self.service.stats()['pending'])
+        job = self.service.submit({'path': '/tmp/article.pdf'})
+        self.assertEqual({'input_path': '/tmp/article.pdf', 'approve_deposit': True}, job.result(timeout=10))
+
+    def test_broken_executor_is_replaced_on_submit(self):
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool("A child process terminated abruptly")
+        self.service.executor.shutdown()
+        self.service.executor = broken
+        job = self.service.submit({'path': '/tmp/article.pdf'})
+        self.assertTrue(job.result(timeout=10)['approve_deposit'])
+        broken.shutdown.assert_called_once_with(wait=False)
+
+    def test_unavailable_workers_are_reported(self):
+        with mock.patch.object(self.service, 'make_executor') as make_executor:
+            make_executor.return_value.submit.side_effect = BrokenProcessPool("Could not start workers")
+            self.service.executor.shutdown()
+            self.service.executor = make_executor()
+            with self.assertRaises(ServiceUnavailable):
+                self.service.submit({'path': '/tmp/article.pdf'})
+        self.assertEqual(0, self.service.stats()['pending'])
+        server = ArtemisHTTPServer(self.service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        connection = http.client.HTTPConnection(*server.server_address, timeout=5)
+        self.addCleanup(connection.close)
+        with mock.patch.object(self.service, 'submit', side_effect=ServiceUnavailable("No workers")):
+            connection.request('POST', '/jobs', json.dumps({'path': '/tmp/article.pdf'}),
+                               {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+        self.assertEqual(503, response.status)
+        self.assertEqual({'error': "No workers"}, json.loads(response.read().decode('utf-8')))
+
+
+if __name__ == '__main__':
+    unittest.main()
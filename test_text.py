@@ -0,0 +1,80 @@
+import unittest
+
+from utils.text import NormalisedText, normalise
+
+
+class TestNormalisedText(unittest.TestCase):
+    def test_normalisation(self):
+        t = NormalisedText("The ﬁrst  ver-\nsion\nof the manu­script")
+        self.assertEqual("The first version of the manuscript", t.text)
+
+    def test_offsets_map_back_to_original(self):
+        original = "Accepted  manu-\nscript ofﬁcial\n\nversion"
+        t = NormalisedText(original)
+        self.assertEqual("Accepted manuscript official version", t.text)
+        start = t.text.index("manuscript")
+        s, e = t.original_span(start, start + len("manuscript"))
+        self.assertEqual("manu-\nscript", original[s:e])
+        start = t.text.index("official")
+        s, e = t.original_span(start, start + len("official"))
+        self.assertEqual("ofﬁcial", original[s:e])
+        for i, c in enumerate(t.text):
+            if c not in " fi":
+                self.assertEqual(c, original[t.offsets[i]])
+
+    def test_normalised_offset(self):
+        original = "a  b\n\nc"
+        t = NormalisedText(original)
+        self.assertEqual("a b c", t.text)
+        self.assertEqual(2, t.normalised_offset(original.index("b")))
+        self.assertEqual(4, t.normalised_offset(original.index("c")))
+
+    def test_pages_from_form_feeds(self):
+        t = NormalisedText("first page\fsecond page\fthird page\f")
+        self.assertTrue(t.has_page_breaks)
+        self.assertEqual(3, t.number_of_pages)
+        self.assertEqual("first page ", t.text[slice(*t.page_span(1))])
+        self.assertEqual("third page ", t.text[slice(*t.page_span(-1))])
+        self.assertEqual("second page third page ", t.text[slice(*t.page_span(2, -1))])
+        self.assertEqual(2, t.page_of(t.text.index("second")))
+
+    def test_explicit_pages_keep_blank_last_page(self):
+        t = NormalisedText.from_pages(["title page", "body", "licence statement", ""])
+        self.assertEqual(4, t.number_of_pages)
+        start, end = t.page_span(-2)
+        self.assertIn("licence statement", t.text[start:end])
+        self.assertEqual(t.page_span(-2, -1), t.spans_of_pages([(-2, -1)])[0])
+
+    def test_match_across_page_boundary(self):
+        t = NormalisedText.from_pages(["This article was accepted for", "publication in the journal"])
+        start = t.text.index("accepted for publication")
+        end = start + len("accepted for publication")
+        self.assertEqual(1, t.page_of(start))
+        self.assertEqual(2, t.page_of(end - 1))
+        page_1, page_2 = t.page_span(1), t.page_span(2)
+        self.assertTrue(page_1[0] <= start < page_1[1] <= end <= page_2[1])
+        self.assertEqual([(page_1[0], page_2[1])], t.spans_of_pages([(1, 1), (2, 2)]))
+
+    def test_hyphenation_across_page_boundary(self):
+        t = NormalisedText("accepted manu-\fscript")
+        self.assertEqual("accepted manuscript", t.text)
+        self.assertEqual(2, t.number_of_pages)
+        self.assertEqual(2, t.page_of(t.text.index("script")))
+
+    def test_estimated_pages_without_page_breaks(self):
+        t = NormalisedText("x" * 250, estimated_page_length=100)
+        self.assertFalse(t.has_page_breaks)
+        self.assertEqual(3, t.number_of_pages)
+        self.assertEqual((200, 250), t.page_span(-1))
+        self.assertEqual(2, t.page_of(150))
+
+
+
+class TestNormalise(unittest.TestCase):
+    def test_multi_line_title(self):
+        self.assertEqual("Radiation of endodontid land snails in Makatea",
+                         normalise("  Radiation of endo-\ndontid land\n  snails in  Makatea\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
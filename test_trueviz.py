@@ -0,0 +1,210 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import numpy
+
+from utils.TrueViz import Character, Document, Geometry, Page, Zone, index_pages
+
+
+def corners(tag, box):
+    left, top, right, bottom = box
+    return '<{0}Corners><Vertex x="{1}" y="{2}"/><Vertex x="{3}" y="{2}"/><Vertex x="{3}" y="{4}"/>' \
+           '<Vertex x="{1}" y="{4}"/></{0}Corners>'.format(tag, left, top, right, bottom)
+
+
+def body_zone(lines, left=72, top=72, line_height=10, spacing=14, category="BODY_CONTENT"):
+    """
+    :param lines: List of the words of each line
+    :return: Description of a zone whose lines are spacing pt apart, starting at (left, top), for make_cermstr
+    """
+    return {'category': category, 'left': left, 'top': top, 'line_height': line_height, 'spacing': spacing,
+            'lines': lines}
+
+
+def make_cermstr(path, pages, page_ids=None):
+    """
+    Writes a TrueViz file with a page for each item of pages (a list of zones; see body_zone)
+    :param page_ids: IDs of pages (their positions if None)
+    """
+    ids = iter(range(1, 1000000))
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<Document>']
+    for page_id, zones in zip(page_ids or range(len(pages)), pages):
+        parts.append('<Page><PageID Value="{}"/>'.format(page_id))
+        for zone in zones:
+            zone_parts = []
+            right = zone['left']
+            for n, words in enumerate(zone['lines']):
+                top = zone['top'] + n * zone['spacing']
+                bottom = top + zone['line_height']
+                line_parts = []
+                x = zone['left']
+                for word in words:
+                    word_box = (x, top, x + 5 * len(word), bottom)
+                    characters = "".join(
+                        '<Character><CharacterID Value="{}"/>{}<GT_Text Value="{}"/></Character>'.format(
+                            next(ids), corners("Character", (x + 5 * i, top, x + 5 * i + 5, bottom)), c)
+                        for i, c in enumerate(word))
+                    line_parts.append('<Word><WordID Value="{}"/>{}{}</Word>'.format(
+                        next(ids), corners("Word", word_box), characters))
+                    x = word_box[2] + 5
+                right = max(right, x - 5)
+                zone_parts.append('<Line><LineID Value="{}"/>{}{}</Line>'.format(
+                    next(ids), corners("Line", (zone['left'], top, x - 5, bottom)), "".join(line_parts)))
+            bottom = zone['top'] + (len(zone['lines']) - 1) * zone['spacing'] + zone['line_height']
+            parts.append('<Zone><ZoneID Value="{}"/>{}<Classification><Category Value="{}"/></Classification>{}'
+                         '</Zone>'.format(next(ids), corners("Zone", (zone['left'], zone['top'], right, bottom)),
+                                          zone['category'], "".join(zone_parts)))
+        parts.append('</Page>\n')
+    parts.append('</Document>\n')
+    with open(path, 'w') as f:
+        f.write("".join(parts))
+
+
+class TestPageIndex(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, "article.cermstr")
+        make_cermstr(self.path, [[body_zone([["Page", str(i)]])] for i in range(5)])
+
+    def test_index_pages(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        offsets = index_pages(self.path)
+        self.assertEqual(5, len(offsets))
+        self.assertTrue(all(data[o:o + 6] == b"<Page>" for o in offsets))
+        # page tags split between chunks are found once
+        for read_size in [3, 5, 7, 64]:
+            with mock.patch('utils.TrueViz.READ_SIZE', read_size):
+                self.assertEqual(offsets, index_pages(self.path))
+
+    def test_only_requested_pages_are_parsed(self):
+        document = Document(self.path)
+        self.assertEqual(5, document.number_of_pages)
+        self.assertEqual(2, document.middle_page)
+        pages = document.load_pages([1, 3, 9])
+        self.assertEqual({'1', '3'}, set(pages))
+        self.assertEqual({'1', '3'}, set(document.pages))
+        self.assertEqual(["Page", "3"], [w.text for w in pages['3'].children[0].children[0].children])
+        with mock.patch.object(document, 'parse_indexed_pages') as parse:
+            self.assertIs(pages['1'], document.load_pages([1])['1'])
+            parse.assert_not_called()
+
+    def test_pages_are_streamed_if_they_cannot_be_parsed_on_their_own(self):
+        path = os.path.join(self.folder.name, "renumbered.cermstr")
+        make_cermstr(path, [[body_zone([["Page", str(i)]])] for i in range(3)], page_ids=[2, 0, 1])
+        document = Document(path)
+        with mock.patch.object(document, 'stream_pages', wraps=document.stream_pages) as stream:
+            pages = document.load_pages([0, 1])
+            stream.assert_called_once()
+        self.assertEqual({'0', '1'}, set(pages))
+        self.assertEqual(["Page", "1"], [w.text for w in pages['0'].children[0].children[0].children])
+        self.assertEqual(["Page", "2"], [w.text for w in pages['1'].children[0].children[0].children])
+
+
+class TestElements(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, "article.cermstr")
+        make_cermstr(self.path, [[body_zone([["1", "Title"]], category="MET_TITLE"),
+                                  body_zone([["Body", "text"]], top=200)]])
+        self.document = Document(self.path)
+        self.page = self.document.load_pages([0])['0']
+
+    def test_children_are_created_once_on_request(self):
+        self.assertIsInstance(self.page, Page)
+        self.assertIsNone(self.page._children)
+        zones = self.page.children
+        self.assertIsNone(self.page._element)  # the XML of the page is released
+        self.assertIs(zones, self.page.children)
+        self.assertEqual([Zone, Zone], [type(z) for z in zones])
+        self.assertEqual(["MET_TITLE", "BODY_CONTENT"], [z.category for z in zones])
+        self.assertEqual((72, 200, 117, 210), zones[1].box)
+        self.assertIsNotNone(zones[1]._element)  # lines of zones not visited yet are not created
+
+    def test_hierarchy(self):
+        word = self.page.children[1].children[0].children[1]
+        self.assertEqual("text", word.text)
+        characters = word.children
+        self.assertEqual([Character] * 4, [type(c) for c in characters])
+        self.assertEqual([], characters[0].children)
+        self.assertIs(self.document, self.page.parent)
+        self.assertIs(word, characters[0].parent)
+        self.assertIs(self.page, self.page.children[0].parent)
+
+    def test_elements_have_no_instance_dictionaries(self):
+        zone = self.page.children[0]
+        for element in [self.page, zone, zone.children[0], zone.children[0].children[0],
+                        zone.children[0].children[0].children[0]]:
+            self.assertFalse(hasattr(element, '__dict__'), type(element).__name__)
+
+    def test_parents_are_weak_references(self):
+        zone = self.page.children[0]
+        del self.document.pages['0']
+        del self.page
+        self.assertIsNone(zone.parent)
+
+
+class TestGeometry(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, "article.cermstr")
+        make_cermstr(self.path, [[body_zone([["1", "Title"]], category="MET_TITLE"),
+                                  body_zone([["Page", str(i)], ["of", "text"]], top=200)] for i in range(5)])
+
+    def test_geometry_of_pages(self):
+        geometry = Document(self.path).geometry([3, 1, 7])
+        self.assertEqual(5, geometry.number_of_pages)
+        self.assertEqual([1, 3, 7], geometry.page_ids)
+        self.assertEqual(["MET_TITLE", "BODY_CONTENT"], geometry.categories)
+        self.assertEqual([1, 1, 3, 3], list(geometry.zone_pages))
+        self.assertEqual([1, -1, -1, 1, -1, -1], list(geometry.line_numbers))
+        self.assertEqual([72, 200, 102, 210], list(geometry.line_boxes[1]))
+
+    def test_save_and_load(self):
+        geometry = Document(self.path).geometry([1, 2])
+        path = os.path.join(self.folder.name, "article.geometry.npz")
+        geometry.save(path)
+        loaded = Geometry.load(path)
+        self.assertEqual((geometry.number_of_pages, geometry.page_ids, geometry.categories),
+                         (loaded.number_of_pages, loaded.page_ids, loaded.categories))
+        for name in ['zone_pages', 'zone_categories', 'zone_boxes', 'line_zones', 'line_boxes', 'line_numbers',
+                     'word_lines', 'word_boxes']:
+            numpy.testing.assert_array_equal(getattr(geometry, name), getattr(loaded, name))
+        self.assertEqual(geometry.layout_features(), loaded.layout_features())
+        with mock.patch('utils.TrueViz.GEOMETRY_VERSION', 1):
+            with self.assertRaises(ValueError):
+                Geometry.load(path)
+
+
+class TestLayoutFeatures(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, "article.cermstr")
+
+    def features(self, pages):
+        make_cermstr(self.path, pages)
+        return Document(self.path).detect_layout_features()
+
+    def test_numbering_restarting_in_each_column(self):
+        column = [[str(n + 1), "of", "the", "column"] for n in range(20)]
+        features = self.features([[body_zone(column), body_zone(column, left=320)] for _ in range(5)])
+        self.assertEqual({'line_spacing': 1.4, 'two_columns': True, 'numbered_lines': True}, features)
+
+    def test_numbers_out_of_sequence(self):
+        lines = [[str(n)] + ["manuscripts"] * 6 for n in [3, 1, 4, 1, 5, 9, 2, 6, 5, 3]] * 2
+        features = self.features([[body_zone(lines, spacing=20)] for _ in range(5)])
+        self.assertEqual({'line_spacing': 2.0, 'two_columns': False, 'numbered_lines': False}, features)
+
+    def test_too_few_words(self):
+        features = self.features([[body_zone([["1", "short"], ["2", "zone"]])] for _ in range(5)])
+        self.assertEqual({'line_spacing': 1.4, 'two_columns': None, 'numbered_lines': None}, features)
+
+
+if __name__ == '__main__':
+    unittest.main()
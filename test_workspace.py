@@ -0,0 +1,68 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from utils.workspace import JobWorkspace, link_file
+
+
+class TestLinkFile(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.source = os.path.join(self.folder.name, "article.pdf")
+        with open(self.source, 'wb') as f:
+            f.write(b"%PDF-1.4")
+        self.destination = os.path.join(self.folder.name, "linked.pdf")
+
+    def test_hardlink(self):
+        link_file(self.source, self.destination)
+        self.assertTrue(os.path.samefile(self.source, self.destination))
+        self.assertFalse(os.path.islink(self.destination))
+
+    def test_symlink_if_hardlinks_are_not_supported(self):
+        with mock.patch('utils.workspace.os.link', side_effect=OSError("cross-device link")):
+            link_file(self.source, self.destination)
+        self.assertTrue(os.path.islink(self.destination))
+        self.assertTrue(os.path.samefile(self.source, self.destination))
+
+    def test_copy_if_links_are_not_supported(self):
+        with mock.patch('utils.workspace.os.link', side_effect=OSError("cross-device link")), \
+                mock.patch('utils.workspace.os.symlink', side_effect=OSError("not permitted")):
+            link_file(self.source, self.destination)
+        self.assertFalse(os.path.islink(self.destination))
+        self.assertFalse(os.path.samefile(self.source, self.destination))
+        with open(self.destination, 'rb') as f:
+            self.assertEqual(b"%PDF-1.4", f.read())
+
+
+class TestJobWorkspace(unittest.TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        for name in ["article.pdf", "other.pdf"]:
+            with open(os.path.join(self.folder.name, name), 'wb') as f:
+                f.write(b"%PDF-1.4")
+        self.file_path = os.path.join(self.folder.name, "article.pdf")
+        self.base_folder = os.path.join(self.folder.name, "work")
+
+    def test_workspace_only_holds_input_file(self):
+        with JobWorkspace(self.file_path, base_folder=self.base_folder) as ws:
+            self.assertEqual(["article.pdf"], os.listdir(ws.path))
+            self.assertEqual(os.path.join(ws.path, "article.pdf"), ws.target_file)
+        self.assertFalse(os.path.exists(ws.path))
+        self.assertTrue(os.path.exists(self.file_path))
+
+    def test_workspaces_of_jobs_are_separate(self):
+        with JobWorkspace(self.file_path, base_folder=self.base_folder) as first, \
+                JobWorkspace(self.file_path, base_folder=self.base_folder) as second:
+            self.assertNotEqual(first.path, second.path)
+
+    def test_workspace_is_kept_on_request(self):
+        with JobWorkspace(self.file_path, base_folder=self.base_folder, keep=True) as ws:
+            pass
+        self.assertTrue(os.path.exists(ws.target_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+
+import pl.edu.icm.cermine.ContentExtractor;
+
+/**
+ * Long-lived CERMINE worker used by utils/cermine.py.
+ *
+ * Reads one job per line from stdin, in the form "directory\toutputs", runs CERMINE's ContentExtractor on it
+ * and answers with a single "OK" or "ERROR <message>" line. Anything CERMINE prints itself is redirected to
+ * stderr, so that stdout only carries the protocol.
+ */
+public class CermineWorker {
+    public static void main(String[] args) throws Exception {
+        PrintStream protocol = System.out;
+        System.setOut(System.err);
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        protocol.println("READY");
+        protocol.flush();
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] job = line.split("\t", 2);
+            if (job.length != 2) {
+                protocol.println("ERROR malformed job: " + line);
+            } else {
+                try {
+                    ContentExtractor.main(new String[]{"-path", job[0], "-outputs", job[1]});
+                    protocol.println("OK");
+                } catch (Throwable t) {
+                    protocol.println("ERROR " + t.toString().replace('\n', ' '));
+                }
+            }
+            protocol.flush();
+        }
+    }
+}
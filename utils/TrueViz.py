@@ -1,55 +1,173 @@
-import logging
-import logging.config
 import math
 import os
 import regex
-import requests
-import statistics
+import weakref
 import xml.etree.ElementTree as ET
-from collections import Counter
 
-logging.config.fileConfig('logging.conf', defaults={'logfilename':'TrueViz.log'})
-logger = logging.getLogger(__name__)
+import numpy
+
+from utils.common import get_logger
+
+logger = get_logger()
 
 # https://www.slideshare.net/dtkaczyk/tkaczyk-grotoap2slides
 
 
+# start tags of pages, which are children of the root element of TrueViz files
+PAGE_START_PATTERN = regex.compile(rb"<Page[\s>]")
+PAGE_START_LENGTH = len(b"<Page>")
+READ_SIZE = 1024 * 1024
+GEOMETRY_VERSION = 3  # of the files Geometry.save writes
+NUMBER_PATTERN = regex.compile(r"\d+")
+
+# layout features (see Geometry.layout_features)
+MIN_WORDS_PER_ZONE = 50  # body content zones with fewer words are not analysed
+WIDE_ZONE_WIDTH = 312  # c. 110 mm in pt; body content zones wider than this span a single-column page
+MIN_NUMBERED_LINES = 5  # fewer lines starting with a number may be a coincidence (e.g. numbered lists)
+MAX_NUMBERED_LINES_EXCEPTIONS = 3  # numbers out of sequence or out of alignment tolerated in numbered lines
+MAX_LINE_NUMBER_OFFSET = 10  # pt; maximum horizontal offset between consecutive line numbers
+
+
+def index_pages(cermstr_path):
+    """
+    Finds where pages start in a TrueViz file, without parsing it
+    :return: List of the byte offsets of the start tags of each page
+    """
+    offsets = []
+    position = 0  # offset in file of the start of data
+    data = b""
+    with open(cermstr_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b""):
+            data += chunk
+            offsets.extend(position + m.start() for m in PAGE_START_PATTERN.finditer(data))
+            # keep the end of data, in case a tag is split between chunks (but not a whole tag, to count it once)
+            keep = min(len(data), PAGE_START_LENGTH - 1)
+            position += len(data) - keep
+            data = data[len(data) - keep:]
+    return offsets
+
+
 class Document:
-    def __init__(self, cermstr_path):
+    """
+    TrueViz output of CERMINE. Files can be very large (each character has an element of its own), so pages are
+    only parsed when needed: the byte offsets of pages are indexed first, so that the XML of each requested page can
+    be parsed on its own
+    """
+    def __init__(self, cermstr_path, page_ids=None):
+        """
+        :param cermstr_path: Path to TrueViz file
+        :param page_ids: IDs of pages (starting at 0) to load straight away; others are loaded on request
+        """
         self.path = cermstr_path
-        with open(cermstr_path) as f:
-            tree = ET.parse(f)
-        self.root = tree.getroot()
-        self.pages = {}
-        children = self.root.findall("Page")
-        for c in children:
-            page = Page(self, c)
-            self.pages[page.id] = page
-        self.number_of_pages = len(self.pages)
-        self.middle_page = math.floor(self.number_of_pages / 2)
+        self.pages = {}  # ID of page (string): Page, for the pages loaded so far
+        self._page_offsets = None
         self.line_spacing = None
+        if page_ids:
+            self.load_pages(page_ids)
+
+    @property
+    def page_offsets(self):
+        if self._page_offsets is None:
+            self._page_offsets = index_pages(self.path)
+        return self._page_offsets
+
+    @property
+    def number_of_pages(self):
+        return len(self.page_offsets)
+
+    @property
+    def middle_page(self):
+        return math.floor(self.number_of_pages / 2)
 
-    def detect_line_spacing(self, sample_size=5):
+    def geometry(self, page_ids):
         """
-        Detect line spacing by calculating the median of spaces between lines in sample_size pages.
-        :param sample_size: Number of pages to sample. Pages are sampled from the middle of the document
-        :return:
+        :param page_ids: IDs of pages (starting at 0)
+        :return: Geometry of pages page_ids (which callers may save, so that analysing the same pages again does not
+            parse any XML; see Geometry.save)
+        """
+        page_ids = sorted({int(i) for i in page_ids})
+        pages = self.load_pages(page_ids)
+        return Geometry.from_pages([pages[k] for k in sorted(pages, key=int)], self.number_of_pages, page_ids)
+
+    def load_pages(self, page_ids):
+        """
+        :param page_ids: IDs of pages (starting at 0)
+        :return: Dictionary of the requested pages that exist in file (ID of page as string: Page)
         """
-        spacing_of_body_content_zones = []
-        for k, page in self.pages.items():
-            if (int(k) >= (self.middle_page - 2)) and (int(k) <= (self.middle_page + 2)):
-                logger.debug("Working on page {}".format(int(k) + 1))
-                page.get_children()
-                if page.children:
-                    for zone in page.children:
-                        if zone.category == "BODY_CONTENT":
-                            if zone.detect_line_spacing():
-                                spacing_of_body_content_zones.append(zone.line_spacing)
-        if spacing_of_body_content_zones:
-            self.line_spacing = statistics.median(spacing_of_body_content_zones)
-        else:
-            logger.warning("Could not detect spacing of body content zones")
-        return self.line_spacing
+        wanted = {str(i) for i in page_ids}
+        missing = wanted - set(self.pages)
+        if missing:
+            try:
+                self.parse_indexed_pages(missing)
+            except (ET.ParseError, ValueError) as e:
+                logger.debug("Could not parse pages {} on their own ({}); streaming through file".format(missing, e))
+                self.stream_pages(missing)
+        return {i: self.pages[i] for i in wanted if i in self.pages}
+
+    def parse_indexed_pages(self, page_ids):
+        """
+        Parses pages from the bytes between their start tag and that of the next page
+        :raise ValueError: If the ID of a page parsed does not match its position in file
+        """
+        with open(self.path, 'rb') as f:
+            for page_id in sorted(page_ids, key=int):
+                i = int(page_id)
+                if not 0 <= i < self.number_of_pages:
+                    continue
+                f.seek(self.page_offsets[i])
+                if i + 1 < self.number_of_pages:
+                    data = f.read(self.page_offsets[i + 1] - self.page_offsets[i])
+                else:
+                    data = f.read()
+                    data = data[:data.rindex(b"</Page>") + len(b"</Page>")]
+                element = ET.fromstring(data)
+                page = Page(self, element)
+                if page.id != page_id:
+                    raise ValueError("Page {} of file has ID {}".format(i, page.id))
+                self.pages[page_id] = page
+
+    def stream_pages(self, page_ids):
+        """
+        Parses the file as far as the last of page_ids, keeping those pages and discarding all others as it goes
+        """
+        missing = set(page_ids) - set(self.pages)
+        root = None
+        with open(self.path, 'rb') as f:
+            for event, element in ET.iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = element
+                    continue
+                if element.tag != 'Page':
+                    continue
+                page_id = element.find('PageID').get('Value')
+                if len(root) and (root[-1] is element):
+                    del root[-1]
+                if page_id in missing:
+                    self.pages[page_id] = Page(self, element)
+                    missing.discard(page_id)
+                    if not missing:
+                        break
+                else:
+                    element.clear()
+
+    def sample_page_ids(self, sample_size=5):
+        """
+        :return: IDs of sample_size pages from the middle of the document
+        """
+        first = max(self.middle_page - sample_size // 2, 0)
+        return list(range(first, min(first + sample_size, self.number_of_pages)))
+
+    def detect_layout_features(self, sample_size=5):
+        """
+        Detects layout features of body content (see Geometry.layout_features) in sample_size pages from the middle of
+        the document
+        :return: Dictionary of features
+        """
+        page_ids = self.sample_page_ids(sample_size)
+        features = self.geometry(page_ids).layout_features(page_ids)
+        self.line_spacing = features['line_spacing']
+        return features
 
     def page_tikz_picture(self, output_filename=None, page_number=None):
         """
@@ -64,124 +182,286 @@ class Document:
         with open(output_filename, "w") as f:
             s = "\\documentclass[a4paper,8pt]{extarticle}\n\\usepackage{geometry, tikz}\n\\geometry{margin=0pt}\n" \
                 "\\renewcommand{\\familydefault}{\\ttdefault}\n\\begin{document}\n\\pagestyle{empty}\n"
-            s += self.pages[str(page_number)].tikz_picture()
+            s += self.load_pages([page_number])[str(page_number)].tikz_picture()
             s += "\\end{document}"
             f.write(s)
 
 
-class TrueVizElement:
-    def __init__(self, name, parent, xml_element, child_class=None):
-        self.name = name
-        self.parent = parent
-        self.id_string = "{}ID".format(name)
-        self.element = xml_element
-        self.id = self.element.find(self.id_string).get('Value')
-        self.child_class = child_class
-        self.children = []
+def element_box(element, name):
+    """
+    :return: (left, top, right, bottom) coordinates of element, from its first and third corners
+    """
+    corners = element.find("{}Corners".format(name))
+    return (float(corners[0].get('x')), float(corners[0].get('y')),
+            float(corners[2].get('x')), float(corners[2].get('y')))
 
-    def get_children(self):
-        children = self.element.findall(self.child_class.name())
-        for c in children:
-            child = self.child_class(self, c)
-            self.children.append(child)
-        return self.children
 
+class Geometry:
+    """
+    Geometry of the zones, lines and words of some pages of a TrueViz document, as NumPy arrays: boxes are
+    (left, top, right, bottom) rows, and each zone, line and word holds the index of the page, zone or line it belongs
+    to, so that layout measures can be computed over whole pages at once
+    """
+    def __init__(self, number_of_pages, page_ids, categories, zone_pages, zone_categories, zone_boxes, line_zones,
+                 line_boxes, line_numbers, word_lines, word_boxes):
+        """
+        :param number_of_pages: Number of pages of document
+        :param page_ids: IDs of the pages described
+        :param categories: Names of zone categories (zone_categories are indices in this list)
+        :param line_numbers: Number the first word of each line starts with; -1 if it does not start with a number
+        """
+        self.number_of_pages = int(number_of_pages)
+        self.page_ids = [int(i) for i in page_ids]
+        self.categories = [str(c) for c in categories]
+        self.zone_pages = numpy.asarray(zone_pages, dtype=numpy.int32)
+        self.zone_categories = numpy.asarray(zone_categories, dtype=numpy.int16)
+        self.zone_boxes = numpy.asarray(zone_boxes, dtype=numpy.float32).reshape(-1, 4)
+        self.line_zones = numpy.asarray(line_zones, dtype=numpy.int32)
+        self.line_boxes = numpy.asarray(line_boxes, dtype=numpy.float32).reshape(-1, 4)
+        self.line_numbers = numpy.asarray(line_numbers, dtype=numpy.int64)
+        self.word_lines = numpy.asarray(word_lines, dtype=numpy.int32)
+        self.word_boxes = numpy.asarray(word_boxes, dtype=numpy.float32).reshape(-1, 4)
 
-class Page(TrueVizElement):
-    def __init__(self, parent, xml_element):
-        super(Page, self).__init__("Page", parent, xml_element, Zone)
+    @classmethod
+    def from_pages(cls, pages, number_of_pages, page_ids=None):
+        """
+        :param pages: List of Page instances, in order
+        :param number_of_pages: Number of pages of document
+        :param page_ids: IDs of the pages described (those of pages if None; pages requested but missing from the
+            document may be included, so that they are not looked for again)
+        """
+        categories = []
+        zone_pages, zone_categories, zone_boxes = [], [], []
+        line_zones, line_boxes, line_numbers = [], [], []
+        word_lines, word_boxes = [], []
+        for page in pages:
+            for zone in page.children:
+                if zone.category not in categories:
+                    categories.append(zone.category)
+                zone_pages.append(int(page.id))
+                zone_categories.append(categories.index(zone.category))
+                zone_boxes.append(zone.box)
+                for line in zone.children:
+                    line_zones.append(len(zone_boxes) - 1)
+                    line_boxes.append(line.box)
+                    m = NUMBER_PATTERN.match(line.children[0].text) if line.children else None
+                    line_numbers.append(int(m.group()[:18]) if m else -1)
+                    for word in line.children:
+                        word_lines.append(len(line_boxes) - 1)
+                        word_boxes.append(word.box)
+        if page_ids is None:
+            page_ids = [int(p.id) for p in pages]
+        return cls(number_of_pages, page_ids, categories, zone_pages, zone_categories, zone_boxes, line_zones,
+                   line_boxes, line_numbers, word_lines, word_boxes)
 
-    def tikz_picture(self):
-        def children_check(element):
-            if not element.children:
-                element.get_children()
-        s = "\\begin{tikzpicture}[x=1pt,y=1pt]\n"
-        children_check(self)
-        for zone in self.children:
-            children_check(zone)
-            for line in zone.children:
-                children_check(line)
-                for word in line.children:
-                    children_check(word)
-                    for character in word.children:
-                        s += character.tikz_node()
-                    s += word.tikz_rectangle(colour="green")
-                s += line.tikz_rectangle(colour="blue")
-            s += zone.tikz_rectangle(colour="red")
-        s += r"\end{tikzpicture}"
-        return s
+    def save(self, path):
+        """
+        Saves arrays to a .npz file (written to a temporary file first, so that readers never see a partial one)
+        """
+        with open(path + ".tmp", 'wb') as f:
+            numpy.savez_compressed(f, version=GEOMETRY_VERSION, number_of_pages=self.number_of_pages, page_ids=self.page_ids,
+                                   categories=numpy.array(self.categories, dtype=str), zone_pages=self.zone_pages,
+                                   zone_categories=self.zone_categories, zone_boxes=self.zone_boxes,
+                                   line_zones=self.line_zones, line_boxes=self.line_boxes,
+                                   line_numbers=self.line_numbers,
+                                   word_lines=self.word_lines, word_boxes=self.word_boxes)
+        os.replace(path + ".tmp", path)
 
+    @classmethod
+    def load(cls, path):
+        """
+        :return: Geometry saved at path (see save)
+        :raise ValueError: If file was saved by an incompatible version
+        """
+        with numpy.load(path) as data:
+            if int(data['version']) != GEOMETRY_VERSION:
+                raise ValueError("Unsupported version {}".format(int(data['version'])))
+            return cls(data['number_of_pages'], data['page_ids'], data['categories'], data['zone_pages'],
+                       data['zone_categories'], data['zone_boxes'], data['line_zones'], data['line_boxes'],
+                       data['line_numbers'], data['word_lines'], data['word_boxes'])
 
-class GeometricElement(TrueVizElement):
-    def __init__(self, name, parent, xml_element, child_class=None):
-        super(GeometricElement, self).__init__(name, parent, xml_element, child_class=child_class)
-        self.corners = self.element.find("{}Corners".format(name))
+    def zone_mask(self, page_ids=None, category=None):
+        """
+        :return: Boolean array selecting the zones on pages page_ids (all pages if None) of category (any if None)
+        """
+        mask = numpy.ones(len(self.zone_pages), dtype=bool)
+        if page_ids is not None:
+            mask &= numpy.isin(self.zone_pages, [int(i) for i in page_ids])
+        if category is not None:
+            if category not in self.categories:
+                return numpy.zeros(len(self.zone_pages), dtype=bool)
+            mask &= self.zone_categories == self.categories.index(category)
+        return mask
 
-    def tikz_rectangle(self, colour="black"):
-        return "\\draw[draw={}] ({},{}) rectangle ({},{});\n".format(colour,
-                                                                    self.corners[0].get('x'),
-                                                                    self.corners[0].get('y'),
-                                                                    self.corners[2].get('x'),
-                                                                    self.corners[2].get('y')
-                                                                    )
+    def zone_widths(self):
+        return self.zone_boxes[:, 2] - self.zone_boxes[:, 0]
 
+    def line_heights(self):
+        return self.line_boxes[:, 3] - self.line_boxes[:, 1]
 
-class Zone(GeometricElement):
-    def __init__(self, parent, xml_element):
-        super(Zone, self).__init__("Zone", parent, xml_element, Line)
-        self.category = self.element.find('Classification').find('Category').attrib['Value']
-        self.line_spacing = None
+    def line_spacing_ratios(self):
+        """
+        :return: Array of the ratio between the distance from the baseline of the previous line of the same zone and
+            the height of each line; NaN for the first line of each zone and lines of no height
+        """
+        baselines = self.line_boxes[:, 3].astype(numpy.float64)
+        heights = self.line_heights().astype(numpy.float64)
+        ratios = numpy.full(len(baselines), numpy.nan)
+        if len(baselines) > 1:
+            follows = self.line_zones[1:] == self.line_zones[:-1]
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                spacing = (baselines[1:] - baselines[:-1]) / heights[1:]
+            ratios[1:] = numpy.where(follows & (heights[1:] != 0), spacing, numpy.nan)
+        return ratios
 
-    @staticmethod
-    def name():
-        return "Zone"
-
-    def detect_line_spacing(self):
-        self.get_children()
-        baseline_of_previous_line = None
-        for line in self.children:
-            top_of_line = float(line.corners[0].get('y'))
-            baseline = float(line.corners[2].get('y'))
-            line_height = baseline - top_of_line
-            logger.debug('Line height: {}'.format(line_height))
-            if not baseline_of_previous_line:
-                baseline_of_previous_line = baseline
-                continue  # this is the first line in this body content zone
-            line_spacing = baseline - baseline_of_previous_line
-            if line_height:  # avoid division by zero
-                line_spacing_ratio = line_spacing / line_height
-                logger.debug("Line spacing: {}; Line spacing ratio: {}".format(line_spacing, line_spacing_ratio))
-                self.line_spacing = line_spacing_ratio
-            baseline_of_previous_line = baseline
-        return self.line_spacing
+    def zone_line_spacings(self):
+        """
+        :return: Array of the median line spacing ratio (see line_spacing_ratios) of each zone; NaN for zones with
+            fewer than two lines
+        """
+        ratios = self.line_spacing_ratios()
+        spacings = numpy.full(len(self.zone_pages), numpy.nan)
+        valid = ~numpy.isnan(ratios)
+        if valid.any():
+            zones = self.line_zones[valid]
+            values = ratios[valid]
+            # lines are stored zone by zone, so the ratios of each zone are contiguous
+            boundaries = numpy.flatnonzero(numpy.diff(zones)) + 1
+            for zone_ratios, zone in zip(numpy.split(values, boundaries), zones[numpy.r_[0, boundaries]]):
+                spacings[zone] = numpy.median(zone_ratios)
+        return spacings
+
+    def detect_line_spacing(self, page_ids=None, category="BODY_CONTENT"):
+        """
+        :return: Median of the line spacings of zones of category on pages page_ids (all pages if None); None if no
+            zone has a line spacing
+        """
+        spacings = self.zone_line_spacings()[self.zone_mask(page_ids, category)]
+        spacings = spacings[~numpy.isnan(spacings) & (spacings != 0)]
+        if not len(spacings):
+            return None
+        return float(numpy.median(spacings))
 
+    def zone_word_counts(self):
+        return numpy.bincount(self.line_zones[self.word_lines], minlength=len(self.zone_pages))
+
+    def line_first_words(self):
+        """
+        :return: Array of the index of the first word of each line; -1 for lines without words
+        """
+        first_words = numpy.full(len(self.line_zones), -1, dtype=numpy.int64)
+        lines, indices = numpy.unique(self.word_lines, return_index=True)
+        first_words[lines] = indices
+        return first_words
+
+    def detect_two_columns(self, zones):
+        """
+        :param zones: Boolean array selecting the zones to analyse
+        :return: True if most zones are too narrow to span a single-column page; None if no zone is selected
+        """
+        if not zones.any():
+            return None
+        wide = int(numpy.count_nonzero(self.zone_widths()[zones] > WIDE_ZONE_WIDTH))
+        return wide <= int(numpy.count_nonzero(zones)) - wide
+
+    def detect_numbered_lines(self, zones):
+        """
+        Lines are numbered if enough lines of zones start with a number, and those numbers increase down each zone
+        and are aligned with one another within it. Zones (e.g. the columns of a two-column page) are checked on
+        their own, so that numbering restarting at the top of a column, or numbers shifting from one column to the
+        next, do not count as exceptions
+        :param zones: Boolean array selecting the zones to analyse
+        :return: True if lines are numbered; None if no zone is selected
+        """
+        if not zones.any():
+            return None
+        first_words = self.line_first_words()
+        lines = zones[self.line_zones] & (self.line_numbers >= 0) & (first_words >= 0)
+        if numpy.count_nonzero(lines) < MIN_NUMBERED_LINES:
+            return False
+        numbers = self.line_numbers[lines]
+        line_zones = self.line_zones[lines]
+        boxes = self.word_boxes[first_words[lines]]
+        # only consecutive numbered lines of the same zone are compared
+        follows = line_zones[1:] == line_zones[:-1]
+        out_of_sequence = follows & (numbers[1:] <= numbers[:-1])
+        offsets = numpy.abs(numpy.diff(boxes[:, [0, 2]], axis=0))
+        out_of_alignment = follows & (offsets > MAX_LINE_NUMBER_OFFSET).any(axis=1)
+        exceptions = int(numpy.count_nonzero(out_of_sequence)) + int(numpy.count_nonzero(out_of_alignment))
+        logger.debug("{} numbered lines; {} exceptions".format(len(numbers), exceptions))
+        return exceptions <= MAX_NUMBERED_LINES_EXCEPTIONS
+
+    def layout_features(self, page_ids=None):
+        """
+        :param page_ids: IDs of pages to analyse (all pages described if None)
+        :return: Dictionary of layout features of body content: line_spacing (see detect_line_spacing), two_columns
+            and numbered_lines (see detect_two_columns and detect_numbered_lines; only body content zones with at
+            least MIN_WORDS_PER_ZONE words are analysed)
+        """
+        zones = self.zone_mask(page_ids, "BODY_CONTENT") & (self.zone_word_counts() >= MIN_WORDS_PER_ZONE)
+        return {
+            'line_spacing': self.detect_line_spacing(page_ids),
+            'two_columns': self.detect_two_columns(zones),
+            'numbered_lines': self.detect_numbered_lines(zones),
+        }
+
+
+class TrueVizElement:
+    """
+    Element of the TrueViz hierarchy (Page > Zone > Line > Word > Character). Only the values used are kept, parsed
+    once; children are created the first time they are requested, after which the XML they came from is released.
+    Parents are held through weak references, so that elements do not keep the whole hierarchy alive
+    """
+    __slots__ = ('id', '_parent', '_element', '_children', '__weakref__')
+    tag = None
+    child_class = None
 
-class Line(GeometricElement):
     def __init__(self, parent, xml_element):
-        super(Line, self).__init__("Line", parent, xml_element, Word)
+        self._parent = weakref.ref(parent)
+        self.id = xml_element.find("{}ID".format(self.tag)).get('Value')
+        # elements without children (characters) do not keep their XML
+        self._element = xml_element if self.child_class else None
+        self._children = None
 
-    @staticmethod
-    def name():
-        return "Line"
+    @property
+    def parent(self):
+        """
+        :return: Parent element (Document for pages); None if it no longer exists
+        """
+        return self._parent()
 
+    @property
+    def children(self):
+        if self._children is None:
+            if self._element is None:
+                self._children = []
+            else:
+                self._children = [self.child_class(self, e) for e in self._element.iterfind(self.child_class.tag)]
+                self._element = None
+        return self._children
+
+    def get_children(self):
+        return self.children
+
+
+class GeometricElement(TrueVizElement):
+    __slots__ = ('box',)
 
-class Word(GeometricElement):
     def __init__(self, parent, xml_element):
-        super(Word, self).__init__("Word", parent, xml_element, Character)
+        super(GeometricElement, self).__init__(parent, xml_element)
+        self.box = element_box(xml_element, self.tag)
 
-    @staticmethod
-    def name():
-        return "Word"
+    def tikz_rectangle(self, colour="black"):
+        return "\\draw[draw={}] ({},{}) rectangle ({},{});\n".format(colour, *self.box)
 
 
 class Character(GeometricElement):
-    def __init__(self, parent, xml_element):
-        super(Character, self).__init__("Character", parent, xml_element)
-        self.value = self.element.find('GT_Text').attrib['Value']
+    __slots__ = ('value',)
+    tag = "Character"
 
-    @staticmethod
-    def name():
-        return "Character"
+    def __init__(self, parent, xml_element):
+        super(Character, self).__init__(parent, xml_element)
+        self.value = xml_element.find('GT_Text').get('Value')
 
     def tikz_node(self):
         def tex_escape(text):
@@ -209,321 +489,52 @@ class Character(GeometricElement):
             return t.sub(lambda match: conv[match.group()], text)
 
         s = super(Character, self).tikz_rectangle(colour="yellow")
-        x_center = (float(self.corners[0].get('x')) + float(self.corners[2].get('x'))) / 2
-        y_center = (float(self.corners[0].get('y')) + float(self.corners[2].get('y'))) / 2
+        x_center = (self.box[0] + self.box[2]) / 2
+        y_center = (self.box[1] + self.box[3]) / 2
         s += "\\draw ({},{}) node {{{}}};\n".format(x_center, y_center, tex_escape(self.value))
         return s
-#
-#     left_limit_of_body_content_zones = []
-#     first_words_that_are_integers = []
-#     wide_body_content_zone_counter = 0
-#     narrow_body_content_zone_counter = 0
-#     min_words_per_zone = 50
-#     for page in root.iter('Page'):
-#         page_id = page.find('PageID').get('Value')
-#         if int(page_id) in [(middle_page - 1), middle_page, (middle_page + 1)]:
-#             logger.debug("Working on page {}".format(int(page_id) + 1))
-#             zones = page.findall('Zone')
-#             if zones:
-#                 for zone in page.findall('Zone'):
-#                     zone_id = zone.find('ZoneID').get('Value')
-#                     category = zone.find('Classification').find('Category').attrib['Value']
-#                     logger.debug("Zone {} is of category {}".format(zone_id, category))
-#                     if category == "BODY_CONTENT":
-#                         words = zone.findall('Word')
-#
-#                         if len(words) < min_words_per_zone:
-#                             logger.debug(
-#                                 "Skipped zone {}; it has less than {} words".format(zone_id, min_words_per_zone))
-#                             continue
-#
-#                         # logger.debug("Analysing body_content zone on page {}".format(page_id))
-#                         # region columns
-#                         corners = zone.find('ZoneCorners').findall('Vertex')
-#                         left_limit = float(corners[0].get('x'))
-#                         right_limit = float(corners[1].get('x'))
-#                         zone_width = right_limit - left_limit
-#                         if zone_width > 312:  # c. 110 mm in pt
-#                             wide_body_content_zone_counter += 1
-#                         else:
-#                             narrow_body_content_zone_counter += 1
-#                         left_limit_of_body_content_zones.append(left_limit)
-#                         # endregion
-#
-#                         # region line spacing and line numbering
-#                         baseline_of_previous_line = None
-#                         for line in zone.findall('Line'):
-#                             line_id = line.find('LineID').attrib['Value']
-#                             # logger.debug("LineID: {}".format(line_id))
-#                             # region line numbering
-#                             first_word = line.find('Word')
-#                             first_word_value = ""
-#                             first_word_characters = first_word.findall('Character')
-#                             for c in first_word_characters:
-#                                 first_word_value += c.find('GT_Text').attrib['Value']
-#                             # logger.debug("First word: {}".format(first_word_value))
-#                             m = NUMBER_PATTERN.match(first_word_value)
-#                             if m:
-#                                 w_corners = first_word.find('WordCorners').findall('Vertex')
-#                                 w_left_margin = float(w_corners[3].get('x'))
-#                                 w_right_margin = float(w_corners[2].get('x'))
-#                                 first_words_that_are_integers.append({
-#                                     "number": m.group(),
-#                                     "line_id": line_id,
-#                                     "page_id": page_id,
-#                                     "left_margin": w_left_margin,
-#                                     "right_margin": w_right_margin
-#                                 }
-#                                 )
-#                             # endregion
-#
-#                             l_corners = line.find('LineCorners').findall('Vertex')
-#                             top_of_line = float(l_corners[0].get('y'))
-#                             baseline = float(l_corners[2].get('y'))
-#                             line_height = baseline - top_of_line
-#                             # logger.debug('Line height: {}'.format(line_height))
-#                             if not baseline_of_previous_line:
-#                                 baseline_of_previous_line = baseline
-#                                 continue  # this is the first line in this body content zone
-#                             line_spacing = baseline - baseline_of_previous_line
-#                             if line_height:  # avoid division by zero
-#                                 line_spacing_ratio = line_spacing / line_height
-#                                 # logger.debug("Line spacing: {}; Line spacing ratio: {}".format(line_spacing, line_spacing_ratio))
-#                                 spacing_of_body_content_zones.append(line_spacing_ratio)
-#                             baseline_of_previous_line = baseline
-#                             # for l_corner in l_corners:
-#                             #     if l_corners.index(l_corner) in [0, 2]:
-#                             #         logger.debug("LineCorner:", l_corner.get('x'), l_corner.get('y'))
-#                         # endregion
-#             else:
-#                 logger.warning("Page {} does not have any zones".format(page_id))
-#
-#     logger.debug("lenght of first_words_that_are_integers: {}; first_words_that_are_integers: {}".format(
-#         len(first_words_that_are_integers), first_words_that_are_integers))
-#     if not first_words_that_are_integers:
-#         numbered_lines = False
-#     elif len(first_words_that_are_integers) < 5:
-#         # we would have to be very unlucky to fail to find 5 numbered lines in 3 pages in a PDF where lines
-#         # are truly numbered (though pages with large images or numbered only every 5 lines can truly have
-#         # only few numbered lines
-#         numbered_lines = False
-#     else:
-#         previous_number = None
-#         exceptions_count = 0
-#         for n in first_words_that_are_integers:
-#             if not previous_number:
-#                 previous_number = n
-#                 continue
-#             else:
-#                 if n['page_id'] == previous_number['page_id']:
-#                     if not int(n['number']) > int(previous_number['number']):  # line numbers on the same
-#                         # page should be incremental
-#                         exceptions_count += 1
-#
-#                 left_margin_offset = abs(n['left_margin'] - previous_number['left_margin'])
-#                 right_margin_offset = abs(n['right_margin'] - previous_number['right_margin'])
-#                 logger.debug("left_margin_offset: {}; right_margin_offset: {}".format(left_margin_offset,
-#                                                                                       right_margin_offset))
-#                 max_offset = 10
-#                 if (left_margin_offset > max_offset) or (right_margin_offset > max_offset):
-#                     # line numbers should be aligned
-#                     exceptions_count += 1
-#                 previous_number = n
-#         logger.debug("exception_count: {}".format(exceptions_count))
-#         if exceptions_count > 3:
-#             numbered_lines = False
-#         else:
-#             numbered_lines = True
-#
-#     logger.debug("left_limit_of_body_content_zones: {}".format(left_limit_of_body_content_zones))
-#     if left_limit_of_body_content_zones:
-#         putative_columns = Counter(left_limit_of_body_content_zones).most_common(2)
-#         # logger.debug("putative_columns: {}".format(putative_columns))
-#         # if (abs(putative_columns[1][0] - putative_columns[0][0]) > 100  # putative columns separated by at least 100pt
-#         #     ) and (
-#         #         (putative_columns[1][1] / putative_columns[0][1]) > 0.5):  # number of columns on one side matched by at least 50% of columns on the opposite side
-#         #     two_columns = True
-#         # else:
-#         #     two_columns = False
-#     else:
-#         logger.warning("Could not detect left limit of body content zones")
-#
-#     logger.debug("wide_body_content_zone_counter: {}; narrow_body_content_zone_counter: {}".format(
-#         wide_body_content_zone_counter, narrow_body_content_zone_counter))
-#     if wide_body_content_zone_counter > narrow_body_content_zone_counter:
-#         two_columns = False
-#     else:
-#         two_columns = True
-#
-#     if spacing_of_body_content_zones:
-#         spacing_median = statistics.median(spacing_of_body_content_zones)
-#     else:
-#         logger.warning("Could not detect spacing of body content zones")
-#
-#     return spacing_median, two_columns, numbered_lines
-#
-#
-# def parse_cerm_trueviz(self):
-#     """
-#     Parses Trueviz (.cermstr) file generated by CERMINE to detect line spacing, column layout and numbers along
-#     the left margin
-#     :return:
-#     """
-#     two_columns = None
-#     spacing_median = None
-#     numbered_lines = None
-#     cermstr_path = self.file_path.replace(self.file_ext, ".cermstr")
-#     if not self.number_of_pages:
-#         self.extract_file_metadata()
-#     middle_page = int(math.floor((int(self.number_of_pages) / 2)))
-#     with open(cermstr_path) as f:
-#         tree = ET.parse(f)
-#     root = tree.getroot()
-#     spacing_of_body_content_zones = []
-#     left_limit_of_body_content_zones = []
-#     first_words_that_are_integers = []
-#     wide_body_content_zone_counter = 0
-#     narrow_body_content_zone_counter = 0
-#     min_words_per_zone = 50
-#     for page in root.iter('Page'):
-#         page_id = page.find('PageID').get('Value')
-#         if int(page_id) in [(middle_page - 1), middle_page, (middle_page + 1)]:
-#             logger.debug("Working on page {}".format(int(page_id) + 1))
-#             zones = page.findall('Zone')
-#             if zones:
-#                 for zone in page.findall('Zone'):
-#                     zone_id = zone.find('ZoneID').get('Value')
-#                     category = zone.find('Classification').find('Category').attrib['Value']
-#                     logger.debug("Zone {} is of category {}".format(zone_id, category))
-#                     if category == "BODY_CONTENT":
-#                         words = zone.findall('Word')
-#
-#                         if len(words) < min_words_per_zone:
-#                             logger.debug(
-#                                 "Skipped zone {}; it has less than {} words".format(zone_id, min_words_per_zone))
-#                             continue
-#
-#                         # logger.debug("Analysing body_content zone on page {}".format(page_id))
-#                         # region columns
-#                         corners = zone.find('ZoneCorners').findall('Vertex')
-#                         left_limit = float(corners[0].get('x'))
-#                         right_limit = float(corners[1].get('x'))
-#                         zone_width = right_limit - left_limit
-#                         if zone_width > 312:  # c. 110 mm in pt
-#                             wide_body_content_zone_counter += 1
-#                         else:
-#                             narrow_body_content_zone_counter += 1
-#                         left_limit_of_body_content_zones.append(left_limit)
-#                         # endregion
-#
-#                         # region line spacing and line numbering
-#                         baseline_of_previous_line = None
-#                         for line in zone.findall('Line'):
-#                             line_id = line.find('LineID').attrib['Value']
-#                             # logger.debug("LineID: {}".format(line_id))
-#                             # region line numbering
-#                             first_word = line.find('Word')
-#                             first_word_value = ""
-#                             first_word_characters = first_word.findall('Character')
-#                             for c in first_word_characters:
-#                                 first_word_value += c.find('GT_Text').attrib['Value']
-#                             # logger.debug("First word: {}".format(first_word_value))
-#                             m = NUMBER_PATTERN.match(first_word_value)
-#                             if m:
-#                                 w_corners = first_word.find('WordCorners').findall('Vertex')
-#                                 w_left_margin = float(w_corners[3].get('x'))
-#                                 w_right_margin = float(w_corners[2].get('x'))
-#                                 first_words_that_are_integers.append({
-#                                     "number": m.group(),
-#                                     "line_id": line_id,
-#                                     "page_id": page_id,
-#                                     "left_margin": w_left_margin,
-#                                     "right_margin": w_right_margin
-#                                 }
-#                                 )
-#                             # endregion
-#
-#                             l_corners = line.find('LineCorners').findall('Vertex')
-#                             top_of_line = float(l_corners[0].get('y'))
-#                             baseline = float(l_corners[2].get('y'))
-#                             line_height = baseline - top_of_line
-#                             # logger.debug('Line height: {}'.format(line_height))
-#                             if not baseline_of_previous_line:
-#                                 baseline_of_previous_line = baseline
-#                                 continue  # this is the first line in this body content zone
-#                             line_spacing = baseline - baseline_of_previous_line
-#                             if line_height:  # avoid division by zero
-#                                 line_spacing_ratio = line_spacing / line_height
-#                                 # logger.debug("Line spacing: {}; Line spacing ratio: {}".format(line_spacing, line_spacing_ratio))
-#                                 spacing_of_body_content_zones.append(line_spacing_ratio)
-#                             baseline_of_previous_line = baseline
-#                             # for l_corner in l_corners:
-#                             #     if l_corners.index(l_corner) in [0, 2]:
-#                             #         logger.debug("LineCorner:", l_corner.get('x'), l_corner.get('y'))
-#                         # endregion
-#             else:
-#                 logger.warning("Page {} does not have any zones".format(page_id))
-#
-#     logger.debug("lenght of first_words_that_are_integers: {}; first_words_that_are_integers: {}".format(
-#         len(first_words_that_are_integers), first_words_that_are_integers))
-#     if not first_words_that_are_integers:
-#         numbered_lines = False
-#     elif len(first_words_that_are_integers) < 5:
-#         # we would have to be very unlucky to fail to find 5 numbered lines in 3 pages in a PDF where lines
-#         # are truly numbered (though pages with large images or numbered only every 5 lines can truly have
-#         # only few numbered lines
-#         numbered_lines = False
-#     else:
-#         previous_number = None
-#         exceptions_count = 0
-#         for n in first_words_that_are_integers:
-#             if not previous_number:
-#                 previous_number = n
-#                 continue
-#             else:
-#                 if n['page_id'] == previous_number['page_id']:
-#                     if not int(n['number']) > int(previous_number['number']):  # line numbers on the same
-#                         # page should be incremental
-#                         exceptions_count += 1
-#
-#                 left_margin_offset = abs(n['left_margin'] - previous_number['left_margin'])
-#                 right_margin_offset = abs(n['right_margin'] - previous_number['right_margin'])
-#                 logger.debug("left_margin_offset: {}; right_margin_offset: {}".format(left_margin_offset,
-#                                                                                       right_margin_offset))
-#                 max_offset = 10
-#                 if (left_margin_offset > max_offset) or (right_margin_offset > max_offset):
-#                     # line numbers should be aligned
-#                     exceptions_count += 1
-#                 previous_number = n
-#         logger.debug("exception_count: {}".format(exceptions_count))
-#         if exceptions_count > 3:
-#             numbered_lines = False
-#         else:
-#             numbered_lines = True
-#
-#     logger.debug("left_limit_of_body_content_zones: {}".format(left_limit_of_body_content_zones))
-#     if left_limit_of_body_content_zones:
-#         putative_columns = Counter(left_limit_of_body_content_zones).most_common(2)
-#         # logger.debug("putative_columns: {}".format(putative_columns))
-#         # if (abs(putative_columns[1][0] - putative_columns[0][0]) > 100  # putative columns separated by at least 100pt
-#         #     ) and (
-#         #         (putative_columns[1][1] / putative_columns[0][1]) > 0.5):  # number of columns on one side matched by at least 50% of columns on the opposite side
-#         #     two_columns = True
-#         # else:
-#         #     two_columns = False
-#     else:
-#         logger.warning("Could not detect left limit of body content zones")
-#
-#     logger.debug("wide_body_content_zone_counter: {}; narrow_body_content_zone_counter: {}".format(
-#         wide_body_content_zone_counter, narrow_body_content_zone_counter))
-#     if wide_body_content_zone_counter > narrow_body_content_zone_counter:
-#         two_columns = False
-#     else:
-#         two_columns = True
-#
-#     if spacing_of_body_content_zones:
-#         spacing_median = statistics.median(spacing_of_body_content_zones)
-#     else:
-#         logger.warning("Could not detect spacing of body content zones")
-#
-#     return spacing_median, two_columns, numbered_lines
+
+
+class Word(GeometricElement):
+    __slots__ = ()
+    tag = "Word"
+    child_class = Character
+
+    @property
+    def text(self):
+        return "".join(c.value for c in self.children)
+
+
+class Line(GeometricElement):
+    __slots__ = ()
+    tag = "Line"
+    child_class = Word
+
+
+class Zone(GeometricElement):
+    __slots__ = ('category',)
+    tag = "Zone"
+    child_class = Line
+
+    def __init__(self, parent, xml_element):
+        super(Zone, self).__init__(parent, xml_element)
+        self.category = xml_element.find('Classification').find('Category').get('Value')
+
+
+class Page(TrueVizElement):
+    __slots__ = ()
+    tag = "Page"
+    child_class = Zone
+
+    def tikz_picture(self):
+        s = "\\begin{tikzpicture}[x=1pt,y=1pt]\n"
+        for zone in self.children:
+            for line in zone.children:
+                for word in line.children:
+                    for character in word.children:
+                        s += character.tikz_node()
+                    s += word.tikz_rectangle(colour="green")
+                s += line.tikz_rectangle(colour="blue")
+            s += zone.tikz_rectangle(colour="red")
+        s += r"\end{tikzpicture}"
+        return s
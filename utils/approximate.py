@@ -0,0 +1,200 @@
+from collections import Counter
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+QGRAM_SIZE = 3
+
+
+def fold_case(text):
+    """
+    :return: text in lower case, character by character, so that positions are preserved
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+def qgrams(text, q=QGRAM_SIZE):
+    return Counter(text[i:i + q] for i in range(len(text) - q + 1))
+
+
+def max_errors_for(length, error_ratio):
+    """
+    :return: Number of errors allowed in a match of a string of length length, which (as in regex's fuzzy matching
+        constraint {e<n} used by BaseParser.find_match_in_extracted_text) must be lower than error_ratio*length
+    """
+    return max(int(error_ratio * length) - 1, 0)
+
+
+def pattern_bitmasks(pattern):
+    """
+    :return: Dictionary of the positions of each character in pattern, as bitmasks
+    """
+    peq = {}
+    for i, c in enumerate(pattern):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    return peq
+
+
+def myers_scores(peq, m, chars):
+    """
+    Myers' bit-parallel algorithm for approximate string matching, in Hyyrö's formulation. Python's unbounded
+    integers hold the whole column of the dynamic programming matrix, so patterns of any length take a fixed number
+    of integer operations per character of text
+    :param peq: Bitmasks of pattern (see pattern_bitmasks)
+    :param m: Length of pattern
+    :param chars: Iterable of characters of text
+    :return: Generator of the edit distance between pattern and the best matching substring of text ending at each
+        character of text
+    """
+    full = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv = full
+    mv = 0
+    score = m
+    for c in chars:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & full) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+        yield score
+
+
+class ApproximateMatcher:
+    """
+    Finds occurrences of a string in a text with at most max_errors errors (insertions, deletions or substitutions),
+    ignoring case, in time roughly linear in the length of the text, whatever the length of the string.
+
+    Candidate windows are located first with exact searches for max_errors + 1 pieces of the string (by the
+    pigeonhole principle, any match contains at least one of them unaltered), and windows that do not share enough
+    q-grams with the string are discarded. Remaining windows are verified with Myers' bit-parallel algorithm
+    """
+    def __init__(self, pattern, max_errors=0, q=QGRAM_SIZE):
+        """
+        :param pattern: String to look for
+        :param max_errors: Maximum number of errors allowed in a match
+        :param q: Length of q-grams used to filter candidate windows
+        """
+        self.pattern = fold_case(pattern)
+        self.max_errors = max_errors
+        self.q = q
+        self.peq = pattern_bitmasks(self.pattern)
+        self.reversed_peq = pattern_bitmasks(self.pattern[::-1])
+        self.qgrams = qgrams(self.pattern, q)
+        # q-gram lemma: a match with at most max_errors errors shares at least this many q-grams with pattern
+        self.min_shared_qgrams = len(self.pattern) - q + 1 - max_errors * q
+
+    def anchors(self):
+        """
+        :return: List of (piece, offset of piece in pattern) tuples splitting pattern into max_errors + 1 pieces
+        """
+        k = min(self.max_errors, len(self.pattern) - 1)
+        size = len(self.pattern) // (k + 1)
+        anchors = []
+        for i in range(k + 1):
+            end = (i + 1) * size if i < k else len(self.pattern)
+            anchors.append((self.pattern[i * size:end], i * size))
+        return anchors
+
+    def window(self, anchor_position, offset, start, end):
+        """
+        :param anchor_position: Position of an anchor in text
+        :param offset: Offset of anchor in pattern
+        :return: Span of text where a match including the anchor at anchor_position may occur
+        """
+        window_start = max(start, anchor_position - offset - self.max_errors)
+        window_end = min(end, anchor_position - offset + len(self.pattern) + self.max_errors)
+        return window_start, window_end
+
+    def candidate_windows(self, folded_text, start, end):
+        """
+        :return: Sorted list of non-overlapping spans of folded_text[start:end] where matches may occur
+        """
+        windows = []
+        for piece, offset in self.anchors():
+            i = folded_text.find(piece, start, end)
+            while i != -1:
+                windows.append(self.window(i, offset, start, end))
+                i = folded_text.find(piece, i + 1, end)
+        merged = []
+        for window_start, window_end in sorted(windows):
+            if merged and (window_start <= merged[-1][1]):
+                merged[-1] = (merged[-1][0], max(window_end, merged[-1][1]))
+            else:
+                merged.append((window_start, window_end))
+        return merged
+
+    def passes_qgram_filter(self, folded_text, start, end):
+        if self.min_shared_qgrams <= 0:
+            return True
+        window_qgrams = qgrams(folded_text[start:end], self.q)
+        shared = sum(min(n, window_qgrams[g]) for g, n in self.qgrams.items())
+        return shared >= self.min_shared_qgrams
+
+    def verify(self, folded_text, start, end):
+        """
+        :param folded_text: Text in lower case (see fold_case)
+        :param start: Start of window of text to search
+        :param end: End of window of text to search
+        :return: (start, end, errors) tuple for the leftmost match in window (if several matches end at consecutive
+            positions, the one with fewest errors); None if there is no match in window
+        """
+        m = len(self.pattern)
+        if (end - start < m - self.max_errors) or not self.passes_qgram_filter(folded_text, start, end):
+            return None
+        best = None
+        for j, score in enumerate(myers_scores(self.peq, m, folded_text[start:end]), start + 1):
+            if best is None:
+                if score <= self.max_errors:
+                    best = (score, j)
+            elif score < best[0]:
+                best = (score, j)
+            elif score > best[0]:
+                break
+        if best is None:
+            return None
+        errors, match_end = best
+        # run pattern backwards from the end of match to find where it starts
+        lower = max(start, match_end - m - errors)
+        match_start = match_end
+        fewest = None
+        reversed_chars = (folded_text[i] for i in range(match_end - 1, lower - 1, -1))
+        for i, score in enumerate(myers_scores(self.reversed_peq, m, reversed_chars), 1):
+            if (fewest is None) or (score < fewest):
+                fewest = score
+                match_start = match_end - i
+        return match_start, match_end, errors
+
+    def find(self, folded_text, start=0, end=None):
+        """
+        :param folded_text: Text in lower case (see fold_case)
+        :return: (start, end, errors) tuple for the leftmost match in folded_text[start:end]; None if there is none
+        """
+        if end is None:
+            end = len(folded_text)
+        if not self.pattern:
+            return None
+        for window_start, window_end in self.candidate_windows(folded_text, start, end):
+            match = self.verify(folded_text, window_start, window_end)
+            if match:
+                return match
+        return None
+
+    def search(self, text, start=0, end=None):
+        """
+        :param text: Text to search
+        :return: (start, end, errors) tuple for the leftmost match in text[start:end]; None if there is none
+        """
+        return self.find(fold_case(text), start, end)
@@ -0,0 +1,113 @@
+import threading
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+
+class ArtifactManager:
+    """
+    Keeps track of the artifacts derived from a document (extracted text, CERMINE outputs, PDF info, etc.) and
+    produces each of them once, on demand, for every test that needs it. If given an ArtifactStore, artifacts
+    extracted by previous runs on the same document are restored from it instead of being produced again
+    """
+    def __init__(self, store=None, document_key=None):
+        """
+        :param store: ArtifactStore instance in which artifacts are persisted (optional)
+        :param document_key: Hash of the contents of the document (required if store is given)
+        """
+        self.store = store if document_key else None
+        self.document_key = document_key
+        self._producers = {}
+        self._locks = {}
+        self._kinds = {}
+        self._artifacts = {}
+        self._registration_lock = threading.Lock()
+
+    def register(self, names, producer, kind=None, location=None):
+        """
+        Registers the function that produces one or more artifacts
+        :param names: Names of the artifacts produced by producer
+        :param producer: Function taking the name of the requested artifact and returning a dictionary of the
+            artifacts it produced (name: value). Producers that generate several artifacts in one go (e.g. CERMINE)
+            may return all of them at once
+        :param kind: Kind of artifact ('text', 'file' or 'folder'; see ArtifactStore), or dictionary of kinds
+            (name: kind) if producer generates artifacts of different kinds. Artifacts without a kind are not persisted
+        :param location: For 'file' and 'folder' artifacts, function taking the name of an artifact and returning
+            the path where it should be restored
+        """
+        lock = threading.RLock()
+        for name in names:
+            self._producers[name] = producer
+            self._locks[name] = lock
+            k = kind.get(name) if isinstance(kind, dict) else kind
+            if k:
+                self._kinds[name] = (k, location)
+
+    def register_once(self, name, producer, kind=None):
+        """
+        Registers the function that produces artifact name (see register), unless one is already registered. Used for
+        artifacts whose names depend on parameters only known when they are requested (e.g. a range of pages)
+        :return: name
+        """
+        with self._registration_lock:
+            if name not in self._producers:
+                self.register([name], producer, kind=kind)
+        return name
+
+    def has(self, name):
+        """
+        :param name: Name of artifact
+        :return: True if artifact has already been produced (or its production attempted)
+        """
+        return name in self._artifacts
+
+    def put(self, name, value):
+        self._artifacts[name] = value
+
+    def get(self, name):
+        """
+        Returns artifact name, producing it if needed
+        :param name: Name of artifact
+        :return: Value of artifact; None if it could not be produced
+        """
+        if name in self._artifacts:
+            return self._artifacts[name]
+        try:
+            lock = self._locks[name]
+        except KeyError:
+            logger.error("No producer registered for artifact '{}'".format(name))
+            return None
+        with lock:
+            if name not in self._artifacts:
+                restored = self.restore(name)
+                if restored is not None:
+                    self._artifacts[name] = restored
+                    return restored
+                logger.debug("Producing artifact '{}'".format(name))
+                produced = self._producers[name](name) or {}
+                for k, v in produced.items():
+                    if (k not in self._artifacts) and (v is not None):
+                        self.persist(k, v)
+                self._artifacts.update(produced)
+                if name not in produced:
+                    logger.warning("Could not produce artifact '{}'".format(name))
+                    self._artifacts[name] = None
+        return self._artifacts[name]
+
+    def restore(self, name):
+        """
+        :param name: Name of artifact
+        :return: Artifact restored from self.store; None if not available
+        """
+        if self.store and (name in self._kinds):
+            kind, location = self._kinds[name]
+            return self.store.load(self.document_key, name, kind, location=location(name) if location else None)
+        return None
+
+    def persist(self, name, value):
+        if self.store and (name in self._kinds):
+            try:
+                self.store.save(self.document_key, name, self._kinds[name][0], value)
+            except OSError as e:
+                logger.error("Could not store artifact '{}': {}".format(name, e))
@@ -0,0 +1,282 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+SUPPORTED_EXTENSIONS = ['.pdf', '.docx']
+# columns/keys of manifests, besides path, title, version and authors, passed on to VersionDetector as known metadata
+METADATA_FIELDS = ['doi', 'acceptance_date', 'publication_date']
+PATH_FIELDS = ['path', 'file', 'filename']
+
+
+def log_to_stderr():
+    """
+    Moves Artemis' log output from stdout to stderr, so that stdout only carries results
+    """
+    for h in logger.handlers:
+        if hasattr(h, 'setStream'):
+            h.setStream(sys.stderr)
+
+
+def make_job(record, base_folder=None):
+    """
+    :param record: Dictionary describing a file to check (a row of a CSV manifest or an object of a JSONL manifest)
+    :param base_folder: Folder relative paths in record are relative to
+    :return: Job dictionary (path, title, version, authors and metadata)
+    """
+    path = next((record[k] for k in PATH_FIELDS if record.get(k)), None)
+    if not path:
+        raise ValueError("No path in record {}".format(record))
+    path = os.path.expanduser(path)
+    if base_folder and not os.path.isabs(path):
+        path = os.path.join(base_folder, path)
+    authors = record.get('authors')
+    if isinstance(authors, str):
+        authors = [a.strip() for a in authors.split(';') if a.strip()] or None
+    return {
+        'path': path,
+        'title': record.get('title') or None,
+        'version': record.get('version') or None,
+        'authors': authors,
+        'metadata': {k: record[k] for k in METADATA_FIELDS if record.get(k)},
+    }
+
+
+def unreadable_job(error, line_number):
+    """
+    :return: Item yielded by iter_jobs in place of a job that could not be read, so that the following jobs are still
+        read; BatchRunner.run writes it out as it is
+    """
+    logger.error("Could not read job on line {}: {}".format(line_number, error))
+    return {'error': "Line {}: {}".format(line_number, error), 'error_type': type(error).__name__}
+
+
+def iter_lines(f, base_folder=None):
+    """
+    :param f: File object of JSONL manifest, or of a list of paths (one per line)
+    :return: Generator of jobs (see iter_jobs)
+    """
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line.startswith('{'):
+                yield make_job(json.loads(line), base_folder)
+            else:
+                yield make_job({'path': line}, base_folder)
+        except ValueError as e:  # including malformed JSON
+            yield unreadable_job(e, line_number)
+
+
+def iter_jobs(source):
+    """
+    Reads jobs lazily, so that large manifests are never held in memory
+    :param source: A folder (all supported files in it are checked), a CSV manifest (with a header row including
+        path, title, version and authors columns; authors separated by semicolons), a JSONL manifest (one object
+        per line with the same keys) or '-' for a JSONL manifest or list of paths read from stdin
+    :return: Generator of jobs (see make_job); records that cannot be read yield a dictionary with an 'error' key
+        instead (see unreadable_job)
+    """
+    if source == '-':
+        yield from iter_lines(sys.stdin)
+    elif os.path.isdir(source):
+        for entry in sorted(os.scandir(source), key=lambda e: e.name):
+            if entry.is_file() and (os.path.splitext(entry.name)[-1].lower() in SUPPORTED_EXTENSIONS):
+                yield make_job({'path': entry.path})
+    else:
+        base_folder = os.path.dirname(os.path.abspath(source))
+        with open(source, newline='') as f:
+            if source.lower().endswith('.csv'):
+                reader = csv.DictReader(f)
+                for row in reader:
+                    try:
+                        yield make_job(row, base_folder)
+                    except ValueError as e:
+                        yield unreadable_job(e, reader.line_num)
+            else:
+                yield from iter_lines(f, base_folder)
+
+
+def init_worker(cermine_workers=None):
+    log_to_stderr()
+    if cermine_workers:
+        from utils.cermine import configure_cermine_pool
+        configure_cermine_pool(cermine_workers)
+
+
+def run_job(job, options):
+    """
+    Runs VersionDetector on a job in a worker process
+    :param job: Job dictionary (see make_job)
+    :param options: Dictionary of VersionDetector options shared by all jobs (working_folder, use_cache, etc.),
+        plus layout (if True, layout tests are run on PDF files too)
+    :return: JSON string of result (with the path of the file as 'input_path')
+    """
+    # imported here, so that the parent process does not need Artemis' heavy dependencies
+    from artemis import PDF_DEFAULT_TESTS, PDF_LAYOUT_TESTS, VersionDetector
+    options = dict(options)
+    if options.pop('layout', False):
+        options['tests'] = PDF_DEFAULT_TESTS + PDF_LAYOUT_TESTS
+    detector = VersionDetector(job['path'], dec_ms_title=job['title'], dec_version=job['version'],
+                               dec_authors=job['authors'], **options, **job['metadata'])
+    result = detector.detect()
+    if not isinstance(result, str):  # unsupported file extension
+        return error_record(job, result[1])
+    result = json.loads(result)
+    result['input_path'] = job['path']
+    return json.dumps(result)
+
+
+def error_record(job, message, error_type=None):
+    """
+    :return: JSON string reporting that job could not be checked
+    """
+    return json.dumps({
+        'input_file': os.path.basename(job['path']),
+        'input_path': job['path'],
+        'error': message,
+        'error_type': error_type,
+    })
+
+
+class BatchRunner:
+    """
+    Checks many files on a pool of worker processes (each of which imports Artemis and starts CERMINE once) and
+    streams one JSON result per line as soon as each file is done. At most max_in_flight jobs are read ahead of
+    the results written, so memory stays bounded however long the manifest is
+    """
+    def __init__(self, jobs=None, options=None, cermine_workers=None, max_in_flight=None):
+        """
+        :param jobs: Number of worker processes (number of CPUs if None)
+        :param options: Dictionary of VersionDetector options shared by all jobs
+        :param cermine_workers: Number of CERMINE workers kept by each worker process
+        :param max_in_flight: Maximum number of jobs submitted but not yet written (twice jobs if None)
+        """
+        self.jobs = jobs or os.cpu_count() or 1
+        self.options = options or {}
+        self.cermine_workers = cermine_workers
+        self.max_in_flight = max_in_flight or 2 * self.jobs
+
+    def make_executor(self):
+        return ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker,
+                                   initargs=(self.cermine_workers,))
+
+    def run(self, jobs, output):
+        """
+        :param jobs: Iterable of jobs (see iter_jobs)
+        :param output: File object results are written to (one JSON object per line)
+        :return: Tuple of number of files checked and number of errors
+        """
+        checked = 0
+        errors = 0
+        in_flight = {}  # future: job
+        executor = self.make_executor()
+        jobs = iter(jobs)
+        exhausted = False
+        try:
+            while in_flight or not exhausted:
+                while not exhausted and (len(in_flight) < self.max_in_flight):
+                    try:
+                        job = next(jobs)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    except (ValueError, OSError) as e:  # e.g. manifest could not be opened
+                        logger.error("Could not read jobs: {}".format(e))
+                        job = {'error': str(e), 'error_type': type(e).__name__}
+                        exhausted = True
+                    if 'error' in job:
+                        output.write(json.dumps(job) + "\n")
+                        output.flush()
+                        errors += 1
+                        continue
+                    in_flight[executor.submit(run_job, job, self.options)] = job
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        line = future.result()
+                    except BrokenProcessPool as e:
+                        broken = True
+                        line = error_record(job, "Worker process died: {}".format(e), type(e).__name__)
+                    except Exception as e:
+                        line = error_record(job, str(e), type(e).__name__)
+                    if 'error' in json.loads(line):
+                        errors += 1
+                    checked += 1
+                    output.write(line + "\n")
+                    output.flush()
+                if broken:
+                    # a worker crashed (e.g. killed for using too much memory); jobs still in flight are lost too
+                    for future, job in in_flight.items():
+                        output.write(error_record(job, "Worker process died", 'BrokenProcessPool') + "\n")
+                        checked += 1
+                        errors += 1
+                    output.flush()
+                    in_flight.clear()
+                    executor.shutdown(wait=False)
+                    executor = self.make_executor()
+        finally:
+            executor.shutdown(wait=True)
+        return checked, errors
+
+
+def main(argv=None):
+    """
+    Entry point of 'artemis.py batch'
+    :return: Exit status (0 if all files were checked without errors)
+    """
+    parser = argparse.ArgumentParser(prog='Artemis batch',
+                                     description='Checks many files, writing one JSON result per line')
+    parser.add_argument('source', type=str, metavar='<source>',
+                        help="Folder of files to check, CSV or JSONL manifest (path, title, version, authors), or "
+                             "'-' to read a JSONL manifest or list of paths from stdin")
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, metavar='N',
+                        help='Number of files checked in parallel (default: number of CPUs)')
+    parser.add_argument('-o', '--output', dest='output', type=str, metavar='<path>',
+                        help='Write results to this file instead of stdout')
+    parser.add_argument('-w', '--working-folder', dest='working_folder', type=str, metavar='<path>',
+                        help='Path to working folder to be used (instead of temp folder)')
+    parser.add_argument('-k', '--keep', dest='keep', action="store_true",
+                        help='Keep temporary files')
+    parser.add_argument('-l', '--layout', dest='layout', action="store_true",
+                        help='Also analyse page layout of PDF files (slower); layout features are reported, but do '
+                             'not affect the decision')
+    parser.add_argument('-f', '--full-evidence', dest='full_evidence', action="store_true",
+                        help='Run all tests, even those that cannot change the decision (slower)')
+    parser.add_argument('--no-cache', dest='no_cache', action="store_true",
+                        help='Do not read or write cached results')
+    parser.add_argument('--refresh-cache', dest='refresh_cache', action="store_true",
+                        help='Ignore cached results, but store the new ones')
+    parser.add_argument('--cermine-workers', dest='cermine_workers', type=int, metavar='N',
+                        help='Number of warm CERMINE workers kept by each process')
+    arguments = parser.parse_args(argv)
+
+    log_to_stderr()
+    options = {
+        'keep_temp_files': arguments.keep,
+        'working_folder': arguments.working_folder,
+        'use_cache': not arguments.no_cache,
+        'refresh_cache': arguments.refresh_cache,
+        'full_evidence': arguments.full_evidence,
+        'layout': arguments.layout,
+    }
+    runner = BatchRunner(jobs=arguments.jobs, options=options, cermine_workers=arguments.cermine_workers)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            checked, errors = runner.run(iter_jobs(arguments.source), output)
+    else:
+        checked, errors = runner.run(iter_jobs(arguments.source), sys.stdout)
+    logger.info("Checked {} files; {} errors".format(checked, errors))
+    return 1 if errors else 0
@@ -0,0 +1,284 @@
+import fcntl
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+CACHE_FOLDER = os.environ.get("ARTEMIS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "artemis"))
+RESULT_CACHE_MAX_SIZE = int(os.environ.get("ARTEMIS_RESULT_CACHE_SIZE", 100 * 1024 * 1024))  # bytes
+ARTIFACT_STORE_MAX_SIZE = int(os.environ.get("ARTEMIS_ARTIFACT_STORE_SIZE", 1024 * 1024 * 1024))  # bytes
+# bump whenever the way artifacts are extracted changes, so that previously stored artifacts are no longer used
+ARTIFACT_STORE_VERSION = 2
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """
+    :param path: Path to file
+    :return: Hex digest of SHA-256 hash of file contents
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def files_stamp(paths):
+    """
+    Version stamp of a set of files (e.g. the modules and databases defining Artemis' rules); changes whenever the
+    contents of any of them change
+    :param paths: Paths to files; paths that do not exist are ignored
+    :return: Hex digest
+    """
+    h = hashlib.sha256()
+    for p in sorted(set(paths)):
+        if os.path.isfile(p):
+            h.update(os.path.basename(p).encode())
+            h.update(file_sha256(p).encode())
+    return h.hexdigest()
+
+
+class DiskCache:
+    """
+    Size-bounded on-disk key-value store with least-recently-used eviction. Entries are written atomically and
+    eviction is serialised with a lock file, so a cache folder may be shared by several processes
+    """
+    # the total size of entries is kept in a file next to the lock file, so that writes need not walk the folder; it
+    # is walked to enforce max_size when that size exceeds it, and at least once every full_check_interval writes of
+    # each instance (to correct any drift, e.g. from entries removed by hand)
+    full_check_interval = 100
+
+    def __init__(self, folder, max_size):
+        """
+        :param folder: Folder where entries are stored
+        :param max_size: Maximum total size of entries (in bytes)
+        """
+        self.folder = folder
+        self.max_size = max_size
+        os.makedirs(self.folder, exist_ok=True)
+        self.lock_path = os.path.join(self.folder, ".lock")
+        self.size_path = os.path.join(self.folder, ".size")
+        self._writes_since_check = 0
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    @contextmanager
+    def lock(self):
+        """
+        Serialises changes to the recorded size of the cache, and eviction, across processes
+        """
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read_size(self):
+        """
+        :return: Total size of entries, as last recorded; None if unknown
+        """
+        try:
+            with open(self.size_path) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_size(self, size):
+        with open(self.size_path, 'w') as f:
+            f.write(str(max(size, 0)))
+
+    def get_bytes(self, key):
+        """
+        :param key: Key of entry
+        :return: Contents of entry; None if not in cache
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # modification time doubles as time of last use
+        except FileNotFoundError:
+            pass
+        return data
+
+    def set_bytes(self, key, data):
+        """
+        Stores data under key and evicts least recently used entries if cache exceeds self.max_size
+        :param key: Key of entry
+        :param data: Contents of entry (bytes)
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced_size = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced_size = 0
+        with NamedTemporaryFile(dir=os.path.dirname(path), prefix=".tmp-", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+        self._writes_since_check += 1
+        with self.lock():
+            size = self.read_size()
+            if (size is not None) and (self._writes_since_check < self.full_check_interval):
+                size += len(data) - replaced_size
+                if size <= self.max_size:
+                    self.write_size(size)
+                    return
+            self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """
+        :return: List of (time of last use, size, path) tuples for all entries
+        """
+        entries = []
+        for root, dirs, files in os.walk(self.folder):
+            for f in files:
+                if f.startswith("."):
+                    continue
+                p = os.path.join(root, f)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+        return entries
+
+    def evict(self):
+        with self.lock():
+            self._evict()
+
+    def _evict(self):
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for mtime, size, p in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(p)
+                logger.debug("Evicted {} from cache".format(p))
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.write_size(total)
+        self._writes_since_check = 0
+
+
+class ResultCache(DiskCache):
+    """
+    Cache of Artemis results (the JSON string returned by VersionDetector.detect)
+    """
+    def __init__(self, folder=os.path.join(CACHE_FOLDER, "results"), max_size=RESULT_CACHE_MAX_SIZE):
+        super(ResultCache, self).__init__(folder, max_size)
+
+    @staticmethod
+    def make_key(file_hash, rules_stamp, **fields):
+        """
+        :param file_hash: Hash of the contents of the input file
+        :param rules_stamp: Version stamp of the rules (patterns, logos database, thresholds) used to produce result
+        :param fields: Any other value result depends on (declared title, version, authors, etc.)
+        :return: Cache key
+        """
+        h = hashlib.sha256()
+        h.update(json.dumps([file_hash, rules_stamp, fields], sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        data = self.get_bytes(key)
+        if data is not None:
+            return data.decode('utf-8')
+        return None
+
+    def set(self, key, result):
+        self.set_bytes(key, result.encode('utf-8'))
+
+
+class ArtifactStore(DiskCache):
+    """
+    Persistent store of artifacts extracted from documents (extracted text, CERMINE outputs, etc.), keyed by the hash
+    of the document's contents. Artifacts are stored compressed: text and files as gzip, folders as gzipped tarballs
+    """
+    kinds = ['text', 'file', 'folder']
+
+    def __init__(self, folder=os.path.join(CACHE_FOLDER, "artifacts"), max_size=ARTIFACT_STORE_MAX_SIZE):
+        super(ArtifactStore, self).__init__(folder, max_size)
+
+    @staticmethod
+    def make_key(document_key, name):
+        return "{}-v{}-{}".format(document_key, ARTIFACT_STORE_VERSION, name)
+
+    def save(self, document_key, name, kind, value):
+        """
+        :param document_key: Hash of the contents of the document artifact was extracted from
+        :param name: Name of artifact
+        :param kind: 'text' (value is a string), 'file' or 'folder' (value is a path)
+        :param value: Artifact
+        """
+        if kind == 'text':
+            data = gzip.compress(value.encode('utf-8'))
+        elif kind == 'file':
+            with open(value, 'rb') as f:
+                data = gzip.compress(f.read())
+        elif kind == 'folder':
+            buffer = io.BytesIO()
+            with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+                tar.add(value, arcname='.')
+            data = buffer.getvalue()
+        else:
+            raise ValueError("{} is not a supported kind of artifact".format(kind))
+        self.set_bytes(self.make_key(document_key, name), data)
+        logger.debug("Stored artifact '{}' of {} ({} bytes)".format(name, document_key, len(data)))
+
+    def load(self, document_key, name, kind, location=None):
+        """
+        :param document_key: Hash of the contents of the document artifact was extracted from
+        :param name: Name of artifact
+        :param kind: 'text', 'file' or 'folder'
+        :param location: Path where 'file' or 'folder' artifacts should be restored
+        :return: The artifact (for 'text') or location where it was restored; None if artifact is not in store
+        """
+        data = self.get_bytes(self.make_key(document_key, name))
+        if data is None:
+            return None
+        logger.debug("Restoring artifact '{}' of {} from store".format(name, document_key))
+        try:
+            if kind == 'text':
+                return gzip.decompress(data).decode('utf-8')
+            elif kind == 'file':
+                with open(location, 'wb') as f:
+                    f.write(gzip.decompress(data))
+                return location
+            elif kind == 'folder':
+                if os.path.exists(location):
+                    shutil.rmtree(location)
+                os.makedirs(location)
+                with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as tar:
+                    if hasattr(tarfile, 'data_filter'):
+                        tar.extractall(location, filter='data')
+                    else:
+                        tar.extractall(location)
+                return location
+        except (OSError, EOFError, tarfile.TarError, UnicodeDecodeError) as e:
+            logger.error("Could not restore artifact '{}' of {}: {}".format(name, document_key, e))
+            self.delete(self.make_key(document_key, name))
+            return None
+        raise ValueError("{} is not a supported kind of artifact".format(kind))
@@ -0,0 +1,242 @@
+import atexit
+import os
+import subprocess
+import threading
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+PARENT_FOLDER = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CERMINE_JAR = os.path.join(PARENT_FOLDER, "cermine-impl-1.13-jar-with-dependencies.jar")
+CERMINE_MAIN_CLASS = "pl.edu.icm.cermine.ContentExtractor"
+CERMINE_WORKER_SOURCE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "CermineWorker.java")
+CERMINE_POOL_SIZE = int(os.environ.get("ARTEMIS_CERMINE_WORKERS", 1))
+# seconds CERMINE may take on a job before its JVM is killed
+CERMINE_TIMEOUT = int(os.environ.get("ARTEMIS_CERMINE_TIMEOUT", 600))
+
+
+class CermineWorkerError(Exception):
+    pass
+
+
+class CermineTimeout(CermineWorkerError):
+    pass
+
+
+def run_cermine_once(directory, outputs, jar_path=CERMINE_JAR, timeout=CERMINE_TIMEOUT):
+    """
+    Runs CERMINE in a new JVM (the pre-pool behaviour); used when no warm worker can be started
+    :param directory: Folder containing the PDF file(s) to process
+    :param outputs: Comma-separated list of CERMINE outputs (e.g. "jats,images")
+    :param jar_path: Path to CERMINE's standalone JAR file
+    :param timeout: Seconds after which CERMINE is killed
+    :return: True if CERMINE completed; False otherwise
+    """
+    try:
+        # CERMINE's console output is discarded, so that it never mixes with ours (e.g. batch results on stdout)
+        subprocess.run(["java", "-cp", jar_path, CERMINE_MAIN_CLASS, "-path", directory, "-outputs", outputs],
+                       check=True, stdout=subprocess.DEVNULL, timeout=timeout)
+    except subprocess.CalledProcessError as e:
+        logger.error("return code: {}; output: {}".format(e.returncode, e.output))
+        return False
+    except subprocess.TimeoutExpired:
+        logger.error("CERMINE did not complete within {} seconds on {}".format(timeout, directory))
+        return False
+    except FileNotFoundError as e:
+        logger.error("Could not run CERMINE: {}".format(e))
+        return False
+    return True
+
+
+class CermineWorker:
+    """
+    A JVM running utils/CermineWorker.java, which keeps CERMINE loaded between jobs
+    """
+    def __init__(self, jar_path=CERMINE_JAR, command=None):
+        """
+        :param jar_path: Path to CERMINE's standalone JAR file
+        :param command: Command starting a process that speaks the protocol of CermineWorker.java (by default, that
+            worker itself)
+        """
+        self.jar_path = jar_path
+        # single-file source launch (Java 11+) spares us from keeping compiled classes around
+        self.process = subprocess.Popen(command or ["java", "-cp", jar_path, CERMINE_WORKER_SOURCE],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True, bufsize=1)
+        status = self.process.stdout.readline().strip()
+        if status != "READY":
+            self.close()
+            raise CermineWorkerError("CERMINE worker failed to start (status: '{}')".format(status))
+        logger.debug("Started CERMINE worker (pid {})".format(self.process.pid))
+
+    def run(self, directory, outputs, timeout=CERMINE_TIMEOUT):
+        """
+        Sends a job to this worker and waits for it to complete
+        :param directory: Folder containing the PDF file(s) to process
+        :param outputs: Comma-separated list of CERMINE outputs
+        :param timeout: Seconds after which the worker is killed (it cannot be trusted with other jobs afterwards)
+        :return: True if CERMINE completed; False if CERMINE reported an error
+        :raise CermineTimeout: If the worker was killed after timeout seconds
+        :raise CermineWorkerError: If the worker died or broke the protocol
+        """
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            self.process.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            self.process.stdin.write("{}\t{}\n".format(directory, outputs))
+            self.process.stdin.flush()
+            status = self.process.stdout.readline().strip()
+        except (BrokenPipeError, OSError) as e:
+            raise CermineWorkerError("CERMINE worker {} died: {}".format(self.process.pid, e))
+        finally:
+            timer.cancel()
+        if timed_out.is_set():
+            self.process.wait()
+            raise CermineTimeout("CERMINE worker {} killed after {} seconds on {}".format(
+                self.process.pid, timeout, directory))
+        if not status:
+            raise CermineWorkerError("CERMINE worker {} exited unexpectedly".format(self.process.pid))
+        if status != "OK":
+            logger.error("CERMINE worker {} failed on {}: {}".format(self.process.pid, directory, status))
+            return False
+        return True
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+
+class CerminePool:
+    """
+    Pool of warm CERMINE workers. Workers are started on demand, up to size; if they cannot be started (e.g. Java
+    older than 11), the pool falls back to launching a new JVM per job.
+    """
+    def __init__(self, size=CERMINE_POOL_SIZE, jar_path=CERMINE_JAR, timeout=CERMINE_TIMEOUT):
+        """
+        :param size: Maximum number of workers
+        :param jar_path: Path to CERMINE's standalone JAR file
+        :param timeout: Seconds CERMINE may take on a job (see CermineWorker.run)
+        """
+        self.size = max(1, size)
+        self.jar_path = jar_path
+        self.timeout = timeout
+        self.available = True
+        self._idle = []
+        self._started = 0
+        # notified whenever a worker becomes idle or a slot for a new worker frees up
+        self._condition = threading.Condition()
+
+    def start_worker(self):
+        return CermineWorker(self.jar_path)
+
+    def _acquire(self):
+        """
+        :return: An idle (or newly started) worker, waiting for one if size workers are busy; None if workers cannot
+            be started
+        """
+        with self._condition:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if not self.available and not self._started:
+                    return None
+                if self.available and self._started < self.size:
+                    self._started += 1
+                    break
+                self._condition.wait()
+        try:
+            return self.start_worker()
+        except (CermineWorkerError, OSError) as e:
+            logger.warning("{}; falling back to one JVM per CERMINE run".format(e))
+            with self._condition:
+                self._started -= 1
+                self.available = False
+                self._condition.notify_all()
+            return None
+
+    def _release(self, worker):
+        with self._condition:
+            self._idle.append(worker)
+            self._condition.notify()
+
+    def _discard(self, worker):
+        worker.close()
+        with self._condition:
+            self._started -= 1
+            # a waiting caller may start a replacement
+            self._condition.notify()
+
+    def extract(self, directory, outputs):
+        """
+        Runs CERMINE on all PDF files in directory
+        :param directory: Folder containing the PDF file(s) to process
+        :param outputs: Comma-separated list of CERMINE outputs (e.g. "jats,images")
+        :return: True if CERMINE completed; False otherwise (CERMINE is run again in a new JVM only if the worker
+            crashed, not if it timed out)
+        """
+        worker = self._acquire()
+        if worker is None:
+            return run_cermine_once(directory, outputs, jar_path=self.jar_path, timeout=self.timeout)
+        try:
+            result = worker.run(directory, outputs, timeout=self.timeout)
+        except CermineTimeout as e:
+            logger.error(e)
+            self._discard(worker)
+            return False
+        except CermineWorkerError as e:
+            logger.error(e)
+            self._discard(worker)
+            return run_cermine_once(directory, outputs, jar_path=self.jar_path, timeout=self.timeout)
+        except BaseException:
+            self._discard(worker)
+            raise
+        self._release(worker)
+        return result
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+        for worker in idle:
+            worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_cermine_pool(size):
+    """
+    Sets the number of warm CERMINE workers used by this process
+    :param size: Maximum number of CERMINE workers
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = CerminePool(size=size)
+    return _pool
+
+
+def get_cermine_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CerminePool()
+        return _pool
+
+
+@atexit.register
+def _close_cermine_pool():
+    if _pool is not None:
+        _pool.close()
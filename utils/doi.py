@@ -0,0 +1,180 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.cache import CACHE_FOLDER, DiskCache
+from utils.common import get_logger
+
+logger = get_logger()
+
+DOI_BASE_URL = "https://doi.org/"
+DOI_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "doi")
+DOI_CACHE_MAX_SIZE = 10 * 1024 * 1024  # bytes
+DOI_POSITIVE_TTL = 30 * 24 * 3600  # seconds; registered DOIs are not normally withdrawn
+DOI_NEGATIVE_TTL = 24 * 3600  # seconds; a DOI may be registered shortly after an article is accepted
+DOI_TIMEOUT = (3.05, 10)  # seconds (connect, read)
+DOI_MIN_REQUEST_INTERVAL = 0.2  # seconds between requests, across all processes sharing DOI_CACHE_FOLDER
+
+
+class RateLimiter:
+    """
+    Spaces requests at least min_interval seconds apart across all processes sharing state_path. Each caller
+    reserves the next free slot under a file lock and then sleeps (outside the lock) until its slot is due
+    """
+    def __init__(self, state_path, min_interval=DOI_MIN_REQUEST_INTERVAL):
+        self.state_path = state_path
+        self.min_interval = min_interval
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+
+    def wait(self):
+        with open(self.state_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    next_slot = float(f.read() or 0)
+                except ValueError:
+                    next_slot = 0
+                now = time.time()
+                slot = max(now, next_slot)
+                f.seek(0)
+                f.truncate()
+                f.write(str(slot + self.min_interval))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class DoiResolver:
+    """
+    Checks whether DOIs are registered, asking the DOI resolver for the redirect only (HEAD request, redirects not
+    followed), so that publisher landing pages are never downloaded. Answers are cached on disk (positive and
+    negative answers with different TTLs) and requests are rate limited across processes
+    """
+    def __init__(self, base_url=DOI_BASE_URL, timeout=DOI_TIMEOUT, cache_folder=DOI_CACHE_FOLDER,
+                 positive_ttl=DOI_POSITIVE_TTL, negative_ttl=DOI_NEGATIVE_TTL,
+                 min_request_interval=DOI_MIN_REQUEST_INTERVAL, pool_size=10):
+        """
+        :param base_url: URL of DOI resolver
+        :param timeout: Timeout of requests, in seconds, as a (connect, read) tuple
+        :param cache_folder: Folder of persistent cache; if None, answers are only cached in memory
+        :param positive_ttl: Time (in seconds) for which a DOI found to resolve is cached
+        :param negative_ttl: Time (in seconds) for which a DOI found not to resolve is cached
+        :param min_request_interval: Minimum time (in seconds) between two requests to base_url
+        :param pool_size: Maximum number of connections kept open
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'Artemis (https://github.com/afs25/artemis)'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=1)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = DiskCache(cache_folder, DOI_CACHE_MAX_SIZE) if cache_folder else None
+        self.rate_limiter = RateLimiter(os.path.join(cache_folder, ".rate_limit"), min_request_interval) \
+            if (cache_folder and min_request_interval) else None
+        self._memory_cache = {}
+        self._lock = threading.Lock()
+
+    def cache_key(self, doi):
+        return hashlib.sha256((self.base_url + doi.lower()).encode('utf-8')).hexdigest()
+
+    def cached_answer(self, doi):
+        """
+        :param doi: DOI
+        :return: Cached answer (True or False); None if DOI is not in cache or cached answer has expired
+        """
+        key = self.cache_key(doi)
+        with self._lock:
+            entry = self._memory_cache.get(key)
+        if (entry is None) and self.cache:
+            data = self.cache.get_bytes(key)
+            if data:
+                try:
+                    entry = json.loads(data.decode('utf-8'))
+                except ValueError:
+                    entry = None
+        if entry is None:
+            return None
+        ttl = self.positive_ttl if entry['resolves'] else self.negative_ttl
+        if time.time() - entry['checked'] > ttl:
+            return None
+        with self._lock:
+            self._memory_cache[key] = entry
+        return entry['resolves']
+
+    def cache_answer(self, doi, resolves):
+        key = self.cache_key(doi)
+        entry = {'doi': doi, 'resolves': resolves, 'checked': time.time()}
+        with self._lock:
+            self._memory_cache[key] = entry
+        if self.cache:
+            try:
+                self.cache.set_bytes(key, json.dumps(entry).encode('utf-8'))
+            except OSError as e:
+                logger.error("Could not cache answer for DOI {}: {}".format(doi, e))
+
+    def request(self, doi):
+        """
+        Asks the DOI resolver about doi
+        :param doi: DOI
+        :return: True if DOI resolves; False if resolver does not know DOI; None if answer could not be obtained
+        """
+        url = self.base_url + quote(doi, safe="/:;()")
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+        try:
+            r = self.session.head(url, allow_redirects=False, timeout=self.timeout)
+            if r.status_code in [405, 501]:  # HEAD not supported; the body will not be read
+                r = self.session.get(url, allow_redirects=False, timeout=self.timeout, stream=True)
+                r.close()
+        except requests.RequestException as e:
+            logger.error("Could not check DOI {}: {}".format(doi, e))
+            return None
+        logger.debug("DOI {}: status code {}; location {}".format(doi, r.status_code, r.headers.get('Location')))
+        if r.is_redirect or r.ok:
+            return True
+        if r.status_code == 404:
+            return False
+        logger.error("Unexpected status code {} while checking DOI {}".format(r.status_code, doi))
+        return None
+
+    def resolves(self, doi):
+        """
+        :param doi: DOI
+        :return: True if DOI resolves; False if it does not; None if this could not be determined
+        """
+        answer = self.cached_answer(doi)
+        if answer is not None:
+            logger.debug("Cached answer for DOI {}: {}".format(doi, answer))
+            return answer
+        answer = self.request(doi)
+        if answer is not None:
+            self.cache_answer(doi, answer)
+        return answer
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_doi_resolver():
+    """
+    :return: This process' DoiResolver (created on first use)
+    """
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = DoiResolver()
+        return _resolver
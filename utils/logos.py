@@ -1,24 +1,53 @@
-import glob
-import imghdr
+import argparse
+import fcntl
+import hashlib
 import json
-import logging
-import logging.config
 import os
+import re
 import subprocess
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from PIL import Image
 import imagehash
+import numpy
 import pytesseract
-import shelve
 
 from difflib import SequenceMatcher
 
+from utils.common import get_logger
+
 PARENT_FOLDER = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-logging.config.fileConfig(os.path.join(PARENT_FOLDER, 'logging.conf'), defaults={'logfilename': 'logos.log'})
-logger = logging.getLogger(__name__)
+logger = get_logger()
 
-SHELVE_DB_BASENAME = os.path.join(os.path.dirname(os.path.realpath(__file__)), "logos_shelve_db")
+# the logos database is made of a table of the hashes of all logos (LOGOS_DB_BASENAME + ".npy"), which worker
+# processes memory-map, and a sidecar with their names, sizes and metadata, in the same order (+ ".json"); it is
+# kept next to this module unless ARTEMIS_LOGOS_DB_DIR gives another (writable) folder
+LOGOS_DB_FOLDER = os.environ.get("ARTEMIS_LOGOS_DB_DIR", os.path.dirname(os.path.realpath(__file__)))
+LOGOS_DB_BASENAME = os.path.join(LOGOS_DB_FOLDER, "logos_db")
+LOGOS_DB_VERSION = 1
+LOGO_HASHES_DTYPE = numpy.dtype([('average_hash', '<u8'), ('perception_hash', '<u8')])
 LOGOS_LIBRARY = os.path.join(PARENT_FOLDER, "publisher_logos")
+# perceptual hashes are more discriminating than average hashes, so a match found with the latter is confirmed if
+# the perceptual hashes differ by at most this much
+MAX_PERCEPTION_HASH_DIFFERENCE = 10
+
+# images extracted from documents are only compared to logos if their width and height are within this factor of those
+# of the logos in the database, and their aspect ratio within this factor of the logos' aspect ratios
+LOGO_SIZE_TOLERANCE = 4
+LOGO_ASPECT_RATIO_TOLERANCE = 1.5
+MIN_LOGO_SIDE = 16  # pixels; smaller images cannot be told apart by their hashes
+# images are decoded at (roughly) this resolution to be compared to all logos at once; the average hashes of images
+# reduced this way may differ from those of the full-size images by a few bits, which that comparison allows for, and
+# the images it selects are hashed again at full resolution, like the logos in the database
+HASH_DECODE_SIZE = 64
+REDUCED_HASH_TOLERANCE = 4
+# page number in the names of images extracted by CERMINE (e.g. img_1_2.png)
+IMAGE_PAGE_PATTERN = re.compile(r"img_(\d+)_")
+
+# number of bits set in each byte value
+POPCOUNT_TABLE = numpy.array([bin(i).count('1') for i in range(256)], dtype=numpy.uint8)
 
 
 class PublisherLogo:
@@ -40,18 +69,6 @@ class PublisherLogo:
     def __repr__(self):
         return "PublisherLogo object: <name={}>".format(self.name)
 
-    def store_in_db(self):
-        if not self.width:
-            self.calculate_image_size()
-        if not self.text:
-            self.extract_text()
-        if not self.average_hash:
-            self.calculate_average_hash()
-        if not self.perception_hash:
-            self.calculate_perception_hash()
-        with shelve.open(SHELVE_DB_BASENAME) as db:
-            db[self.name] = self
-
     def calculate_image_size(self):
         with Image.open(self.path) as im:
             self.width, self.height = im.size
@@ -121,25 +138,437 @@ class PublisherLogo:
         return False
 
 
+def pack_hash(image_hash):
+    """
+    :param image_hash: imagehash.ImageHash of 64 bits (hash_size=8, the default)
+    :return: image_hash packed into an unsigned 64-bit integer
+    """
+    bits = numpy.asarray(image_hash.hash, dtype=bool).flatten()
+    if bits.size != 64:
+        raise ValueError("Only 64-bit hashes can be packed (got {} bits)".format(bits.size))
+    return int(numpy.packbits(bits).view('>u8')[0])
+
+
+def image_page(path):
+    """
+    :param path: Path to image extracted by CERMINE
+    :return: Number of page image was extracted from; None if unknown
+    """
+    m = IMAGE_PAGE_PATTERN.search(os.path.basename(path))
+    return int(m.group(1)) if m else None
+
+
+def load_reduced_image(path, size=HASH_DECODE_SIZE):
+    """
+    :return: Greyscale image at path, reduced to at most size x size pixels (JPEG images are decoded at reduced
+        resolution straight away)
+    """
+    with Image.open(path) as im:
+        im.draft('L', (size, size))
+        im = im.convert('L')
+    im.thumbnail((size, size))
+    return im
+
+
+def average_hashes(images):
+    """
+    Calculates the average hashes of images in one batch: the same bits as imagehash.average_hash of each image, with
+    the default hash size. Images reduced by load_reduced_image may not hash quite like the full-size images they were
+    reduced from (up to REDUCED_HASH_TOLERANCE bits may differ)
+    :param images: List of greyscale images
+    :return: Array of packed hashes (see pack_hash)
+    """
+    if not images:
+        return numpy.array([], dtype=numpy.uint64)
+    pixels = numpy.stack([numpy.asarray(im.resize((8, 8), Image.LANCZOS), dtype=numpy.float64) for im in images])
+    bits = pixels.reshape(len(images), 64) > pixels.reshape(len(images), 64).mean(axis=1, keepdims=True)
+    return numpy.packbits(bits, axis=1).view('>u8').ravel().astype(numpy.uint64)
+
+
+def hamming_distances(a, b):
+    """
+    :param a: Array of n packed hashes (see pack_hash)
+    :param b: Array of m packed hashes
+    :return: n x m array of the number of bits that differ between each hash of a and each hash of b
+    """
+    a = numpy.asarray(a, dtype=numpy.uint64)
+    b = numpy.asarray(b, dtype=numpy.uint64)
+    x = numpy.bitwise_xor(a[:, None], b[None, :])
+    return POPCOUNT_TABLE[x.view(numpy.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=numpy.int32)
+
+
+class LogoIndex:
+    """
+    Holds the hashes of all logos of the database in memory as packed 64-bit integers, so that images can be compared
+    to every logo at once, however many logos there are: images whose reduced average hash is close enough to that of
+    a logo are then hashed at full resolution (like the logos), and confirmed by comparing both their average and
+    perceptual hashes to those of the logo
+    """
+    def __init__(self, logos, average_hashes, perception_hashes):
+        """
+        :param logos: List of PublisherLogo instances
+        :param average_hashes: Array of the packed average hashes of logos (see pack_hash), in the same order
+        :param perception_hashes: Array of the packed perceptual hashes of logos, in the same order
+        """
+        self.logos = logos
+        self.average_hashes = average_hashes
+        self.perception_hashes = perception_hashes
+
+    def __len__(self):
+        return len(self.logos)
+
+    @classmethod
+    def from_logos(cls, logos):
+        """
+        :param logos: List of PublisherLogo instances with average and perception hashes (or paths to their images)
+        :return: LogoIndex of logos (those whose hashes are unavailable are left out)
+        """
+        indexed = []
+        average_hashes = []
+        perception_hashes = []
+        for logo in logos:
+            try:
+                average_hash = pack_hash(logo.average_hash or logo.calculate_average_hash())
+                perception_hash = pack_hash(logo.perception_hash or logo.calculate_perception_hash())
+            except (ValueError, OSError, AttributeError) as e:
+                logger.error("Logo {} could not be indexed: {}".format(logo.name, e))
+                continue
+            indexed.append(logo)
+            average_hashes.append(average_hash)
+            perception_hashes.append(perception_hash)
+        return cls(indexed, numpy.array(average_hashes, dtype=numpy.uint64),
+                   numpy.array(perception_hashes, dtype=numpy.uint64))
+
+    @classmethod
+    def from_db(cls, basename=LOGOS_DB_BASENAME):
+        """
+        :param basename: Path to logos database, without extension (see update_logos_db)
+        :return: LogoIndex of all logos in database, whose hashes are memory-mapped (so that the pages holding them
+            are shared by all processes using the database); empty if the database could not be read
+        """
+        try:
+            entries = read_logos_db_sidecar(basename)
+            hashes = numpy.load(basename + ".npy", mmap_mode='r') if entries else \
+                numpy.zeros(0, dtype=LOGO_HASHES_DTYPE)
+            if len(hashes) != len(entries):
+                raise ValueError("{} hashes for {} logos".format(len(hashes), len(entries)))
+        except (OSError, ValueError) as e:
+            logger.error("Could not read logos database {}: {}".format(basename, e))
+            return cls([], numpy.zeros(0, dtype=numpy.uint64), numpy.zeros(0, dtype=numpy.uint64))
+        logos = [PublisherLogo(e['name'], width=e.get('width'), height=e.get('height'), text=e.get('text'),
+                               **e.get('metadata', {})) for e in entries]
+        return cls(logos, hashes['average_hash'], hashes['perception_hash'])
+
+    def size_limits(self):
+        """
+        :return: (min width, min height, max width, max height, min aspect ratio, max aspect ratio) of images that
+            may be logos, based on the sizes of the logos in the index; None if some logos have no known size
+        """
+        sizes = [(logo.width, logo.height) for logo in self.logos]
+        if not sizes or not all(w and h for w, h in sizes):
+            return None
+        widths, heights = zip(*sizes)
+        ratios = [w / h for w, h in sizes]
+        return (max(MIN_LOGO_SIDE, min(widths) / LOGO_SIZE_TOLERANCE),
+                max(MIN_LOGO_SIDE, min(heights) / LOGO_SIZE_TOLERANCE),
+                max(widths) * LOGO_SIZE_TOLERANCE, max(heights) * LOGO_SIZE_TOLERANCE,
+                min(ratios) / LOGO_ASPECT_RATIO_TOLERANCE, max(ratios) * LOGO_ASPECT_RATIO_TOLERANCE)
+
+    def candidate_images(self, image_paths, pages=None):
+        """
+        Selects the images that may be logos: those on pages, whose size and aspect ratio are close enough to those of
+        logos in the index, leaving out copies of the same image (e.g. a header logo repeated on every page)
+        :param image_paths: Paths to images extracted by CERMINE
+        :param pages: Numbers of pages logos may be on (all pages if None)
+        :return: List of paths of candidate images
+        """
+        limits = self.size_limits()
+        candidates = []
+        seen = set()
+        for path in image_paths:
+            page = image_page(path)
+            if pages and (page is not None) and (page not in pages):
+                continue
+            if limits:
+                try:
+                    with Image.open(path) as im:  # only reads the header
+                        width, height = im.size
+                except Exception as e:  # PIL raises a variety of exceptions on files that are not images
+                    logger.debug("Could not read {}: {}".format(path, e))
+                    continue
+                min_width, min_height, max_width, max_height, min_ratio, max_ratio = limits
+                if not ((min_width <= width <= max_width) and (min_height <= height <= max_height)
+                        and (min_ratio <= width / height <= max_ratio)):
+                    continue
+            with open(path, 'rb') as f:
+                digest = hashlib.blake2b(f.read(), digest_size=16).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            candidates.append(path)
+        logger.debug("{} of {} images are candidate logos".format(len(candidates), len(image_paths)))
+        return candidates
+
+    def match(self, image_paths, max_hash_difference=5, max_perception_hash_difference=MAX_PERCEPTION_HASH_DIFFERENCE,
+              pages=None):
+        """
+        :param image_paths: Paths to images that may be logos
+        :param max_hash_difference: Maximum number of bits by which the average hashes of an image and a logo may
+            differ
+        :param max_perception_hash_difference: Maximum number of bits by which the perceptual hashes of an image and
+            a logo may differ
+        :param pages: Numbers of pages logos may be on (see candidate_images)
+        :return: List of (path of image, PublisherLogo) tuples for each image matching a logo, in the order of
+            image_paths
+        """
+        if not self.logos:
+            return []
+        paths = []
+        images = []
+        for path in self.candidate_images(image_paths, pages):
+            try:
+                images.append(load_reduced_image(path))
+            except Exception as e:  # PIL raises a variety of exceptions on files that are not images
+                logger.debug("Could not hash {}: {}".format(path, e))
+                continue
+            paths.append(path)
+        if not paths:
+            return []
+        candidates = hamming_distances(average_hashes(images), self.average_hashes) <= \
+            max_hash_difference + REDUCED_HASH_TOLERANCE
+        matches = []
+        for i in numpy.flatnonzero(candidates.any(axis=1)):
+            try:
+                with Image.open(paths[i]) as im:
+                    average_hash = pack_hash(imagehash.average_hash(im))
+                    perception_hash = pack_hash(imagehash.phash(im))
+            except Exception as e:  # PIL raises a variety of exceptions on files that are not images
+                logger.debug("Could not hash {}: {}".format(paths[i], e))
+                continue
+            logo_indices = numpy.flatnonzero(candidates[i])
+            logo_indices = logo_indices[hamming_distances([average_hash], self.average_hashes[logo_indices])[0] <=
+                                        max_hash_difference]
+            distances = hamming_distances([perception_hash], self.perception_hashes[logo_indices])[0]
+            for j, distance in zip(logo_indices, distances):
+                logger.debug("Perception hash difference between {} and {} is {}".format(paths[i],
+                                                                                        self.logos[j].name, distance))
+                if distance <= max_perception_hash_difference:
+                    matches.append((paths[i], self.logos[j]))
+        return matches
+
+
+_logo_indices = {}
+_logo_indices_lock = threading.Lock()
+
+
+def get_logo_index(basename=LOGOS_DB_BASENAME, library=LOGOS_LIBRARY):
+    """
+    :param basename: Path to logos database, without extension
+    :param library: Folder of logos the database is built from if it does not exist yet (e.g. in checkouts that
+        predate it, which only had the shelve database it replaced)
+    :return: LogoIndex of database, loaded once per process
+    """
+    with _logo_indices_lock:
+        if basename not in _logo_indices:
+            if not logos_db_exists(basename):
+                build_missing_logos_db(library, basename)
+            _logo_indices[basename] = LogoIndex.from_db(basename)
+            logger.debug("Loaded {} logos from {}".format(len(_logo_indices[basename]), basename))
+        return _logo_indices[basename]
+
+
+def logos_db_exists(basename=LOGOS_DB_BASENAME):
+    return os.path.exists(basename + ".json") and os.path.exists(basename + ".npy")
+
+
+@contextmanager
+def logos_db_lock(basename=LOGOS_DB_BASENAME):
+    """
+    Serialises updates of the logos database across processes (e.g. worker processes of a pool that all find it
+    missing), so that it is only built once and never from a half-updated previous version
+    """
+    os.makedirs(os.path.dirname(basename) or ".", exist_ok=True)
+    with open(basename + ".lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def build_missing_logos_db(library=LOGOS_LIBRARY, basename=LOGOS_DB_BASENAME):
+    """
+    Builds the logos database in this process (so that it can be done from worker processes of a pool), unless
+    another process built it while this one waited for the lock
+    :return: True if the database exists
+    """
+    try:
+        with logos_db_lock(basename):
+            if logos_db_exists(basename):
+                return True
+            logger.warning("Logos database {} not found; building it from {} (update it with "
+                           "'python -m utils.logos' after changing logos)".format(basename, library))
+            processed, _, _ = _update_logos_db(library, basename, processes=1)
+    except (OSError, ValueError) as e:
+        logger.error("Could not build logos database {}, so no publisher logos will be detected (set "
+                     "ARTEMIS_LOGOS_DB_DIR to a writable folder to build it elsewhere): {}".format(basename, e))
+        return False
+    logger.info("Built logos database {} with {} logos".format(basename, processed))
+    return True
+
+
+def read_logos_db_sidecar(basename=LOGOS_DB_BASENAME):
+    """
+    :return: List of the entries of the logos in database (name, size, text, metadata and digests of the files they
+        were calculated from); empty if there is no database
+    """
+    try:
+        with open(basename + ".json") as f:
+            sidecar = json.load(f)
+    except FileNotFoundError:
+        return []
+    if sidecar.get('version') != LOGOS_DB_VERSION:
+        raise ValueError("Unsupported version of logos database: {}".format(sidecar.get('version')))
+    return sidecar['logos']
+
+
+def is_image(path):
+    """
+    :return: True if PIL recognises the file at path as an image (only its header is read)
+    """
+    try:
+        with Image.open(path):
+            return True
+    except Exception:  # PIL raises a variety of exceptions on files that are not images
+        return False
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def index_logo(file_path):
+    """
+    Calculates everything the logos database holds about an image of a logo (run in worker processes)
+    :param file_path: Path to image of logo
+    :return: Dictionary of width, height, text (recognised by Tesseract; None if it failed) and packed hashes
+    """
+    pl = PublisherLogo(os.path.basename(file_path), path=file_path)
+    pl.calculate_image_size()
+    try:
+        pl.extract_text()
+    except Exception as e:  # Tesseract may be missing or fail on some images
+        logger.warning("Could not extract text from {}: {}".format(file_path, e))
+    return {
+        'width': pl.width,
+        'height': pl.height,
+        'text': pl.text,
+        'average_hash': pack_hash(pl.calculate_average_hash()),
+        'perception_hash': pack_hash(pl.calculate_perception_hash()),
+    }
+
+
+def write_logos_db(entries, hashes, basename=LOGOS_DB_BASENAME):
+    """
+    Replaces the logos database atomically, so that processes loading it never see a half-written one (callers
+    hold logos_db_lock, so that concurrent updates do not interleave)
+    :param entries: List of the entries of logos (see read_logos_db_sidecar)
+    :param hashes: List of (average hash, perception hash) tuples of logos, in the same order
+    """
+    table = numpy.array(hashes, dtype=LOGO_HASHES_DTYPE)
+    # temporary files are per process, as worker processes may build a missing database at the same time
+    suffix = ".{}.tmp".format(os.getpid())
+    with open(basename + ".npy" + suffix, 'wb') as f:
+        numpy.save(f, table)
+    with open(basename + ".json" + suffix, 'w') as f:
+        json.dump({'version': LOGOS_DB_VERSION, 'logos': entries}, f, indent=1)
+    os.replace(basename + ".npy" + suffix, basename + ".npy")
+    os.replace(basename + ".json" + suffix, basename + ".json")
+
+
+def update_logos_db(library=LOGOS_LIBRARY, basename=LOGOS_DB_BASENAME, processes=None, full=False):
+    """
+    Updates the logos database with the logos in library (images, each with a JSON file of metadata of the same
+    name, e.g. elsevier.png and elsevier.json). Only logos whose image or metadata changed since the last update are
+    processed again, on a pool of processes; logos no longer in library are removed
+    :param processes: Number of processes running OCR and hashing (number of CPUs if None; if 1, logos are processed
+        in this process)
+    :param full: If True, all logos are processed again
+    :return: Tuple of the numbers of logos processed, reused and removed
+    """
+    with logos_db_lock(basename):
+        return _update_logos_db(library, basename, processes, full)
+
+
+def _update_logos_db(library, basename, processes, full=False):
+    previous = {}
+    if not full:
+        try:
+            entries = read_logos_db_sidecar(basename)
+            table = numpy.load(basename + ".npy") if entries else []
+            previous = {e['name']: (e, tuple(int(h) for h in row)) for e, row in zip(entries, table)}
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read previous logos database {} ({}); rebuilding it".format(basename, e))
+
+    entries = {}
+    hashes = {}
+    to_index = []
+    for filename in sorted(os.listdir(library)):
+        file_path = os.path.join(library, filename)
+        if not (os.path.isfile(file_path) and is_image(file_path)):
+            continue
+        with open(os.path.join(library, os.path.splitext(filename)[0] + '.json')) as f:
+            metadata = json.load(f)
+        entry = {
+            'name': filename,
+            'metadata': metadata,
+            'image_sha256': file_digest(file_path),
+            'metadata_sha256': hashlib.sha256(json.dumps(metadata, sort_keys=True).encode('utf-8')).hexdigest(),
+        }
+        old = previous.get(filename)
+        if old and (old[0]['image_sha256'] == entry['image_sha256']):
+            entry.update({k: old[0].get(k) for k in ['width', 'height', 'text']})
+            hashes[filename] = old[1]
+            if old[0]['metadata_sha256'] != entry['metadata_sha256']:
+                logger.info("Updated metadata of logo {}".format(filename))
+        else:
+            to_index.append(file_path)
+        entries[filename] = entry
+
+    if to_index:
+        executor = ProcessPoolExecutor(max_workers=processes) if processes != 1 else None
+        try:
+            indexed_logos = executor.map(index_logo, to_index) if executor else map(index_logo, to_index)
+            for file_path, indexed in zip(to_index, indexed_logos):
+                filename = os.path.basename(file_path)
+                entries[filename].update({k: indexed[k] for k in ['width', 'height', 'text']})
+                hashes[filename] = (indexed['average_hash'], indexed['perception_hash'])
+                logger.info("Indexed logo {}".format(filename))
+        finally:
+            if executor:
+                executor.shutdown()
+
+    removed = [name for name in previous if name not in entries]
+    for name in removed:
+        logger.info("Removed logo {} from logos database".format(name))
+    names = sorted(entries)
+    write_logos_db([entries[n] for n in names], [hashes[n] for n in names], basename)
+    return len(to_index), len(names) - len(to_index), len(removed)
+
+
 def recreate_logos_db():
-    # delete previous version(s) of database (file extension unknown due to peculiarities of shelve module)
-    shelve_db_files = glob.glob(f'{SHELVE_DB_BASENAME}.*')
-    if shelve_db_files:
-        for f in shelve_db_files:
-            os.remove(f)
-            logger.info(f'Deleted previous logos database {f}')
-
-    # create a new shelve database with all logos in the library
-    for filename in os.listdir(LOGOS_LIBRARY):
-        file_path = os.path.join(LOGOS_LIBRARY, filename)
-        if imghdr.what(file_path):
-            json_filename = filename.split('.')[0] + '.json'
-            with open(os.path.join(LOGOS_LIBRARY, json_filename)) as f:
-                metadata = json.load(f)
-            pl = PublisherLogo(filename, path=file_path, **metadata)
-            pl.store_in_db()
-            logger.info("Added logo {} to shelve database".format(pl.name))
+    return update_logos_db(full=True)
 
 
 if __name__ == "__main__":
-    recreate_logos_db()
+    parser = argparse.ArgumentParser(description='Updates the logos database with the logos in {}'.format(
+        LOGOS_LIBRARY))
+    parser.add_argument('--full', dest='full', action="store_true",
+                        help='Process all logos again, not only those that changed')
+    parser.add_argument('-j', '--processes', dest='processes', type=int, metavar='N',
+                        help='Number of processes running OCR and hashing (default: number of CPUs)')
+    arguments = parser.parse_args()
+    processed, reused, removed = update_logos_db(processes=arguments.processes, full=arguments.full)
+    logger.info("Logos database updated: {} logos processed, {} unchanged, {} removed".format(processed, reused,
+                                                                                             removed))
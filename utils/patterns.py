@@ -11,7 +11,7 @@ class VersionPattern:
         :param never_found_on: list of manuscript versions we would not normally expect to find pattern on
         :param error_ratio: the tolerance for fuzzy matching of pattern
         """
-        self.pattern = pattern,
+        self.pattern = pattern
         self.indicative_of = indicative_of
         self.not_found_on = not_found_on
         self.error_ratio = error_ratio
@@ -69,7 +69,7 @@ CC_BY_NC_SA = {'short name': 'CC BY-NC-SA',
 
 ALL_CC_LICENCES = [CC0, CC_BY, CC_BY_NC, CC_BY_ND, CC_BY_SA, CC_BY_NC_ND, CC_BY_NC_SA]
 
-# not currently used anywhere:
+# searched for by utils.scanner (category 'additional_cc_licence'); not currently used in decisions:
 ADDITIONAL_CC_PATTERNS = [
     {'pattern': "This is an open access article under the terms of the CC BY 4.0 license", 'error ratio': 0.1},
     {'pattern': "This is an open access article under the CC BY license", 'error ratio': 0.1},
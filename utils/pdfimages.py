@@ -0,0 +1,225 @@
+import logging
+import os
+
+from PIL import Image
+from PyPDF2 import PdfFileReader, filters as pdf_filters
+from PyPDF2.pdf import ContentStream
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+MAX_FORM_DEPTH = 5  # levels of nested form XObjects searched for images
+# PIL modes of the colour spaces of images that are decoded
+COLOUR_MODES = {
+    '/DeviceGray': 'L',
+    '/CalGray': 'L',
+    '/DeviceRGB': 'RGB',
+    '/CalRGB': 'RGB',
+    '/DeviceCMYK': 'CMYK',
+}
+# extensions of files written for images whose data are kept encoded
+ENCODED_IMAGE_EXTENSIONS = {
+    '/DCTDecode': '.jpg',
+    '/JPXDecode': '.jp2',
+}
+# filters that may precede those of ENCODED_IMAGE_EXTENSIONS in the filter chain of an image, which are undone before
+# the image is written (PyPDF2 cannot decode a chain ending in /DCTDecode itself)
+PRECEDING_FILTERS = {
+    '/FlateDecode': pdf_filters.FlateDecode,
+    '/LZWDecode': pdf_filters.LZWDecode,
+    '/ASCIIHexDecode': pdf_filters.ASCIIHexDecode,
+    '/ASCII85Decode': pdf_filters.ASCII85Decode,
+}
+
+
+def iter_image_objects(resources, depth=0, seen=None):
+    """
+    :param resources: /Resources dictionary of a page or form XObject
+    :return: Generator of the image XObjects used by resources, including those inside form XObjects
+    """
+    if seen is None:
+        seen = set()
+    x_objects = resources.get('/XObject') if resources else None
+    if not x_objects:
+        return
+    x_objects = x_objects.getObject()
+    for name in sorted(x_objects):
+        reference = x_objects.raw_get(name)
+        key = (reference.idnum, reference.generation) if hasattr(reference, 'idnum') else None
+        if key in seen:
+            continue
+        if key:
+            seen.add(key)
+        obj = reference.getObject()
+        subtype = obj.get('/Subtype')
+        if subtype == '/Image':
+            yield obj
+        elif (subtype == '/Form') and (depth < MAX_FORM_DEPTH):
+            form_resources = obj.get('/Resources')
+            yield from iter_image_objects(form_resources.getObject() if form_resources else None, depth + 1, seen)
+
+
+def page_resources(page):
+    resources = page.get('/Resources')
+    return resources.getObject() if resources else None
+
+
+def has_inline_images(page, reader):
+    """
+    :param page: Page of a PDF file
+    :param reader: PdfFileReader of the file
+    :return: True if the content stream of page draws any inline image (BI ... ID ... EI)
+    """
+    contents = page.getContents()
+    if contents is None:
+        return False
+    if not isinstance(contents, ContentStream):
+        contents = ContentStream(contents, reader)
+    return any(operator == b"INLINE IMAGE" for _, operator in contents.operations)
+
+
+def page_has_image(path, page_number=1):
+    """
+    Reads the resources and the content stream of a page of a PDF file (without decoding any image)
+    :param path: Path to PDF file
+    :param page_number: Number of page (starting at 1)
+    :return: True if page uses any image (image XObject or inline image); False if not; None if file could not be
+        read
+    """
+    try:
+        with open(path, 'rb') as f:
+            reader = PdfFileReader(f, strict=False)
+            if page_number > reader.getNumPages():
+                return False
+            page = reader.getPage(page_number - 1)
+            for _ in iter_image_objects(page_resources(page)):
+                return True
+            return has_inline_images(page, reader)
+    except Exception as e:  # PyPDF2 raises a variety of exceptions on malformed files
+        logger.error("Could not read images of page {} of {}: {}".format(page_number, path, e))
+        return None
+
+
+def filters_of(obj):
+    filters = obj.get('/Filter') or []
+    if not isinstance(filters, list):
+        filters = [filters]
+    return [str(f) for f in filters]
+
+
+def encoded_image_data(obj, filters):
+    """
+    :param obj: Image XObject whose last filter is in ENCODED_IMAGE_EXTENSIONS
+    :param filters: Filters of obj (see filters_of)
+    :return: Data of obj decoded by all its filters but the last (e.g. a JPEG file compressed with /FlateDecode)
+    :raise NotImplementedError: If a preceding filter is not in PRECEDING_FILTERS
+    """
+    data = obj._data
+    parameters = obj.get('/DecodeParms')
+    parameters = parameters.getObject() if hasattr(parameters, 'getObject') else parameters
+    if not isinstance(parameters, list):
+        parameters = [parameters]
+    for i, f in enumerate(filters[:-1]):
+        if f not in PRECEDING_FILTERS:
+            raise NotImplementedError("unsupported filter {} before {}".format(f, filters[-1]))
+        p = parameters[i] if i < len(parameters) else None
+        p = p.getObject() if hasattr(p, 'getObject') else p
+        data = PRECEDING_FILTERS[f].decode(data, p if isinstance(p, dict) else None)
+    return data
+
+
+def decode_image(obj):
+    """
+    :param obj: Image XObject whose data are not kept encoded (see ENCODED_IMAGE_EXTENSIONS)
+    :return: PIL image; None if its colour space or depth is not supported
+    """
+    width = int(obj['/Width'])
+    height = int(obj['/Height'])
+    bits = int(obj.get('/BitsPerComponent', 8))
+    colour_space = obj.get('/ColorSpace')
+    colour_space = colour_space.getObject() if hasattr(colour_space, 'getObject') else colour_space
+    palette = None
+    if isinstance(colour_space, list) and (str(colour_space[0]) == '/Indexed'):
+        base = colour_space[1].getObject()
+        if isinstance(base, list):
+            base = base[0]
+        lookup = colour_space[3].getObject()
+        if hasattr(lookup, 'getData'):
+            lookup = lookup.getData()
+        elif isinstance(lookup, str):  # PyPDF2 decodes byte strings that look like text
+            lookup = lookup.original_bytes
+        base_mode = COLOUR_MODES.get(str(base))
+        if (base_mode not in ['L', 'RGB']) or (bits != 8):
+            return None
+        palette = lookup if base_mode == 'RGB' else bytes(b for v in lookup for b in (v, v, v))
+        mode = 'P'
+    else:
+        if isinstance(colour_space, list) and (str(colour_space[0]) == '/ICCBased'):
+            components = int(colour_space[1].getObject().get('/N', 3))
+            colour_space = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}.get(components)
+        if obj.get('/ImageMask') or (colour_space is None):
+            colour_space = '/DeviceGray'
+        mode = COLOUR_MODES.get(str(colour_space))
+        if mode is None:
+            return None
+        if bits == 1 and mode == 'L':
+            mode = '1'
+        elif bits != 8:
+            return None
+    im = Image.frombytes(mode, (width, height), obj.getData())
+    if palette:
+        im.putpalette(palette)
+    return im
+
+
+def extract_page_images(path, page_numbers, folder):
+    """
+    Writes the images used by pages of a PDF file to folder, named like those extracted by CERMINE
+    (img_<number of page>_<number of image>), so that they can be inspected without running CERMINE. JPEG and JPEG
+    2000 images are written as they are stored (once any other filters are undone); others are decoded and written as
+    PNG files. Inline images are not extracted: they are limited to a few kilobytes, too small for logos
+    :param path: Path to PDF file
+    :param page_numbers: Numbers of pages (starting at 1)
+    :param folder: Folder images are written to (created if needed)
+    :return: Number of images written
+    """
+    os.makedirs(folder, exist_ok=True)
+    written = 0
+    with open(path, 'rb') as f:
+        reader = PdfFileReader(f, strict=False)
+        number_of_pages = reader.getNumPages()
+        for page_number in page_numbers:
+            if not 1 <= page_number <= number_of_pages:
+                continue
+            page = reader.getPage(page_number - 1)
+            for n, obj in enumerate(iter_image_objects(page_resources(page))):
+                file_path = os.path.join(folder, "img_{}_{}".format(page_number, n))
+                try:
+                    filters = filters_of(obj)
+                    if filters and (filters[-1] in ENCODED_IMAGE_EXTENSIONS):
+                        data = encoded_image_data(obj, filters)
+                        with open(file_path + ENCODED_IMAGE_EXTENSIONS[filters[-1]], 'wb') as out:
+                            out.write(data)
+                    else:
+                        im = decode_image(obj)
+                        if im is None:
+                            logger.debug("Skipped image {} of page {} of {} (unsupported colour space or "
+                                         "depth)".format(n, page_number, path))
+                            continue
+                        im.save(file_path + '.png')
+                except NotImplementedError as e:
+                    logger.debug("Skipped image {} of page {} of {} ({})".format(n, page_number, path, e))
+                    continue
+                except Exception as e:  # PyPDF2 and PIL raise a variety of exceptions on malformed streams
+                    logger.debug("Could not extract image {} of page {} of {}: {}".format(n, page_number, path, e))
+                    continue
+                written += 1
+            if logger.isEnabledFor(logging.DEBUG):  # the content stream is only parsed to say so
+                try:
+                    if has_inline_images(page, reader):
+                        logger.debug("Skipped inline images of page {} of {} (not extracted)".format(page_number,
+                                                                                                    path))
+                except Exception as e:  # PyPDF2 raises a variety of exceptions on malformed content streams
+                    logger.debug("Could not read content stream of page {} of {}: {}".format(page_number, path, e))
+    return written
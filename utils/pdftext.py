@@ -0,0 +1,119 @@
+import subprocess
+from io import StringIO
+
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from PyPDF2 import PdfFileReader
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+PDFTOTEXT = "pdftotext"
+PDFTOTEXT_BATCH_SIZE = 10  # pages extracted by each run of pdftotext while streaming
+
+
+def count_pages(path):
+    """
+    :param path: Path to PDF file
+    :return: Number of pages of PDF file; None if it could not be read
+    """
+    try:
+        with open(path, 'rb') as f:
+            return PdfFileReader(f, strict=False).getNumPages()
+    except Exception as e:  # PyPDF2 raises a variety of exceptions on malformed files
+        logger.error("Could not count pages of {}: {}".format(path, e))
+        return None
+
+
+def split_pages(text, number_of_pages):
+    """
+    :param text: Text of consecutive pages, each terminated by a form feed (as output by pdftotext and pdfminer)
+    :param number_of_pages: Number of pages text was extracted from
+    :return: List of the texts of each page
+    """
+    pages = text.split('\f')[:number_of_pages]
+    return pages + [''] * (number_of_pages - len(pages))
+
+
+def extract_page_range_with_pdftotext(path, first, last):
+    p = subprocess.run([PDFTOTEXT, '-f', str(first), '-l', str(last), '-enc', 'UTF-8', path, '-'],
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return split_pages(p.stdout.decode('utf-8', errors='replace'), last - first + 1)
+
+
+def iter_pages_with_pdfminer(path, first=1, last=None):
+    """
+    :return: Generator of (number of page, text) tuples for pages first to last (or to the end, if last is None);
+        pages are parsed one at a time, so the rest of the file is not processed if the generator is closed early
+    """
+    output = StringIO()
+    resource_manager = PDFResourceManager()
+    converter = TextConverter(resource_manager, output, laparams=LAParams())
+    try:
+        interpreter = PDFPageInterpreter(resource_manager, converter)
+        with open(path, 'rb') as f:
+            for number, page in enumerate(PDFPage.get_pages(f), 1):
+                if number < first:
+                    continue
+                if (last is not None) and (number > last):
+                    break
+                interpreter.process_page(page)
+                text = output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+                yield number, text[:-1] if text.endswith('\f') else text
+    finally:
+        converter.close()
+
+
+def iter_pages(path, first=1, last=None, number_of_pages=None, batch_size=PDFTOTEXT_BATCH_SIZE):
+    """
+    Streams the text of a PDF file page by page, so that consumers can stop once they have seen enough. Pages are
+    extracted with pdftotext, batch_size pages at a time; if pdftotext is not available or fails, the remaining pages
+    are extracted with pdfminer
+    :param path: Path to PDF file
+    :param first: Number of first page to extract (starting at 1)
+    :param last: Number of last page to extract (inclusive); last page of file if None
+    :param number_of_pages: Number of pages of file (counted if None)
+    :param batch_size: Number of pages extracted by each run of pdftotext
+    :return: Generator of (number of page, text) tuples
+    """
+    if number_of_pages is None:
+        number_of_pages = count_pages(path)
+    if (last is None) or (number_of_pages and (last > number_of_pages)):
+        last = number_of_pages
+    page = first
+    if last is not None:
+        while page <= last:
+            batch_last = min(page + batch_size - 1, last)
+            try:
+                texts = extract_page_range_with_pdftotext(path, page, batch_last)
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.debug("Could not extract pages {}-{} of {} with pdftotext ({}); "
+                             "using pdfminer".format(page, batch_last, path, e))
+                break
+            for text in texts:
+                yield page, text
+                page += 1
+    if (last is None) or (page <= last):
+        yield from iter_pages_with_pdfminer(path, page, last)
+
+
+def extract_page_range(path, first, last, number_of_pages=None):
+    """
+    Extracts the text of a range of pages of a PDF file (see iter_pages)
+    :param path: Path to PDF file
+    :param first: Number of first page to extract (starting at 1)
+    :param last: Number of last page to extract (inclusive)
+    :param number_of_pages: Number of pages of file (counted if None)
+    :return: List of the texts of pages first to last; None if text could not be extracted
+    """
+    try:
+        texts = [text for number, text in iter_pages(path, first, last, number_of_pages=number_of_pages)]
+    except Exception as e:  # pdfminer raises a variety of exceptions on malformed files
+        logger.error("Could not extract pages {}-{} of {}: {}".format(first, last, path, e))
+        return None
+    return texts + [''] * (last - first + 1 - len(texts))
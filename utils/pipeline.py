@@ -0,0 +1,140 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+PIPELINE_MAX_WORKERS = int(os.environ.get("ARTEMIS_PIPELINE_WORKERS", 4))
+
+
+class Pipeline:
+    """
+    Runs a small dependency graph of stages on a thread pool. Each stage starts as soon as all the stages it depends
+    on have finished, so independent stages (e.g. reading PDF metadata, extracting text and running CERMINE, which
+    mostly wait on I/O and subprocesses) run concurrently.
+
+    A stage whose function raises still counts as finished for its dependents (as with artifacts that could not be
+    produced, dependents are expected to cope with missing inputs); the exception is re-raised by result()
+    """
+    def __init__(self, max_workers=PIPELINE_MAX_WORKERS):
+        """
+        :param max_workers: Maximum number of stages running at the same time
+        """
+        self.max_workers = max_workers
+        self._stages = {}  # name: (function, dependencies)
+        self._futures = {}
+        self._remaining = {}  # name: dependencies that have not finished yet
+        self._lock = threading.Lock()
+        self._executor = None
+        self._closed = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_stage(self, name, func, dependencies=()):
+        """
+        :param name: Unique name of stage
+        :param func: Function (taking no arguments) run by stage
+        :param dependencies: Names of the stages that must finish before this one starts
+        """
+        if self._executor:
+            raise RuntimeError("Stages cannot be added to a pipeline that has started")
+        self._stages[name] = (func, list(dependencies))
+        self._futures[name] = Future()
+
+    def has_stage(self, name):
+        return name in self._stages
+
+    def check_graph(self):
+        """
+        :raise ValueError: If a stage depends on an unknown stage or stages depend on each other in a cycle
+        """
+        visited = {}
+
+        def visit(name):
+            if visited.get(name) == 'done':
+                return
+            if visited.get(name) == 'visiting':
+                raise ValueError("Stages depend on each other in a cycle involving stage '{}'".format(name))
+            visited[name] = 'visiting'
+            for d in self._stages[name][1]:
+                if d not in self._stages:
+                    raise ValueError("Stage '{}' depends on unknown stage '{}'".format(name, d))
+                visit(d)
+            visited[name] = 'done'
+
+        for n in self._stages:
+            visit(n)
+
+    def start(self):
+        """
+        Starts running stages in the background
+        """
+        self.check_graph()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="artemis-stage")
+        with self._lock:
+            self._remaining = {name: set(deps) for name, (func, deps) in self._stages.items()}
+            ready = [name for name, deps in self._remaining.items() if not deps]
+            for name in ready:
+                self._submit(name)
+
+    def _submit(self, name):
+        del self._remaining[name]
+        self._executor.submit(self._run, name)
+
+    def _run(self, name):
+        future = self._futures[name]
+        if not future.set_running_or_notify_cancel():
+            return
+        func, dependencies = self._stages[name]
+        logger.debug("Starting stage '{}'".format(name))
+        try:
+            future.set_result(func())
+        except Exception as e:
+            logger.debug("Stage '{}' failed: {}".format(name, e))
+            future.set_exception(e)
+        with self._lock:
+            if self._closed:
+                return
+            for other, deps in list(self._remaining.items()):
+                deps.discard(name)
+                if not deps:
+                    self._submit(other)
+
+    def result(self, name, timeout=None):
+        """
+        Waits for stage name to finish
+        :return: Value returned by the function of stage
+        """
+        return self._futures[name].result(timeout)
+
+    def run(self):
+        """
+        Runs all stages and waits for them to finish
+        :return: Dictionary of the values returned by each stage (name: value); stages that raised are left out
+        """
+        with self:
+            results = {}
+            for name in self._stages:
+                try:
+                    results[name] = self.result(name)
+                except Exception as e:
+                    logger.error("Stage '{}' failed: {}".format(name, e))
+            return results
+
+    def close(self):
+        """
+        Cancels stages that have not started and waits for running ones to finish
+        """
+        with self._lock:
+            self._closed = True
+            for name in self._remaining:
+                self._futures[name].cancel()
+        if self._executor:
+            self._executor.shutdown(wait=True)
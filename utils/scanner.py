@@ -0,0 +1,203 @@
+import threading
+
+import regex
+
+from utils.approximate import ApproximateMatcher, fold_case, max_errors_for
+from utils.common import get_logger
+from utils.patterns import ADDITIONAL_CC_PATTERNS, ALL_CC_LICENCES, DOI_PATTERN, RIGHTS_RESERVED_PATTERNS, \
+    VERSION_PATTERNS
+
+logger = get_logger()
+
+# order in which the keys of a CC licence are tried (key, error ratio)
+CC_LICENCE_KEYS = [('url', 0), ('long name', 0.1), ('short name', 0)]
+
+class ScanPattern:
+    """
+    A pattern the scanner should look for
+    """
+    def __init__(self, name, category, pattern, error_ratio=0, literal=True, priority=0, **kwargs):
+        """
+        :param name: Unique name of pattern
+        :param category: Category of pattern (e.g. 'cc_licence', 'additional_cc_licence', 'version',
+            'rights_reserved', 'doi')
+        :param pattern: The text (or, if literal is False, the regex) to look for
+        :param error_ratio: Errors allowed, as a ratio of the length of pattern (0 for exact matches). As in
+            BaseParser.find_match_in_extracted_text, the number of errors must be lower than error_ratio*len(pattern)
+        :param literal: If True, pattern is escaped before compiling
+        :param priority: Used to choose between hits in the same category (lower values first)
+        :param kwargs: Any other information about this pattern (e.g. versions it is indicative of)
+        """
+        self.name = name
+        self.category = category
+        self.pattern = pattern
+        self.error_ratio = error_ratio
+        self.literal = literal
+        self.priority = priority
+        self.info = kwargs
+
+    @property
+    def max_errors(self):
+        return max_errors_for(len(self.pattern), self.error_ratio)
+
+    @property
+    def source(self):
+        return regex.escape(self.pattern) if self.literal else self.pattern
+
+    def verifier(self):
+        return regex.compile(self.source, flags=regex.IGNORECASE)
+
+    def matcher(self):
+        return ApproximateMatcher(self.pattern, self.max_errors)
+
+
+class PatternHit:
+    def __init__(self, scan_pattern, start, end, match, errors):
+        self.scan_pattern = scan_pattern
+        self.start = start
+        self.end = end
+        self.match = match
+        self.errors = errors
+
+    def __repr__(self):
+        return "PatternHit object: <name={}; match='{}'; span=({}, {})>".format(self.scan_pattern.name, self.match,
+                                                                               self.start, self.end)
+
+
+class PatternScanner:
+    """
+    Finds all exact and fuzzy occurrences of a set of patterns in a single pass over a text.
+
+    Literal patterns are split into exact anchors (see utils.approximate.ApproximateMatcher.anchors) and all anchors, along with any
+    non-literal patterns, are compiled into one regex that is tried at every position of the text. Fuzzy patterns
+    are then only verified in the small windows where one of their anchors occurs (and which share enough q-grams
+    with them), instead of being searched for in the whole text one after the other.
+
+    Where several hits of the same category overlap, only the longest (i.e. most specific, e.g. 'CC BY-NC-ND'
+    rather than 'CC BY') is kept.
+    """
+    def __init__(self, scan_patterns):
+        self.scan_patterns = list(scan_patterns)
+        self.verifiers = {p.name: p.verifier() for p in self.scan_patterns}
+        self.matchers = {p.name: p.matcher() for p in self.scan_patterns if p.literal}
+        self.anchors = {}  # lower-cased anchor: list of (scan pattern, offset of anchor in pattern)
+        self.regex_patterns = {}
+        for p in self.scan_patterns:
+            if p.literal:
+                for piece, offset in self.matchers[p.name].anchors():
+                    self.anchors.setdefault(piece, []).append((p, offset))
+            else:
+                self.regex_patterns["r{}".format(len(self.regex_patterns))] = p
+        ordered_anchors = sorted(self.anchors, key=len, reverse=True)
+        # where an anchor is found, all anchors that are a prefix of it occur at that position too
+        self.anchor_prefixes = {a: [b for b in ordered_anchors if a.startswith(b)] for a in ordered_anchors}
+        # anchors are in lower case (see fold_case), so the text is matched ignoring case
+        alternatives = ["(?P<anchor>{})".format("|".join(regex.escape(a) for a in ordered_anchors))]
+        alternatives += ["(?P<{}>{})".format(g, p.source) for g, p in self.regex_patterns.items()]
+        # a lookahead matches without consuming text, so every position is tried
+        self.compiled = regex.compile("(?=(?:{}))".format("|".join(alternatives)), flags=regex.IGNORECASE)
+
+    def scan(self, text, spans=None):
+        """
+        :param text: Text to scan (normally with line breaks removed; see utils.text.NormalisedText)
+        :param spans: Non-overlapping (start, end) spans of text to scan (e.g. the first and last pages); all of text
+            if None
+        :return: List of PatternHit instances, in order of position in text
+        """
+        hits = []
+        verified_windows = set()
+        folded_text = None
+        for m, span_start, span_end in self.iter_candidates(text, spans):
+            if m.lastgroup == 'anchor':
+                for anchor in self.anchor_prefixes[fold_case(m.group('anchor'))]:
+                    for p, offset in self.anchors[anchor]:
+                        matcher = self.matchers[p.name]
+                        window_start, window_end = matcher.window(m.start(), offset, span_start, span_end)
+                        if (p.name, window_start) in verified_windows:
+                            continue
+                        verified_windows.add((p.name, window_start))
+                        if not p.max_errors:
+                            v = self.verifiers[p.name].search(text, window_start, window_end)
+                            if v:
+                                hits.append(PatternHit(p, v.start(), v.end(), v.group(), 0))
+                            continue
+                        if folded_text is None:
+                            folded_text = fold_case(text)
+                        v = matcher.verify(folded_text, window_start, window_end)
+                        if v:
+                            hits.append(PatternHit(p, v[0], v[1], text[v[0]:v[1]], v[2]))
+            else:
+                p = self.regex_patterns[m.lastgroup]
+                hits.append(PatternHit(p, m.start(m.lastgroup), m.end(m.lastgroup), m.group(m.lastgroup), 0))
+        hits = self.remove_overlapping_hits(hits)
+        logger.debug("Scanner found {} hits".format(len(hits)))
+        return hits
+
+    def iter_candidates(self, text, spans):
+        """
+        :return: Generator of (match, start of span, end of span) tuples, so that hits are kept within their span
+        """
+        if spans is None:
+            spans = [(0, len(text))]
+        for start, end in spans:
+            for m in self.compiled.finditer(text, start, end):
+                yield m, start, end
+
+    @staticmethod
+    def remove_overlapping_hits(hits):
+        """
+        :param hits: List of PatternHit instances
+        :return: hits, without those overlapping a longer hit of the same category
+        """
+        kept = []
+        # hits are swept in order of start, so a hit overlaps a kept hit of its category iff it starts before the
+        # furthest end of those
+        furthest_ends = {}
+        for h in sorted(hits, key=lambda x: (x.start, -(x.end - x.start))):
+            category = h.scan_pattern.category
+            if h.start < furthest_ends.get(category, -1):
+                continue
+            kept.append(h)
+            furthest_ends[category] = max(h.end, furthest_ends.get(category, -1))
+        return kept
+
+
+def default_scan_patterns():
+    """
+    :return: ScanPattern instances for all pattern sets in utils.patterns
+    """
+    scan_patterns = [ScanPattern('doi', 'doi', DOI_PATTERN, literal=False)]
+    priority = 0
+    for licence in ALL_CC_LICENCES:
+        for key, error_ratio in CC_LICENCE_KEYS:
+            scan_patterns.append(ScanPattern("{} ({})".format(licence['short name'], key), 'cc_licence',
+                                             licence[key], error_ratio=error_ratio, priority=priority,
+                                             licence=licence['short name']))
+            priority += 1
+    # kept apart from 'cc_licence', whose hits are used in decisions
+    for i, p in enumerate(ADDITIONAL_CC_PATTERNS):
+        scan_patterns.append(ScanPattern("additional cc pattern {}".format(i), 'additional_cc_licence',
+                                         p['pattern'], error_ratio=p.get('error ratio', 0), priority=i))
+    for i, p in enumerate(VERSION_PATTERNS):
+        scan_patterns.append(ScanPattern("version pattern {}".format(i), 'version', p.pattern,
+                                         error_ratio=p.error_ratio, indicative_of=p.indicative_of,
+                                         not_found_on=p.not_found_on))
+    for i, p in enumerate(RIGHTS_RESERVED_PATTERNS):
+        scan_patterns.append(ScanPattern("rights reserved pattern {}".format(i), 'rights_reserved', p['pattern'],
+                                         error_ratio=p.get('error ratio', 0)))
+    return scan_patterns
+
+
+_default_scanner = None
+_default_scanner_lock = threading.Lock()
+
+
+def get_default_scanner():
+    """
+    :return: PatternScanner for all pattern sets in utils.patterns (compiled once per process)
+    """
+    global _default_scanner
+    with _default_scanner_lock:
+        if _default_scanner is None:
+            _default_scanner = PatternScanner(default_scan_patterns())
+        return _default_scanner
@@ -0,0 +1,382 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from utils.batch import SUPPORTED_EXTENSIONS, error_record, init_worker, make_job, run_job
+from utils.common import get_logger
+
+logger = get_logger()
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = int(os.environ.get("ARTEMIS_SERVICE_PORT", 8425))
+SERVICE_QUEUE_SIZE = 16  # jobs waiting for a free worker before new ones are refused
+SERVICE_MAX_UPLOAD_SIZE = 200 * 1024 * 1024
+SERVICE_KEEP_FINISHED_JOBS = 1000  # finished jobs whose results can still be polled
+SERVICE_SYNC_TIMEOUT = 600  # seconds a synchronous request waits before getting the job id to poll instead
+CONTENT_TYPE_EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
+}
+
+
+def init_service_worker(cermine_workers=None):
+    """
+    Prepares a worker process: besides starting CERMINE, Artemis and its dependencies are imported straight away,
+    so that the first job sent to each worker does not pay for it
+    """
+    init_worker(cermine_workers)
+    import artemis  # noqa: F401
+
+
+class ServiceFull(Exception):
+    pass
+
+
+class ServiceUnavailable(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job, upload_folder=None):
+        """
+        :param job: Job dictionary (see utils.batch.make_job)
+        :param upload_folder: Temporary folder holding the uploaded file, deleted once the job is finished
+        """
+        self.id = uuid.uuid4().hex
+        self.job = job
+        self.upload_folder = upload_folder
+        self.submitted = time.time()
+        self.finished = None
+        self.future = None
+        self.executor = None  # executor running job
+
+    @property
+    def status(self):
+        if self.future.done():
+            return 'done'
+        if self.future.running():
+            return 'running'
+        return 'queued'
+
+    def result(self, timeout=None):
+        """
+        :return: Dictionary of result (json_response of VersionDetector, or error record)
+        :raise concurrent.futures.TimeoutError: If job is not finished within timeout seconds
+        """
+        try:
+            line = self.future.result(timeout)
+        except TimeoutError:
+            raise
+        except Exception as e:  # the worker process died or the job could not be pickled
+            line = error_record(self.job, str(e), type(e).__name__)
+        return json.loads(line)
+
+    def describe(self):
+        """
+        :return: Dictionary describing job, including its result if it is finished
+        """
+        d = {
+            'job_id': self.id,
+            'status': self.status,
+            'input_file': os.path.basename(self.job['path']),
+        }
+        if d['status'] == 'done':
+            d['result'] = self.result()
+            if 'error' in d['result']:
+                d['status'] = 'failed'
+        return d
+
+
+class ArtemisService:
+    """
+    Keeps a pool of warm worker processes checking files submitted by clients of ArtemisHTTPServer. At most
+    workers + queue_size jobs are accepted at a time; further submissions raise ServiceFull until some finish
+    """
+    def __init__(self, workers=None, queue_size=SERVICE_QUEUE_SIZE, options=None, cermine_workers=None,
+                 keep_finished_jobs=SERVICE_KEEP_FINISHED_JOBS, executor=None):
+        """
+        :param workers: Number of worker processes (number of CPUs if None)
+        :param queue_size: Number of jobs allowed to wait for a free worker
+        :param options: Dictionary of VersionDetector options shared by all jobs (see utils.batch.run_job)
+        :param cermine_workers: Number of CERMINE workers kept by each worker process
+        :param keep_finished_jobs: Number of finished jobs kept for polling (oldest are forgotten first)
+        :param executor: concurrent.futures executor running the jobs, with workers workers (a ProcessPoolExecutor
+            of warm workers if None; see make_executor)
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + queue_size
+        self.options = options or {}
+        self.cermine_workers = cermine_workers
+        self.keep_finished_jobs = keep_finished_jobs
+        self.jobs = OrderedDict()
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.executor = executor or self.make_executor()
+
+    def make_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_service_worker,
+                                   initargs=(self.cermine_workers,))
+
+    def replace_executor(self, broken):
+        """
+        Replaces executor broken, once one of its worker processes died (e.g. killed for using too much memory),
+        after which it refuses all jobs. Called with self.lock held
+        """
+        if self.executor is broken:
+            logger.error("A worker process died; starting new workers")
+            broken.shutdown(wait=False)
+            self.executor = self.make_executor()
+
+    def submit(self, job, upload_folder=None):
+        """
+        :param job: Job dictionary (see utils.batch.make_job)
+        :param upload_folder: Temporary folder holding the uploaded file, deleted once the job is finished
+        :return: Job
+        :raise ServiceFull: If the queue is full
+        :raise ServiceUnavailable: If no workers could be started
+        """
+        j = Job(job, upload_folder)
+        with self.lock:
+            if self.pending >= self.capacity:
+                raise ServiceFull("{} jobs are already pending".format(self.pending))
+            try:
+                j.executor = self.executor
+                j.future = j.executor.submit(run_job, job, self.options)
+            except BrokenProcessPool:
+                self.replace_executor(j.executor)
+                try:
+                    j.executor = self.executor
+                    j.future = j.executor.submit(run_job, job, self.options)
+                except BrokenProcessPool as e:
+                    raise ServiceUnavailable("Workers are not available: {}".format(e))
+            self.pending += 1
+            self.jobs[j.id] = j
+        j.future.add_done_callback(lambda f: self.finish(j))
+        logger.info("Job {} submitted ({})".format(j.id, job['path']))
+        return j
+
+    def finish(self, job):
+        job.finished = time.time()
+        if job.upload_folder:
+            shutil.rmtree(job.upload_folder, ignore_errors=True)
+        with self.lock:
+            if not job.future.cancelled() and isinstance(job.future.exception(), BrokenProcessPool):
+                # the job fails (see Job.result), and later ones go to new workers
+                self.replace_executor(job.executor)
+            self.pending -= 1
+            finished = [i for i, j in self.jobs.items() if j.finished]
+            for i in finished[:max(len(finished) - self.keep_finished_jobs, 0)]:
+                del self.jobs[i]
+        logger.info("Job {} finished in {:.1f}s".format(job.id, job.finished - job.submitted))
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stats(self):
+        with self.lock:
+            return {'workers': self.workers, 'capacity': self.capacity, 'pending': self.pending}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class ArtemisRequestHandler(BaseHTTPRequestHandler):
+    """
+    Endpoints:
+        POST /jobs: submits a file, either uploaded as the body of the request (with a Content-Type of
+            application/pdf or the DOCX MIME type, or a filename query parameter with the right extension) or given
+            by a JSON body with the same keys as manifests of batch mode (path, title, version, authors, etc.).
+            For uploads, declared metadata are given as query parameters (title, version, authors separated by
+            semicolons, doi, etc.). With wait=1, the response is the result of the check (200); otherwise (or if
+            the check takes too long), it is the job id and status to poll (202). Responds 429 if the queue is
+            full, and 503 if no workers could be started
+        GET /jobs/<job id>: status of a job, including its result once finished
+        GET /health: number of workers and pending jobs
+    """
+    server_version = "Artemis"
+
+    def log_message(self, format, *args):
+        logger.debug("{} - {}".format(self.address_string(), format % args))
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {'error': message})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        if parts == ['health']:
+            self.send_json(HTTPStatus.OK, self.server.service.stats())
+        elif (len(parts) == 2) and (parts[0] == 'jobs'):
+            job = self.server.service.get(parts[1])
+            if job is None:
+                self.send_error_json(HTTPStatus.NOT_FOUND, "Unknown job {}".format(parts[1]))
+            else:
+                self.send_json(HTTPStatus.OK, job.describe())
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, "Unknown endpoint {}".format(url.path))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != '/jobs':
+            self.send_error_json(HTTPStatus.NOT_FOUND, "Unknown endpoint {}".format(url.path))
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > self.server.max_upload_size:
+            self.send_error_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                 "Files larger than {} bytes are not accepted".format(self.server.max_upload_size))
+            return
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        upload_folder = None
+        try:
+            if content_type == 'application/json':
+                if not self.server.allow_paths:
+                    raise ValueError("Checking files by path is disabled; upload the file instead")
+                record = json.loads(self.rfile.read(length).decode('utf-8'))
+                if not isinstance(record, dict):
+                    raise ValueError("JSON body must be an object with the keys of batch manifests")
+                job = make_job(record)
+            else:
+                upload_folder = self.save_upload(length, content_type, query)
+                query['path'] = os.path.join(upload_folder, os.listdir(upload_folder)[0])
+                job = make_job(query)
+        except ValueError as e:  # includes json.JSONDecodeError and UnicodeDecodeError
+            if upload_folder:
+                shutil.rmtree(upload_folder, ignore_errors=True)
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        try:
+            j = self.server.service.submit(job, upload_folder)
+        except ServiceFull as e:
+            if upload_folder:
+                shutil.rmtree(upload_folder, ignore_errors=True)
+            self.send_json(HTTPStatus.TOO_MANY_REQUESTS, {'error': "Service is busy: {}".format(e)},
+                           headers={'Retry-After': '5'})
+            return
+        except ServiceUnavailable as e:
+            if upload_folder:
+                shutil.rmtree(upload_folder, ignore_errors=True)
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)}, headers={'Retry-After': '5'})
+            return
+        if query.get('wait', '').lower() in ('1', 'true', 'yes'):
+            try:
+                self.send_json(HTTPStatus.OK, j.result(timeout=self.server.sync_timeout))
+                return
+            except TimeoutError:
+                pass
+        self.send_json(HTTPStatus.ACCEPTED, j.describe(), headers={'Location': '/jobs/{}'.format(j.id)})
+
+    def save_upload(self, length, content_type, query):
+        """
+        Saves the body of the request into a temporary folder
+        :return: Path to temporary folder
+        """
+        file_name = os.path.basename(query.pop('filename', '') or '')
+        ext = os.path.splitext(file_name)[-1].lower() or CONTENT_TYPE_EXTENSIONS.get(content_type)
+        if ext not in SUPPORTED_EXTENSIONS:
+            raise ValueError("Unsupported file type; give a filename ending in one of {} or a Content-Type of one "
+                             "of {}".format(", ".join(SUPPORTED_EXTENSIONS), ", ".join(CONTENT_TYPE_EXTENSIONS)))
+        if not length:
+            raise ValueError("No file uploaded")
+        upload_folder = tempfile.mkdtemp(prefix="artemis-upload-", dir=self.server.upload_dir)
+        with open(os.path.join(upload_folder, file_name or ("upload" + ext)), 'wb') as f:
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        return upload_folder
+
+
+class ArtemisHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, host=SERVICE_HOST, port=SERVICE_PORT, allow_paths=True, upload_dir=None,
+                 max_upload_size=SERVICE_MAX_UPLOAD_SIZE, sync_timeout=SERVICE_SYNC_TIMEOUT):
+        """
+        :param service: ArtemisService running the jobs
+        :param allow_paths: If False, only uploaded files are accepted (not paths to files on this machine)
+        :param upload_dir: Folder where uploaded files are saved while they are checked (system's temp folder if
+            None)
+        """
+        self.service = service
+        self.allow_paths = allow_paths
+        self.upload_dir = upload_dir
+        self.max_upload_size = max_upload_size
+        self.sync_timeout = sync_timeout
+        super().__init__((host, port), ArtemisRequestHandler)
+
+
+def main(argv=None):
+    """
+    Entry point of 'artemis.py serve'
+    """
+    parser = argparse.ArgumentParser(prog='Artemis serve',
+                                     description='Runs Artemis as a local HTTP service with warm workers')
+    parser.add_argument('--host', dest='host', type=str, default=SERVICE_HOST,
+                        help='Address to listen on (default: {})'.format(SERVICE_HOST))
+    parser.add_argument('-p', '--port', dest='port', type=int, default=SERVICE_PORT,
+                        help='Port to listen on (default: {})'.format(SERVICE_PORT))
+    parser.add_argument('-j', '--workers', dest='workers', type=int, metavar='N',
+                        help='Number of files checked in parallel (default: number of CPUs)')
+    parser.add_argument('-q', '--queue-size', dest='queue_size', type=int, metavar='N', default=SERVICE_QUEUE_SIZE,
+                        help='Number of jobs allowed to wait for a worker before requests are refused with 429 '
+                             '(default: {})'.format(SERVICE_QUEUE_SIZE))
+    parser.add_argument('--uploads-only', dest='uploads_only', action="store_true",
+                        help='Only accept uploaded files, not paths to files on this machine')
+    parser.add_argument('-w', '--working-folder', dest='working_folder', type=str, metavar='<path>',
+                        help='Path to working folder to be used (instead of temp folder)')
+    parser.add_argument('-l', '--layout', dest='layout', action="store_true",
+                        help='Also analyse page layout of PDF files (slower)')
+    parser.add_argument('-f', '--full-evidence', dest='full_evidence', action="store_true",
+                        help='Run all tests, even those that cannot change the decision (slower)')
+    parser.add_argument('--no-cache', dest='no_cache', action="store_true",
+                        help='Do not read or write cached results')
+    parser.add_argument('--cermine-workers', dest='cermine_workers', type=int, metavar='N',
+                        help='Number of warm CERMINE workers kept by each process')
+    arguments = parser.parse_args(argv)
+
+    options = {
+        'working_folder': arguments.working_folder,
+        'use_cache': not arguments.no_cache,
+        'full_evidence': arguments.full_evidence,
+        'layout': arguments.layout,
+    }
+    service = ArtemisService(workers=arguments.workers, queue_size=arguments.queue_size, options=options,
+                             cermine_workers=arguments.cermine_workers)
+    server = ArtemisHTTPServer(service, host=arguments.host, port=arguments.port,
+                               allow_paths=not arguments.uploads_only)
+    logger.info("Artemis listening on http://{}:{}/ with {} workers".format(arguments.host, arguments.port,
+                                                                            service.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
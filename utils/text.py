@@ -0,0 +1,189 @@
+from array import array
+from bisect import bisect_right
+
+import regex
+
+from utils.approximate import fold_case
+from utils.common import get_logger
+
+logger = get_logger()
+
+# typographic ligatures commonly output by PDF text extractors
+LIGATURES = {
+    'ﬀ': 'ff',
+    'ﬁ': 'fi',
+    'ﬂ': 'fl',
+    'ﬃ': 'ffi',
+    'ﬄ': 'ffl',
+    'ﬅ': 'st',
+    'ﬆ': 'st',
+}
+
+# everything that is not copied verbatim from the original text
+NORMALISATION_PATTERN = regex.compile(
+    # a word hyphenated at a line break (e.g. 'ver-\nsion'); the hyphen and the break are removed
+    "(?P<hyphenation>(?<=\\p{L})-[ \\t]*[\\n\\r\\f]\\s*(?=\\p{Ll}))"
+    "|(?P<whitespace>[\\s\\u00a0]+)"
+    "|(?P<ligature>[" + "".join(LIGATURES) + "])"
+    "|(?P<soft_hyphen>\\u00ad)"
+)
+
+
+class NormalisedText:
+    """
+    Text extracted from a document, normalised once for searching: runs of whitespace (including line breaks) are
+    collapsed into single spaces, ligatures are expanded and words hyphenated at line breaks are rejoined.
+
+    Keeps a map from every character of the normalised text to its offset in the original text, and an index of the
+    positions where pages start (form feeds in the original text, as output by pdftotext and pdfminer, or explicit
+    page texts), so that searches can be restricted to real page ranges
+    """
+    def __init__(self, original, page_starts=None, estimated_page_length=2600):
+        """
+        :param original: Original text
+        :param page_starts: Offsets in original at which pages start; if None, pages are delimited by form feeds
+        :param estimated_page_length: Number of characters assumed to make up a page if the text has no page breaks
+        """
+        self.original = original
+        self.estimated_page_length = estimated_page_length
+        self.offsets = array('l')  # offset in original of each character of self.text
+        pieces = []
+        length = 0
+        original_page_starts = sorted(set(page_starts or [])) if page_starts is not None else None
+        self.page_starts = [0]
+        position = 0
+        for m in NORMALISATION_PATTERN.finditer(original):
+            if m.start() > position:
+                pieces.append(original[position:m.start()])
+                self.offsets.extend(range(position, m.start()))
+                length += m.start() - position
+            if m.lastgroup == 'whitespace':
+                replacement = ' '
+            elif m.lastgroup == 'ligature':
+                replacement = LIGATURES[m.group()]
+            else:
+                replacement = ''
+            pieces.append(replacement)
+            self.offsets.extend([m.start()] * len(replacement))
+            length += len(replacement)
+            if (original_page_starts is None) and ('\f' in m.group()):
+                self.page_starts.append(length)
+            position = m.end()
+        pieces.append(original[position:])
+        self.offsets.extend(range(position, len(original)))
+        self.text = "".join(pieces)
+        if original_page_starts is not None:
+            self.page_starts = [self.normalised_offset(o) for o in original_page_starts if o > 0]
+            self.page_starts.insert(0, 0)
+        else:
+            # pdftotext ends the last page with a form feed; explicit pages are kept even if the last ones are blank
+            while (len(self.page_starts) > 1) and (self.page_starts[-1] >= len(self.text.rstrip())):
+                self.page_starts.pop()
+        self.has_page_breaks = len(self.page_starts) > 1
+        self._folded = None
+
+    @classmethod
+    def from_pages(cls, pages, **kwargs):
+        """
+        :param pages: List of the texts of each page
+        :return: NormalisedText of pages joined by form feeds
+        """
+        page_starts = []
+        position = 0
+        for p in pages:
+            page_starts.append(position)
+            position += len(p) + 1
+        return cls("\f".join(pages), page_starts=page_starts, **kwargs)
+
+    def __len__(self):
+        return len(self.text)
+
+    @property
+    def folded(self):
+        """
+        :return: self.text in lower case, with the same offsets (see utils.approximate.fold_case)
+        """
+        if self._folded is None:
+            self._folded = fold_case(self.text)
+        return self._folded
+
+    @property
+    def number_of_pages(self):
+        if self.has_page_breaks:
+            return len(self.page_starts)
+        return max(1, -(-len(self.text) // self.estimated_page_length))
+
+    def normalised_offset(self, original_offset):
+        """
+        :return: Offset in self.text of the first character derived from original_offset or after it
+        """
+        lo, hi = 0, len(self.offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.offsets[mid] < original_offset:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def original_span(self, start, end):
+        """
+        :param start: Start of span in self.text
+        :param end: End of span in self.text
+        :return: Corresponding (start, end) span in self.original
+        """
+        if start >= end:
+            o = self.offsets[start] if start < len(self.offsets) else len(self.original)
+            return o, o
+        return self.offsets[start], self.offsets[end - 1] + 1
+
+    def page_of(self, offset):
+        """
+        :param offset: Offset in self.text
+        :return: Number of page (starting at 1) offset is on
+        """
+        if self.has_page_breaks:
+            return bisect_right(self.page_starts, offset)
+        return offset // self.estimated_page_length + 1
+
+    def page_span(self, first, last=None):
+        """
+        :param first: Number of first page (starting at 1; negative numbers count from the end, so -1 is the last
+            page)
+        :param last: Number of last page (same conventions as first; first if None)
+        :return: (start, end) span of pages first to last in self.text
+        """
+        n = self.number_of_pages
+        if last is None:
+            last = first
+        first = min(max(first + n + 1 if first < 0 else first, 1), n)
+        last = min(max(last + n + 1 if last < 0 else last, 1), n)
+        if self.has_page_breaks:
+            start = self.page_starts[first - 1]
+            end = self.page_starts[last] if last < n else len(self.text)
+        else:
+            start = (first - 1) * self.estimated_page_length
+            end = min(last * self.estimated_page_length, len(self.text))
+        return start, max(start, end)
+
+    def spans_of_pages(self, page_ranges):
+        """
+        :param page_ranges: List of (first, last) page ranges (see page_span)
+        :return: Sorted list of the non-overlapping spans in self.text covered by page_ranges
+        """
+        spans = []
+        for start, end in sorted(self.page_span(first, last) for first, last in page_ranges):
+            if spans and (start <= spans[-1][1]):
+                spans[-1] = (spans[-1][0], max(end, spans[-1][1]))
+            else:
+                spans.append((start, end))
+        return spans
+
+
+def normalise(text):
+    """
+    Normalises a string the way NormalisedText normalises extracted text (e.g. a title to look for in it), so that
+    line breaks, runs of whitespace and ligatures in the string do not count as errors in approximate matches
+    :return: Normalised text, without leading and trailing spaces
+    """
+    return NormalisedText(text).text.strip()
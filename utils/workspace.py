@@ -0,0 +1,65 @@
+import os
+import shutil
+from tempfile import mkdtemp
+
+from utils.common import get_logger
+
+logger = get_logger()
+
+
+def link_file(source, destination):
+    """
+    Makes source available at destination without copying it, if possible: tries a hardlink first, then a symlink,
+    and only copies the file if neither is supported
+    :param source: Path to existing file
+    :param destination: Path where file should be made available
+    :return: destination
+    """
+    try:
+        os.link(source, destination)
+        return destination
+    except OSError as e:
+        logger.debug("Could not hardlink {} to {}: {}".format(source, destination, e))
+    try:
+        os.symlink(os.path.abspath(source), destination)
+        return destination
+    except OSError as e:
+        logger.debug("Could not symlink {} to {}: {}".format(source, destination, e))
+    shutil.copy2(source, destination)
+    return destination
+
+
+class JobWorkspace:
+    """
+    Folder of its own for a single job. It holds a link to the input file and everything derived from it, so that
+    tools working on whole folders (e.g. CERMINE's -path) only ever process that file.
+
+    Usage:
+        with JobWorkspace(file_path) as ws:
+            PdfParser(ws.target_file).parse()
+    """
+    def __init__(self, file_path, base_folder=None, keep=False):
+        """
+        :param file_path: Path to input file
+        :param base_folder: Folder in which the workspace will be created; system's temp folder if None
+        :param keep: If True, workspace is not deleted on exit
+        """
+        self.file_path = file_path
+        self.base_folder = base_folder
+        self.keep = keep
+        self.path = None
+        self.target_file = None
+
+    def __enter__(self):
+        if self.base_folder:
+            os.makedirs(self.base_folder, exist_ok=True)
+        self.path = mkdtemp(prefix="artemis-", dir=self.base_folder)
+        self.target_file = link_file(self.file_path, os.path.join(self.path, os.path.basename(self.file_path)))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.keep:
+            logger.info("Kept working files for {} in {}".format(self.file_path, self.path))
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+        return False